@@ -0,0 +1,182 @@
+# Microbenchmarks: lib/itertools.py against the hand-written loops the tool
+# modules would use instead. Each case runs both on the same data and
+# checks that they agree before timing them.
+#
+# In the tools VM:  node bench/tools_vm.js --grep itertools
+# Under CPython:    python3 bench/bench_itertools.py [N]   (with
+#                   src/tools_vfs/lib on PYTHONPATH, or it measures
+#                   CPython's own itertools)
+
+import sys
+import time
+import itertools
+
+try:
+    _ticks, _diff = time.ticks_us, time.ticks_diff
+except AttributeError:
+    def _ticks():
+        return time.perf_counter_ns() // 1000
+
+    def _diff(a, b):
+        return a - b
+
+
+def _tokens(n):
+    # Something shaped like a utokenize stream: (type, string) pairs,
+    # in runs of the same type
+    kinds = (1, 1, 54, 1, 54, 4, 4, 5, 1, 54, 2, 54, 4)
+    return [(kinds[i % len(kinds)], "t%d" % (i % 97)) for i in range(n)]
+
+
+def _segments(n):
+    # mpy-tool style (kind, size) segments, grouped by kind
+    return [(i // 7 % 4, i % 13) for i in range(n)]
+
+
+def _islice_loop(seq, start, stop):
+    res = []
+    i = 0
+    for x in seq:
+        if i >= stop:
+            break
+        if i >= start:
+            res.append(x)
+        i += 1
+    return res
+
+
+def _chain_loop(seqs):
+    res = []
+    for s in seqs:
+        for x in s:
+            res.append(x)
+    return res
+
+
+def _groupby_loop(seq):
+    res = []
+    prev = None
+    group = None
+    for kind, size in seq:
+        if group is None or kind != prev:
+            group = []
+            res.append((kind, group))
+            prev = kind
+        group.append(size)
+    return res
+
+
+def _accumulate_loop(seq):
+    res = []
+    acc = 0
+    for x in seq:
+        acc += x
+        res.append(acc)
+    return res
+
+
+def _pairwise_loop(seq):
+    res = []
+    prev = None
+    first = True
+    for x in seq:
+        if not first:
+            res.append((prev, x))
+        prev = x
+        first = False
+    return res
+
+
+def _takewhile_loop(seq, end):
+    res = []
+    for x in seq:
+        if x is end:
+            break
+        res.append(x)
+    return res
+
+
+def _zip_longest_loop(a, b):
+    res = []
+    for i in range(max(len(a), len(b))):
+        res.append((a[i] if i < len(a) else None, b[i] if i < len(b) else None))
+    return res
+
+
+def _tee_loop(it):
+    buf = []
+    for x in it:
+        buf.append(x)
+    return [[x for x in buf], [x for x in buf]]
+
+
+def _batched_loop(seq, n):
+    return [tuple(seq[i:i + n]) for i in range(0, len(seq), n)]
+
+
+def cases(n):
+    it = itertools
+    toks = _tokens(n)
+    segs = _segments(n)
+    sizes = [s for _, s in segs]
+    lines = [toks[i:i + 10] for i in range(0, n, 10)]
+    half = n // 2
+    end = toks[3 * n // 4]
+    return [
+        ("islice", lambda: list(it.islice(toks, n // 4, 3 * n // 4)),
+            lambda: _islice_loop(toks, n // 4, 3 * n // 4)),
+        ("chain.from_iterable", lambda: list(it.chain.from_iterable(lines)),
+            lambda: _chain_loop(lines)),
+        ("groupby", lambda: [(k, [s for _, s in g]) for k, g in it.groupby(segs, lambda s: s[0])],
+            lambda: _groupby_loop(segs)),
+        ("accumulate", lambda: list(it.accumulate(sizes)),
+            lambda: _accumulate_loop(sizes)),
+        ("pairwise", lambda: list(it.pairwise(toks)),
+            lambda: _pairwise_loop(toks)),
+        ("takewhile", lambda: list(it.takewhile(lambda t: t is not end, toks)),
+            lambda: _takewhile_loop(toks, end)),
+        ("zip_longest", lambda: list(it.zip_longest(sizes, sizes[:half])),
+            lambda: _zip_longest_loop(sizes, sizes[:half])),
+        ("batched", lambda: list(it.batched(sizes, 16)),
+            lambda: _batched_loop(sizes, 16)),
+        ("tee", lambda: [list(t) for t in it.tee(iter(sizes), 2)],
+            lambda: _tee_loop(iter(sizes))),
+        ("product", lambda: list(it.product(range(16), range(n // 16))),
+            lambda: [(a, b) for a in range(16) for b in range(n // 16)]),
+    ]
+
+
+def _time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t = _ticks()
+        fn()
+        d = _diff(_ticks(), t)
+        if best is None or d < best:
+            best = d
+    return best
+
+
+# [{name, itertools_us, loop_us}], best of `repeat` runs on n items
+def run(n=2000, repeat=5):
+    res = []
+    for name, fast, loop in cases(n):
+        if fast() != loop():
+            raise AssertionError(name + ": results differ")
+        res.append({
+            "name": name,
+            "itertools_us": _time(fast, repeat),
+            "loop_us": _time(loop, repeat),
+        })
+    return res
+
+
+def main(n=2000, repeat=5):
+    print("%-20s %12s %12s %7s" % ("n=%d" % n, "itertools us", "loop us", "ratio"))
+    for r in run(n, repeat):
+        ratio = r["itertools_us"] / max(r["loop_us"], 1)
+        print("%-20s %12d %12d %7.2f" % (r["name"], r["itertools_us"], r["loop_us"], ratio))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,41 @@
+"""
+A typical small board script: read a sensor, smooth it, blink an LED.
+Part of the fixed benchmark corpus - do not edit, results are compared
+against earlier runs.
+"""
+
+import time
+from machine import Pin, ADC
+from micropython import const
+
+_WINDOW = const(8)
+_THRESHOLD = const(2048)
+
+led = Pin(2, Pin.OUT)
+adc = ADC(Pin(34))
+
+
+class Smoother:
+    def __init__(self, size=_WINDOW):
+        self.buf = [0] * size
+        self.pos = 0
+        self.total = 0
+
+    def add(self, value):
+        self.total += value - self.buf[self.pos]
+        self.buf[self.pos] = value
+        self.pos = (self.pos + 1) % len(self.buf)
+        return self.total // len(self.buf)
+
+
+def main(period_ms=100):
+    s = Smoother()
+    while True:
+        level = s.add(adc.read())
+        led.value(level > _THRESHOLD)
+        print("level:", level)
+        time.sleep_ms(period_ms)
+
+
+if __name__ == "__main__":
+    main()
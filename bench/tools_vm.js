@@ -0,0 +1,260 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * Benchmarks the Python tools that run in the tools VM (getToolsVM()): ast.parse,
+ * utokenize, minifyPython() and disassembleMPY(), over a fixed corpus of small,
+ * medium and huge inputs, and prints the results as JSON for regression tracking.
+ *
+ * Like the test suite, it drives the code ViperIDE ships: src/python_utils.js is
+ * imported as is, and loads the same micropython.wasm and tools_vfs.tar.gz from
+ * a build directory (`python3 build.py` makes one), which the browser would get
+ * from VIPER_IDE_BASE_URL.
+ *
+ *   node bench/tools_vm.js                     # JSON on stdout, progress on stderr
+ *   node bench/tools_vm.js -n 10 -o out.json   # 10 timed runs per case
+ *   node bench/tools_vm.js --grep minify       # only the matching cases
+ *   node bench/tools_vm.js --build dist        # another build directory
+ */
+
+import { parseArgs } from 'node:util'
+import { readFile, writeFile } from 'node:fs/promises'
+import { createHash } from 'node:crypto'
+import { fileURLToPath, pathToFileURL } from 'node:url'
+import path from 'node:path'
+
+const ROOT = path.resolve(path.dirname(fileURLToPath(import.meta.url)), '..')
+
+const { values: opts } = parseArgs({
+    options: {
+        iterations: { type: 'string', short: 'n', default: '5' },
+        out:        { type: 'string', short: 'o' },
+        grep:       { type: 'string', short: 'g' },
+        build:      { type: 'string', default: path.join(ROOT, 'build') },
+    },
+})
+
+/*
+ * The corpus
+ *
+ * Fixed on purpose: numbers are only comparable between runs over the same inputs.
+ * `huge` is pystone repeated, which keeps it in the repository for free. Each
+ * Python input is also compiled to .mpy (default ABI) for the disassembler.
+ */
+const CORPUS = [
+    { name: 'small',  file: 'bench/corpus/small.py' },
+    { name: 'medium', file: 'src/vm_vfs/lib/pystone.py' },
+    { name: 'huge',   file: 'src/vm_vfs/lib/pystone.py', repeat: 12 },
+]
+
+/*
+ * The tools
+ *
+ * `setup` runs once per input before timing, `run` is what is timed. Tools that
+ * python_utils.js exposes are called through it, so the cost of crossing into the
+ * VM and back is part of the number, as it is in the IDE.
+ */
+const TOOLS = [
+    {
+        name: 'ast.parse',
+        kind: 'py',
+        setup: (vm, input) => loadSource(vm, input),
+        run: (vm) => vm.runPython(`
+import ast
+ast.parse(_bench_src)
+`),
+    }, {
+        name: 'utokenize',
+        kind: 'py',
+        setup: (vm, input) => loadSource(vm, input),
+        run: (vm) => vm.runPython(`
+import io, utokenize
+for _ in utokenize.generate_tokens(io.StringIO(_bench_src).readline):
+    pass
+`),
+    }, {
+        name: 'minifyPython',
+        kind: 'py',
+        run: (_vm, input) => pyUtils.minifyPython(input.data),
+    }, {
+        name: 'disassembleMPY',
+        kind: 'mpy',
+        run: (_vm, input) => pyUtils.disassembleMPY(input.data),
+    },
+]
+
+function loadSource(vm, input) {
+    vm.FS.writeFile('/tmp/bench.py', input.data)
+    vm.runPython(`
+with open('/tmp/bench.py') as f:
+    _bench_src = f.read()
+`)
+}
+
+/*
+ * micropython.wasm, mpy-cross and tools_vfs.tar.gz are fetched from
+ * VIPER_IDE_BASE_URL, which here is a file: URL - Node's fetch() does not do
+ * those, so they are read from disk.
+ */
+const nodeFetch = globalThis.fetch
+globalThis.fetch = async (url, init) => {
+    const href = url instanceof Request ? url.url : String(url)
+    if (!href.startsWith('file:')) { return nodeFetch(url, init) }
+    try {
+        return new Response(await readFile(new URL(href)))
+    } catch (err) {
+        return new Response(null, { status: 404, statusText: err.message })
+    }
+}
+globalThis.VIPER_IDE_BASE_URL = pathToFileURL(path.resolve(opts.build)).href
+
+const pyUtils = await import('../src/python_utils.js')
+
+function log(msg) {
+    process.stderr.write(msg + '\n')
+}
+
+/*
+ * Heap use
+ *
+ * The WASM port has no peak counter, so one extra run of each case is done with the
+ * GC held off: what it leaves allocated is everything the tool allocated, an upper
+ * bound on its peak heap use. That is null if the run does not fit in the heap
+ * without collecting.
+ */
+async function measureHeap(vm, tool, input) {
+    vm.runPython(`
+import gc
+gc.collect()
+gc.disable()
+_bench_heap = gc.mem_alloc()
+`)
+    let ok = true
+    try {
+        await tool.run(vm, input)
+    } catch {
+        ok = false
+    }
+    vm.runPython(`
+_bench_heap = gc.mem_alloc() - _bench_heap
+gc.enable()
+gc.collect()
+with open('/tmp/bench.heap', 'w') as f:
+    f.write(str(_bench_heap))
+`)
+    return ok ? parseInt(vm.FS.readFile('/tmp/bench.heap', { encoding: 'utf8' }), 10) : null
+}
+
+async function timeRun(vm, tool, input) {
+    const t = performance.now()
+    await tool.run(vm, input)
+    return performance.now() - t
+}
+
+function round(ms) {
+    return Math.round(ms * 1000) / 1000
+}
+
+function stats(times) {
+    const sorted = [...times].sort((a, b) => a - b)
+    const mid = sorted.length >> 1
+    const median = sorted.length % 2 ? sorted[mid] : (sorted[mid - 1] + sorted[mid]) / 2
+    return {
+        min_ms:    round(sorted[0]),
+        median_ms: round(median),
+        mean_ms:   round(times.reduce((a, b) => a + b, 0) / times.length),
+        max_ms:    round(sorted[sorted.length - 1]),
+    }
+}
+
+async function loadCorpus() {
+    const inputs = []
+    for (const entry of CORPUS) {
+        let text = await readFile(path.join(ROOT, entry.file), 'utf8')
+        if (entry.repeat) {
+            text = Array(entry.repeat).fill(text).join('\n')
+        }
+        const data = new TextEncoder().encode(text)
+        inputs.push({ name: entry.name, kind: 'py', data })
+        const mpy = await pyUtils.compilePython(`${entry.name}.py`, text, null)
+        inputs.push({ name: entry.name, kind: 'mpy', data: mpy })
+    }
+    return inputs
+}
+
+async function main() {
+    const iterations = parseInt(opts.iterations, 10)
+    if (!(iterations > 0)) {
+        throw new Error(`Invalid --iterations: ${opts.iterations}`)
+    }
+    const grep = opts.grep ? new RegExp(opts.grep) : null
+
+    const vfs = await readFile(path.join(opts.build, 'assets', 'tools_vfs.tar.gz'))
+
+    const t = performance.now()
+    const vm = await pyUtils.getToolsVM()
+    const startup_ms = round(performance.now() - t)
+    log(`tools VM ready in ${startup_ms} ms`)
+
+    const inputs = await loadCorpus()
+    const results = []
+    for (const tool of TOOLS) {
+        for (const input of inputs) {
+            const name = `${tool.name} ${input.name}.${input.kind}`
+            if (input.kind !== tool.kind || (grep && !grep.test(name))) { continue }
+            if (tool.setup) { tool.setup(vm, input) }
+
+            // The first run pays for imports, so it is reported on its own
+            const first_ms = round(await timeRun(vm, tool, input))
+            const times = []
+            for (let i = 0; i < iterations; i++) {
+                times.push(await timeRun(vm, tool, input))
+            }
+            const heap_peak = await measureHeap(vm, tool, input)
+            const res = {
+                tool: tool.name,
+                input: `${input.name}.${input.kind}`,
+                bytes: input.data.length,
+                first_ms,
+                ...stats(times),
+                heap_peak,
+            }
+            results.push(res)
+            log(`${name.padEnd(32)} ${String(res.median_ms).padStart(10)} ms  ${heap_peak ?? '-'} B`)
+        }
+    }
+
+    // The itertools microbenchmarks (bench/bench_itertools.py) run in the same VM,
+    // which gets them from here: they are not part of what the IDE ships
+    let itertools = null
+    if (!grep || grep.test('itertools')) {
+        vm.FS.writeFile('/lib/bench_itertools.py', await readFile(path.join(ROOT, 'bench', 'bench_itertools.py')))
+        vm.runPython(`
+import json, bench_itertools
+with open('/tmp/bench.json', 'w') as f:
+    json.dump(bench_itertools.run(), f)
+`)
+        itertools = JSON.parse(vm.FS.readFile('/tmp/bench.json', { encoding: 'utf8' }))
+    }
+
+    const report = {
+        meta: {
+            date: new Date().toISOString(),
+            node: process.version,
+            tools_vfs_sha256: createHash('sha256').update(vfs).digest('hex'),
+            iterations,
+            startup_ms,
+        },
+        results,
+        itertools,
+    }
+    const json = JSON.stringify(report, null, 2) + '\n'
+    if (opts.out) {
+        await writeFile(opts.out, json)
+        log(`Results written to ${opts.out}`)
+    } else {
+        process.stdout.write(json)
+    }
+}
+
+await main()
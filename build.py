@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import os, sys
+import os, sys, shutil
 import json, glob, gzip, tarfile, subprocess
 from os import remove, path, makedirs
 from shutil import copyfile as cp, copytree, rmtree
@@ -60,6 +60,47 @@ def gen_tar(src, dst):
                     item_path = os.path.join(src, item)
                     tar.add(item_path, arcname=item, filter=reset_tarinfo)
 
+# .mpy ABI of the MicroPython WASM port the tools VM runs (1.27 reads v6.3).
+# Keep in step with @micropython/micropython-webassembly-pyscript.
+TOOLS_MPY_ABI = "6.3"
+
+# Compiles the .py files given on the command line with mpy-cross-wasm, writing
+# each .mpy next to its source; files it rejects are reported and left alone
+MPY_COMPILE_JS = """
+import { compile } from '@vshymanskyy/mpy-cross-wasm'
+import { readFileSync, writeFileSync } from 'node:fs'
+const [abi, root, ...files] = process.argv.slice(1)
+for (const fn of files) {
+    const res = await compile(fn, readFileSync(`${root}/${fn}`, 'utf8'), { abi })
+    if (res.status === 0) {
+        writeFileSync(`${root}/${fn.replace(/\\.py$/, '.mpy')}`, res.mpy)
+    } else {
+        console.error(`${fn}: not precompiled\\n` + res.err.join('\\n'))
+    }
+}
+"""
+
+def precompile_vfs(src, dst):
+    # A copy of src with its modules compiled to .mpy, so that the tools VM
+    # does not compile them from source every time it starts. MicroPython
+    # imports a .py in preference to an .mpy, so the sources are dropped from
+    # the copy - but only those that compiled; anything else still ships as
+    # .py, and without node_modules (or Node) everything does.
+    rmtree(dst, ignore_errors=True)
+    copytree(src, dst, ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+    files = sorted(glob.glob("**/*.py", root_dir=dst, recursive=True))
+    if not files:
+        return dst
+    try:
+        subprocess.run(["node", "--input-type=module", "-e", MPY_COMPILE_JS,
+                        TOOLS_MPY_ABI, dst, *files], check=True)
+    except (OSError, subprocess.CalledProcessError):
+        print(f"{src}: mpy-cross did not run, shipping .py sources")
+    for fn in files:
+        if path.exists(path.join(dst, fn[:-3] + ".mpy")):
+            remove(path.join(dst, fn))
+    return dst
+
 def vendor_pypi_package(spec, dest):
     # --upgrade is required: without it pip silently skips an existing target
     # directory, so a stale vendored copy would never be replaced.
@@ -105,8 +146,18 @@ if __name__ == "__main__":
     gen_translations("./src/lang/", "build/translations.json")
     gen_manifest("./src/manifest.json", "build/manifest.json")
 
-    vendor_pypi_package("python-minifier==3.2.0", "src/tools_vfs/lib")
-    gen_tar("src/tools_vfs", "build/assets/tools_vfs.tar.gz")
+    # python-minifier is only a fallback for code the tools VM's own minifier
+    # cannot handle, so it gets an archive of its own, fetched when needed.
+    # Older builds vendored it into src/tools_vfs, where it must not linger.
+    rmtree("src/tools_vfs/lib/python_minifier", ignore_errors=True)
+    vendor_pypi_package("python-minifier==3.2.0", "build/vfs/tools_minifier/lib")
+    # The tools are precompiled to .mpy, which needs mpy-cross from node_modules
+    if not path.isdir("node_modules"):
+        run("npm install")
+    gen_tar(precompile_vfs("src/tools_vfs", "build/vfs/tools_vfs"), "build/assets/tools_vfs.tar.gz")
+    gen_tar(precompile_vfs("build/vfs/tools_minifier", "build/vfs/tools_minifier.mpy"),
+            "build/assets/tools_minifier.tar.gz")
+    rmtree("build/vfs")
     gen_tar("src/vm_vfs", "build/assets/vm_vfs.tar.gz")
 
     # Prepare
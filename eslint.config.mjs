@@ -6,6 +6,7 @@ export default [
   { languageOptions: { globals: globals.browser }},
   { files: ["*.mjs"], languageOptions: { globals: globals.node }},
   { files: ["test/**/*.js"], languageOptions: { globals: { ...globals.node, ...globals.mocha }}},
+  { files: ["bench/**/*.js"], languageOptions: { globals: globals.node }},
   pluginJs.configs.recommended,
   {
     rules: {
@@ -45,9 +45,10 @@ const stripMicroPythonNodeCli = () => ({
   },
   // Emscripten reads import.meta.url to locate micropython.wasm next to itself.
   // Bundled, there is no "itself" - and every call site passes an explicit URL -
-  // so the page URL is a harmless stand-in.
+  // so the page URL is a harmless stand-in. Not document.baseURI: the tools
+  // worker bundles this too, and a worker has no document.
   resolveImportMeta(property) {
-    return property === 'url' ? 'document.baseURI' : null
+    return property === 'url' ? 'self.location.href' : null
   },
 })
 
@@ -110,4 +111,7 @@ export default args => [{
 },{
   input: './src/app_worker.js',
   ...common(args, 'app_worker')
+},{
+  input: './src/tools_worker.js',
+  ...common(args, 'tools_worker')
 }]
@@ -21,7 +21,7 @@ import { WebLinksAddon } from '@xterm/addon-web-links'
 import { FitAddon } from '@xterm/addon-fit'
 
 import { isStandalonePWA } from 'is-standalone-pwa';
-import { addUpdateHandler, createNewEditor, getEditorFromElement } from './editor.js'
+import { addUpdateHandler, createNewEditor, getEditorFromElement, forgetValidation, revealLine } from './editor.js'
 import { displayOpenFile, createTab, getTabFileName, getTabEditorElement } from './editor_tabs.js'
 import { serial as webSerialPolyfill } from 'web-serial-polyfill'
 import { WebSerial, WebBluetooth, WebSocketREPL, WebRTCTransport } from './transports/index.js'
@@ -30,9 +30,12 @@ import { ReplMonitor } from './repl_monitor.js'
 import { getPkgIndexes, rawInstallPkg, fetchPkgReadme } from './package_mgr.js'
 import { ConnectionUID } from './connection_uid.js'
 import translations from '../build/translations.json'
-import { parseStackTrace, validatePython, disassembleMPY, minifyPython, prettifyPython, compilePython } from './python_utils.js'
+import { parseStackTrace, validatePython, disassembleMPY, minifyPython, minifyPythonFiles, prettifyPython, compilePython,
+         importedModules, projectConsts, foldPythonFiles, indexPythonProject, findDefinition, findReferences,
+         exportSymbolIndex, importSymbolIndex, warmUpTools } from './python_utils.js'
 import { createBrowserVM, SYSTEM_DIRS } from './emulator.js'
 import { getSetting, onSettingChange, updateSetting } from './settings.js'
+import { setToolsProfiling, toolsProfileMarkdown, exportToolsProfile as toolsProfileJSON } from './tools_profile.js'
 import { renderMarkdown } from './markdown.js'
 
 import { UAParser } from 'ua-parser-js'
@@ -45,6 +48,7 @@ import { getUserUID, getScreenInfo, IdleMonitor, getCssPropertyValue, QSA, QS, Q
 
 import { TreeView, parentDir, TREE_DRAG_TYPE } from './tree_view.js'
 import * as fsCache from './fs_cache.js'
+import { KeyValueStore, idbAvailable } from './idb_store.js'
 import { createZipSync } from './zip.js'
 
 import { initControlClient } from './control_client.js'
@@ -775,6 +779,29 @@ async function uploadDroppedFiles(dataTransfer, dstDir) {
     const clashes = files.filter(item => fsCache.has(item.path))
     if (clashes.length && !confirm(`${clashes.length} of ${files.length} file(s) already exist in ${dstDir}.\nOverwrite?`)) return
 
+    // Minified and/or folded all at once, before the device is busy
+    const minified = new Map()
+    const minify = getSetting('minify-upload')
+    const fold = getSetting('fold-consts')
+    const sources = (minify || fold) ? files.filter(item => item.path.endsWith('.py')) : []
+    if (sources.length) {
+        const what = minify ? 'minifying' : 'folding constants of'
+        try {
+            const input = await Promise.all(sources.map(async item => [item.path, await item.file.arrayBuffer()]))
+            const res = minify ? await minifyPythonFiles(input, { fold })
+                               : await foldPythonFiles(input)
+            for (const { path, content, error } of res) {
+                if (content !== null) {
+                    minified.set(path, content)
+                } else {
+                    console.warn(`Not ${what} ${path}: ${error}`)
+                }
+            }
+        } catch (err) {
+            console.warn(`Not ${what} uploads: ${err}`)
+        }
+    }
+
     toastr.info(`Uploading ${files.length} file(s)...`)
     let uploaded = 0
     const raw = await MpRawMode.begin(port)
@@ -786,7 +813,10 @@ async function uploadDroppedFiles(dataTransfer, dstDir) {
             }
             const [dirname, _] = splitPath(item.path)
             if (dirname) { await raw.makePath(dirname) }
-            await raw.writeFile(item.path, new Uint8Array(await item.file.arrayBuffer()))
+            const content = minified.has(item.path)
+                ? new TextEncoder().encode(minified.get(item.path))
+                : new Uint8Array(await item.file.arrayBuffer())
+            await raw.writeFile(item.path, content)
             /* Deliberately not cached: telling the cache the path changed is
                what makes the refresh below notice, so a file that is open in an
                editor gets reloaded (or flagged) instead of quietly diverging. */
@@ -1351,11 +1381,21 @@ export async function saveAndCompile() {
 
     await saveCurrentFile()
 
-    const mpy = await compilePython(savedFn, savedText, devInfo)
+    const optimize = getSetting('optimize-bytecode')
+    const fold = getSetting('fold-consts')
     const mpyFn = savedFn.replace(/\.py$/, '.mpy')
 
     const raw = await MpRawMode.begin(port)
     try {
+        let consts = null
+        if (optimize || fold) {
+            try {
+                consts = await _raw_importedConsts(raw, savedFn, savedText)
+            } catch (_err) {
+                // Optimize the file on its own
+            }
+        }
+        const mpy = await compilePython(savedFn, savedText, devInfo, { optimize, fold, consts })
         await fsCache.writeFile(raw, mpyFn, mpy)
         await _raw_updateFileTree(raw)
     } finally {
@@ -1366,6 +1406,111 @@ export async function saveAndCompile() {
     toastr.success(`Compiled to ${mpyFn}`)
 }
 
+/* The const() values of the device modules `fn` imports, to be folded into it
+   when compiling. Modules are looked up the way sys.path would find them, among
+   the files the tree already knows about. */
+async function _raw_importedConsts(raw, fn, text) {
+    const files = []
+    for (const m of await importedModules(text, { path: fn })) {
+        const rel = m.replace(/\./g, '/')
+        const found = ['', '/lib', '/flash', '/flash/lib']
+            .flatMap(root => [`${root}/${rel}.py`, `${root}/${rel}/__init__.py`])
+            .find(path => path !== fn && fsCache.has(path))
+        if (found) {
+            files.push([found, await fsCache.readFile(raw, found)])
+        }
+    }
+    return files.length ? await projectConsts(files) : null
+}
+
+const symbolStore = idbAvailable() ? new KeyValueStore('viper-symbols') : null
+let symbolIndexLoaded = false
+
+/*
+ * Brings the symbol index up to date with `files`. The index is saved after a
+ * change, and the saved one is loaded first thing, so a new session only parses
+ * the files that changed since. Resolves to what indexPythonProject() does.
+ */
+async function syncSymbolIndex(files) {
+    if (symbolStore && !symbolIndexLoaded) {
+        symbolIndexLoaded = true
+        try {
+            const saved = await symbolStore.get('index')
+            if (saved) {
+                await importSymbolIndex(saved)
+            }
+        } catch (err) {
+            console.warn(`Cannot load the symbol index: ${err}`)
+        }
+    }
+    const stats = await indexPythonProject(files)
+    if (symbolStore && (stats.parsed || stats.removed)) {
+        // Written in the background
+        exportSymbolIndex().then((data) => symbolStore.put('index', data)).catch((err) => {
+            console.warn(`Cannot save the symbol index: ${err}`)
+        })
+    }
+    return stats
+}
+
+/*
+ * Go to definition and find references, from the editor (F12 / Shift-F12), over
+ * every .py file on the device. They go through the symbol index in the tools VM,
+ * which only parses what changed since the last lookup, or since the index was
+ * last saved; the open file is indexed as it is in the editor, saved or not.
+ * Finding references again moves on to the next one.
+ */
+async function lookupSymbol(action, name) {
+    if (!portReady()) return;
+    const fromFn = editorFn
+    const text = editor.state.doc.toString()
+    const cursorLine = editor.state.doc.lineAt(editor.state.selection.main.head).number
+
+    let found = null
+    const raw = await MpRawMode.begin(port)
+    try {
+        const files = []
+        for (const path of fsCache.filesUnder('/')) {
+            if (!path.endsWith('.py') || fsCache.get(path).virtual) continue
+            files.push([path, (path === fromFn) ? text : await fsCache.readFile(raw, path)])
+        }
+        const { errors } = await syncSymbolIndex(files)
+        for (const [path, { message, line }] of Object.entries(errors)) {
+            console.warn(`Not indexed: ${path}:${line}: ${message}`)
+        }
+
+        if (action === 'definition') {
+            [found] = await findDefinition(name, fromFn)
+            if (!found) {
+                toastr.info(`No definition of ${name} found`)
+                return
+            }
+        } else {
+            const refs = await findReferences(name)
+            // Ordered by file and line, so the next one is the first past the cursor
+            const next = refs.findIndex(r => r.file > fromFn || (r.file === fromFn && r.line > cursorLine))
+            found = refs[Math.max(next, 0)]
+            if (!found) {
+                toastr.info(`No references to ${name} found`)
+                return
+            }
+            toastr.info(`${found.file}:${found.line} (${refs.indexOf(found) + 1} of ${refs.length})`, name)
+        }
+        if (found.file !== fromFn) {
+            await _raw_loadFile(raw, found.file)
+            fileTreeSelect(found.file)
+        }
+    } catch (err) {
+        report('Symbol lookup failed', err)
+        return
+    } finally {
+        try { await raw.end() } catch (_err) { /* device may have disconnected */ }
+    }
+    if (editor && editorFn === found.file) {
+        revealLine(editor, found.line)
+    }
+}
+
 /*
  * Disassembles the currently open file in place, without writing anything to the
  * device or to the file being edited. A `.py` file is cross-compiled first; a
@@ -1377,7 +1522,10 @@ export async function showDisassembly() {
 
     if (editor && editorFn.endsWith('.py')) {
         fn = editorFn
-        const mpy = await compilePython(fn, editor.state.doc.toString(), devInfo)
+        const mpy = await compilePython(fn, editor.state.doc.toString(), devInfo, {
+            optimize: getSetting('optimize-bytecode'),
+            fold: getSetting('fold-consts'),
+        })
         dis = await disassembleMPY(mpy)
     } else if (!editor && editorFn.endsWith('.mpy')) {
         fn = editorFn
@@ -1424,6 +1572,27 @@ export async function showDisassembly() {
     autoHideSideMenu()
 }
 
+/* The developer panel for tools profiling (see tools_profile.js), refreshed each time it is asked for */
+export async function showToolsProfile() {
+    const fn = '~tools-profile.md'
+    const content = toolsProfileMarkdown()
+    if (displayOpenFile(fn)) {
+        _reloadView(fn, content)
+    } else {
+        await _loadContent(fn, content, createTab(fn))
+    }
+    autoHideSideMenu()
+}
+
+export function exportToolsProfile() {
+    const url = URL.createObjectURL(new Blob([toolsProfileJSON()], { type: 'application/json' }))
+    const a = document.createElement('a')
+    a.href = url
+    a.download = `tools-profile-${new Date().toISOString().replace(/[:.]/g, '-')}.json`
+    a.click()
+    setTimeout(() => URL.revokeObjectURL(url), 1000)
+}
+
 async function _raw_loadFile(raw, fn) {
     let content
     if (fn == '~sysinfo.md') {
@@ -1631,6 +1800,7 @@ async function _loadContent(fn, content, editorElement, { external=null } = {})
             wordWrap: getSetting('use-word-wrap'),
             devInfo,
             readOnly,
+            onSymbol: lookupSymbol,
         })
         /* The text as handed to the editor, which is not the bytes on the device
            for prettified JSON or a disassembly. Comparing against this is what
@@ -1907,6 +2077,8 @@ async function _raw_installPkg(raw, pkg, { version=null } = {}) {
         version,
         dev: dev_info,
         prefer_source: getSetting('install-package-source'),
+        optimize: getSetting('optimize-bytecode'),
+        fold: getSetting('fold-consts'),
     })
     if (pkg_info.version) {
         toastr.success(`Installed ${pkg_info.name}@${pkg_info.version}`)
@@ -2204,7 +2376,10 @@ export function applyTranslation() {
         QS('label[for=interrupt-running-code]').innerText = T('settings.interrupt-running-code')
         QS('label[for=force-serial-poly]').innerText = T('settings.force-serial-poly')
         QS('label[for=install-package-source]').innerText = T('settings.install-package-source')
+        QS('label[for=optimize-bytecode]').innerText = T('settings.optimize-bytecode')
+        QS('label[for=fold-consts]').innerText = T('settings.fold-consts')
         QS('label[for=expand-minify-json]').innerText = T('settings.expand-minify-json')
+        QS('label[for=minify-upload]').innerText = T('settings.minify-upload')
         QS('label[for=use-word-wrap]').innerText = T('settings.use-word-wrap')
         QS('label[for=render-markdown]').innerText = T('settings.render-markdown')
         QS('label[for=refresh-after-run]').innerText = T('settings.refresh-after-run')
@@ -2351,6 +2526,9 @@ function showOfflineReadyToast(version) {
         }
     }
 
+    setToolsProfiling(getSetting('profile-tools'))
+    onSettingChange('profile-tools', setToolsProfiling)
+
     onSettingChange('zoom', function(newValue) {
         const size = 14 * parseFloat(newValue)
         document.documentElement.style.setProperty('--font-size', (size).toFixed(1) + 'px')
@@ -2513,6 +2691,7 @@ function showOfflineReadyToast(version) {
         /* Closing already asked about discarding unsaved changes, so the backup
            has to go with them */
         fsCache.closeView(event.detail.fn)
+        forgetValidation(event.detail.fn)
     })
     /* Closing the last tab would leave the editor area blank and `editor`
        pointing at a view that is no longer in the document */
@@ -2524,6 +2703,14 @@ function showOfflineReadyToast(version) {
         document.body.classList.add('loaded')
     }, 100)
 
+    /* A tools worker takes a while to load its VM, so start one while the page is
+       idle rather than on the first minify or disassembly */
+    if ('requestIdleCallback' in window) {
+        requestIdleCallback(() => warmUpTools(), { timeout: 5000 })
+    } else {
+        setTimeout(() => warmUpTools(), 2000)
+    }
+
     let urlID
     if ((urlID = urlParams.get('wss'))) {
         try {
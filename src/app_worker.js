@@ -13,6 +13,7 @@ const log = console.log.bind(console).bind(console, `[Service Worker ${VIPER_IDE
 
 const contentToCache = new Set([
     '/index.html',
+    '/tools_worker.js',
     '/assets/favicon.png',
     '/assets/app_1024.png',
     '/assets/logo_1024.png',
@@ -25,6 +26,7 @@ const contentToCache = new Set([
     '/assets/micropython.wasm',
     '/assets/ruff_wasm_bg.wasm',
     '/assets/tools_vfs.tar.gz',
+    '/assets/tools_minifier.tar.gz',
     '/assets/vm_vfs.tar.gz',
 ]);
 
@@ -0,0 +1,113 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * .mpy files compiled before, so that installing the same library to one board
+ * after another does not run mpy-cross again. Entries are keyed by a digest of
+ * everything the output depends on (see compilePython()) and evicted least
+ * recently used first: a small cache in memory, and a bigger one in IndexedDB
+ * where there is one. Under Node the cache only lives in memory.
+ */
+
+import { idbAvailable, openDB, transact } from './idb_store.js'
+
+export class CompileCache {
+    constructor({ dbName='viper-compile-cache', maxBytes=32*1024*1024, memBytes=4*1024*1024 } = {}) {
+        this.dbName = dbName
+        this.maxBytes = maxBytes
+        this.memBytes = memBytes
+        this.mem = new Map()        // key -> mpy, least recently used first
+        this.memSize = 0
+        this._db = null
+    }
+
+    async get(key) {
+        let mpy = this.mem.get(key)
+        if (mpy) {
+            this.mem.delete(key)
+            this.mem.set(key, mpy)
+            return mpy.slice()
+        }
+        const db = await this._open()
+        if (!db) { return null }
+        try {
+            mpy = await transact(db, ['mpy', 'meta'], 'readwrite', (data, meta) => {
+                const req = data.get(key)
+                req.onsuccess = () => {
+                    if (req.result) {
+                        meta.put({ key, size: req.result.length, used: Date.now() })
+                    }
+                }
+                return req
+            })
+        } catch (err) {
+            console.warn(`Compile cache: ${err}`)
+            return null
+        }
+        if (!mpy) { return null }
+        this._remember(key, mpy)
+        return mpy.slice()
+    }
+
+    async put(key, mpy) {
+        mpy = mpy.slice()
+        this._remember(key, mpy)
+        const db = await this._open()
+        if (!db) { return }
+        try {
+            await transact(db, ['mpy', 'meta'], 'readwrite', (data, meta) => {
+                data.put(mpy, key)
+                meta.put({ key, size: mpy.length, used: Date.now() })
+            })
+            await this._trim(db)
+        } catch (err) {
+            console.warn(`Compile cache: ${err}`)
+        }
+    }
+
+    _remember(key, mpy) {
+        if (this.mem.has(key)) {
+            this.memSize -= this.mem.get(key).length
+            this.mem.delete(key)
+        }
+        this.mem.set(key, mpy)
+        this.memSize += mpy.length
+        for (const [k, v] of this.mem) {
+            if (this.memSize <= this.memBytes) { break }
+            this.mem.delete(k)
+            this.memSize -= v.length
+        }
+    }
+
+    /* Drops the least recently used entries until the database is within maxBytes */
+    _trim(db) {
+        return transact(db, ['mpy', 'meta'], 'readwrite', (data, meta) => {
+            const req = meta.index('used').getAll()
+            req.onsuccess = () => {
+                let total = req.result.reduce((sum, m) => sum + m.size, 0)
+                for (const m of req.result) {
+                    if (total <= this.maxBytes) { break }
+                    data.delete(m.key)
+                    meta.delete(m.key)
+                    total -= m.size
+                }
+            }
+        })
+    }
+
+    _open() {
+        if (!this._db) {
+            this._db = !idbAvailable() ? Promise.resolve(null) : openDB(this.dbName, (db) => {
+                db.createObjectStore('mpy')
+                db.createObjectStore('meta', { keyPath: 'key' }).createIndex('used', 'used')
+            }).catch((err) => {
+                console.warn(`Compile cache: ${err}`)
+                return null
+            })
+        }
+        return this._db
+    }
+}
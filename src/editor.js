@@ -20,7 +20,7 @@ import { monokaiInit } from '@uiw/codemirror-theme-monokai'
 import { tags } from '@lezer/highlight'
 import { linter } from '@codemirror/lint'
 
-import { validatePython, getRuffWorkspace } from './python_utils.js'
+import { ValidationScheduler } from './validation.js'
 
 /*
  * Highlight regexp matches, but only where they occur in comments
@@ -295,40 +295,22 @@ const modeMPY_DIS = StreamLanguage.define(simpleMode({
 const modeTOML = StreamLanguage.define(toml)
 
 /*
- * mpy-cross linter
+ * Python linter: mpy-cross and Ruff, scheduled by ValidationScheduler
  */
 
 let devInfo
+const validation = new ValidationScheduler()
 
-const mpyCrossLinter = linter(async (view) => {
-  const content = view.state.doc.toString()
-  const backtrace = await validatePython('stdin.py', content, devInfo)
-
-  const diagnostics = []
-  if (backtrace) {
-    const frame = backtrace.frames[0]
-    const line = view.state.doc.line(frame.line)
-    diagnostics.push({
-      from: line.from,
-      to: line.to,
-      severity: 'error',
-      message: 'MicroPython: ' + backtrace.message,
-    })
-  }
-  return diagnostics
-})
-
-/*
- * Ruff linter
- */
-
-function ruffLinter(ruff) {
-  return linter((view) => {
+function pythonLinter(fn) {
+  return linter(async (view) => {
     const doc = view.state.doc
-    const res = ruff.check(doc.toString())
+    const res = await validation.check(fn, doc.toString(), devInfo)
+
+    // Superseded by newer content: CodeMirror drops the result anyway
+    if (!res) { return [] }
 
     const diagnostics = []
-    for (let d of res) {
+    for (let d of res.ruff || []) {
       diagnostics.push({
         from: doc.line(d.start_location.row).from + d.start_location.column - 1,
         to:   doc.line(d.end_location.row).from + d.end_location.column - 1,
@@ -336,10 +318,57 @@ function ruffLinter(ruff) {
         message: d.code ? d.code + ': ' + d.message : d.message,
       })
     }
+    if (res.backtrace) {
+      const frame = res.backtrace.frames[0]
+      const line = doc.line(frame.line)
+      diagnostics.push({
+        from: line.from,
+        to: line.to,
+        severity: 'error',
+        message: 'MicroPython: ' + res.backtrace.message,
+      })
+    }
     return diagnostics
+  }, {
+    // ValidationScheduler does the waiting, scaled to the size of the file
+    delay: 100,
   })
 }
 
+/* Stops validating a file whose editor is gone */
+export function forgetValidation(fn) {
+  validation.forget(fn)
+}
+
+/*
+ * Go to definition (F12) and find references (Shift-F12), on the name under the
+ * cursor. The editor only knows its own file, so the lookup itself is left to
+ * `onSymbol(action, name)`, action being 'definition' or 'references'.
+ */
+function symbolKeymap(onSymbol) {
+  const run = (action) => (view) => {
+    const range = view.state.wordAt(view.state.selection.main.head)
+    const name = range && view.state.sliceDoc(range.from, range.to)
+    if (!name || !/^[A-Za-z_]\w*$/.test(name)) {
+      return false
+    }
+    onSymbol(action, name)
+    return true
+  }
+  return keymap.of([
+    { key: 'F12', run: run('definition') },
+    { key: 'Shift-F12', run: run('references') },
+  ])
+}
+
+/* Puts the cursor at the start of a (1-based) line, and scrolls it into view */
+export function revealLine(view, line) {
+  const doc = view.state.doc
+  const pos = doc.line(Math.max(1, Math.min(line, doc.lines))).from
+  view.dispatch({ selection: { anchor: pos }, scrollIntoView: true })
+  view.focus()
+}
+
 /*
  * Theme helpers
  */
@@ -405,13 +434,14 @@ export async function createNewEditor(editorElement, fn, content, options) {
     let mode = []
     let { wordWrap, readOnly } = options
     if (fn.endsWith('.py')) {
-        const ruff = await getRuffWorkspace()
         mode = [
             // TODO: detect indent of existing content
             indentUnit.of('    '), python(),
-            ruff && ruffLinter(ruff),
-            mpyCrossLinter,
+            pythonLinter(fn),
         ]
+        if (options.onSymbol) {
+            mode.push(symbolKeymap(options.onSymbol))
+        }
     } else if (fn.endsWith('.mpy.dis')) {
         mode = [ modeMPY_DIS ]
         /* A disassembly is derived, not stored: there is nothing to save it back
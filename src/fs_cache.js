@@ -279,6 +279,16 @@ export function countUnder(path) {
     return count
 }
 
+/* Paths of the files, not folders, the listing has under `path` */
+export function filesUnder(path) {
+    const prefix = (path === '/') ? '/' : path + '/'
+    const res = []
+    for (const [p, entry] of listing) {
+        if (p.startsWith(prefix) && !entry.isDir) { res.push(p) }
+    }
+    return res
+}
+
 /*
  * Content. These take an already-open raw session, following the _raw_ naming
  * convention in app.js: opening and closing the session stays with the caller.
@@ -0,0 +1,76 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * IndexedDB, for what is worth keeping across page loads but is not a user's
+ * data. Works in workers too. Where there is no IndexedDB (Node), check
+ * `idbAvailable()` first - nothing here is usable then.
+ */
+
+export function idbAvailable() {
+    return typeof indexedDB !== 'undefined'
+}
+
+/* Opens a database, calling `upgrade(db)` to create its stores when it is new */
+export function openDB(name, upgrade, version=1) {
+    return new Promise((resolve, reject) => {
+        const req = indexedDB.open(name, version)
+        req.onupgradeneeded = () => upgrade(req.result)
+        req.onsuccess = () => resolve(req.result)
+        req.onerror = () => reject(req.error)
+    })
+}
+
+/*
+ * Runs `fn(...stores)` in a transaction over `storeNames`, resolving to the
+ * result of the request it returns (if any) once the transaction completes
+ */
+export function transact(db, storeNames, mode, fn) {
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(storeNames, mode)
+        const req = fn(...[].concat(storeNames).map(n => tx.objectStore(n)))
+        tx.oncomplete = () => resolve(req ? req.result : undefined)
+        tx.onerror = tx.onabort = () => reject(tx.error)
+    })
+}
+
+export class KeyValueStore {
+    constructor(dbName, storeName='kv') {
+        this.dbName = dbName
+        this.storeName = storeName
+        this._db = null
+    }
+
+    _open() {
+        if (!this._db) {
+            this._db = openDB(this.dbName, db => db.createObjectStore(this.storeName)).catch((err) => {
+                this._db = null
+                throw err
+            })
+        }
+        return this._db
+    }
+
+    async _request(mode, fn) {
+        return transact(await this._open(), this.storeName, mode, fn)
+    }
+
+    get(key) {
+        return this._request('readonly', s => s.get(key))
+    }
+
+    put(key, value) {
+        return this._request('readwrite', s => s.put(value, key))
+    }
+
+    delete(key) {
+        return this._request('readwrite', s => s.delete(key))
+    }
+
+    keys() {
+        return this._request('readonly', s => s.getAllKeys())
+    }
+}
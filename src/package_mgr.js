@@ -7,7 +7,7 @@
  */
 
 import { fetchJSON, fetchText, fetchArrayBuffer, splitPath } from './utils.js'
-import { compilePython } from './python_utils.js'
+import { compilePython, projectConsts } from './python_utils.js'
 
 const MIP_INDEXES = [{
     name: 'featured',
@@ -188,7 +188,7 @@ export async function fetchPkgReadme(name, { version=null } = {}) {
     }
 }
 
-export async function rawInstallPkg(raw, name, { dev=null, version=null, index=null, pkg_info=null, pkg_json=null, prefer_source=false } = {}) {
+export async function rawInstallPkg(raw, name, { dev=null, version=null, index=null, pkg_info=null, pkg_json=null, prefer_source=false, optimize=false, fold=false } = {}) {
     // Find the first `lib` folder in sys.path
     const lib_path = dev.sys_path.find(x => x.endsWith('/lib'))
     if (!lib_path) {
@@ -271,28 +271,50 @@ export async function rawInstallPkg(raw, name, { dev=null, version=null, index=n
             MPY:    dev.mpy_ver + '.' + dev.mpy_sub,
             MPY_MAJ: '' + dev.mpy_ver,
         }
+        const files = []
         for (let [fn, url, ..._] of pkg_info.urls) {
             url = rewriteUrl(url, { base: pkg_json, branch: version })
             url = expandVars(url, vars)
-            let content = await fetchArrayBuffer(url)
+            const content = await fetchArrayBuffer(url)
 
+            let compile = false
             if (fn.startsWith('fs:')) {
                 fn = fn.slice(3)
                 fn = `${fs_path}/${fn}`
             } else {
                 if (fn.startsWith('lib:')) { fn = fn.slice(4) }
                 fn = `${lib_path}/${fn}`
+                compile = !prefer_source && fn.endsWith('.py')
+            }
+            files.push({ fn, content, compile })
+        }
 
-                if (!prefer_source && fn.endsWith('.py')) {
-                    try {
-                        content = await compilePython(fn, content, dev)
-                        fn = fn.replace(/\.py$/, '.mpy')
-                    } catch (_err) {
-                        // Ok, just install the source
-                    }
+        // The package's own const() values can then be used across its modules
+        let consts = null
+        if ((optimize || fold) && files.some(f => f.compile)) {
+            try {
+                const sources = files.filter(f => f.compile).map(f => [f.fn, f.content])
+                consts = await projectConsts(sources, { root: lib_path })
+            } catch (_err) {
+                // Optimize each file on its own
+            }
+        }
+
+        // All files are compiled at once, spread over the tools workers, while
+        // writing them to the board is one at a time
+        const outputs = await Promise.all(files.map(async ({ fn, content, compile }) => {
+            if (compile) {
+                try {
+                    content = await compilePython(fn, content, dev, { optimize, fold, consts, root: lib_path })
+                    fn = fn.replace(/\.py$/, '.mpy')
+                } catch (_err) {
+                    // Ok, just install the source
                 }
             }
+            return { fn, content }
+        }))
 
+        for (const { fn, content } of outputs) {
             // Ensure path exists
             const [dirname, _] = splitPath(fn)
             await raw.makePath(dirname)
@@ -311,7 +333,7 @@ export async function rawInstallPkg(raw, name, { dev=null, version=null, index=n
             } else {
                 throw new Error(`Only strings and arrays are supported in 'deps'`)
             }
-            await rawInstallPkg(raw, dep_pkg, { dev, version: dep_ver })
+            await rawInstallPkg(raw, dep_pkg, { dev, version: dep_ver, optimize, fold })
         }
     }
 
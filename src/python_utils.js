@@ -1,8 +1,9 @@
-import { splitPath } from './utils.js'
-import { TarReader } from '@gera2ld/tarjs'
-import { loadMicroPython } from '@micropython/micropython-webassembly-pyscript/micropython.mjs'
-import { compile as mpyCross, abiVersions, defaultAbi, wasmFileName } from '@vshymanskyy/mpy-cross-wasm'
-import __wbg_init, { PositionEncoding, Workspace as RuffWorkspace } from '@astral-sh/ruff-wasm-web'
+import { splitPath, digestHex } from './utils.js'
+import { loadVFS, createToolsVM, runJob, runProfiledJob, ToolsPool, ToolsWorkerUnavailable, MINIFIER_ARCHIVE,
+         getRuffWorkspace } from './tools_vm.js'
+import { toolsProfiling, recordToolsCall } from './tools_profile.js'
+import { CompileCache } from './compile_cache.js'
+import { abiVersions, defaultAbi, wasmFileName } from '@vshymanskyy/mpy-cross-wasm'
 
 export function parseStackTrace(stackTrace)
 {
@@ -93,7 +94,25 @@ export async function validatePython(filename, content, devInfo) {
     }
 }
 
-export async function compilePython(filename, content, devInfo) {
+/*
+ * Ruff's diagnostics for `content`, or null if Ruff is not available. Runs in the
+ * first tools worker, so that Ruff is only ever loaded into that one.
+ */
+export async function lintPython(content) {
+    return runTools({ ruff: content }, { pin: true, tool: 'ruff' })
+}
+
+/*
+ * With `optimize`, the source first goes through the AST optimizer in the tools VM
+ * (see tools_vfs/lib/optimize.py), `consts` giving const() values of other modules as
+ * { module: { NAME: value } }. With `fold` instead, it only goes through the const()
+ * pass: no loops are unrolled and nothing is hoisted. The optimizer is best effort:
+ * if it fails, or mpy-cross rejects what it produced, the source is compiled as written.
+ *
+ * Results are cached (see compile_cache.js), so installing a package to a second board
+ * of the same kind does not compile anything.
+ */
+export async function compilePython(filename, content, devInfo, { optimize=false, fold=false, consts=null, root=null } = {}) {
     if (content instanceof ArrayBuffer) {
         const codec = new TextDecoder("utf-8")
         content = codec.decode(content)
@@ -113,12 +132,54 @@ export async function compilePython(filename, content, devInfo) {
             options = [ "-march="+devInfo.mpy_arch ]
         }
     }
-    const result = await mpyCross(fname, content, { abi, options, wasmPath: mpyCrossWasmUrl(abi) })
+    const t0 = performance.now()
+    // mpy-cross embeds the file name, and the optimizer output depends on its inputs, so
+    // all of those go into the key along with the source. So does the build: mpy-cross and
+    // the tools are bundled into it, and a new one of either can change the output while
+    // the IDE version stays the same
+    const version = (typeof VIPER_IDE_VERSION !== 'undefined') ? VIPER_IDE_VERSION : null
+    const build = (typeof VIPER_IDE_BUILD !== 'undefined') ? VIPER_IDE_BUILD : null
+    const passes = optimize ? 'all' : fold ? 'fold' : null
+    const cacheKey = await digestHex([
+        version, build, fname, abi, options,
+        passes ? { passes, consts, path: filename, root } : null,
+        content,
+    ])
+    if (cacheKey) {
+        const cached = await compileCache.get(cacheKey)
+        if (cached) {
+            recordToolsCall({ tool: 'compile', cache: 'hit', ms: performance.now() - t0,
+                              inBytes: content.length, outBytes: cached.length })
+            return cached
+        }
+    }
+    let source = content
+    if (passes) {
+        try {
+            source = await optimizePython(content, {
+                consts, path: filename, root,
+                ...(optimize ? {} : { unroll: 0, hoist: false }),
+            })
+        } catch (err) {
+            console.warn(`Not optimizing ${filename}: ${err}`)
+        }
+    }
+    const mpyOptions = { abi, options, wasmPath: mpyCrossWasmUrl(abi) }
+    let result = await mpyCross(fname, source, mpyOptions)
+    if (result.status !== 0 && source !== content) {
+        console.warn(`Optimized ${filename} does not compile, using the source as is`)
+        result = await mpyCross(fname, content, mpyOptions)
+    }
     if (result.status !== 0) {
         const stderr = result.err.join('\n')
         const stdout = result.out.join('\n')
         throw new Error("mpy-cross failed:\n" + stdout + "\n" + stderr)
     }
+    if (cacheKey) {
+        await compileCache.put(cacheKey, result.mpy)
+    }
+    recordToolsCall({ tool: 'compile', cache: cacheKey ? 'miss' : undefined, ms: performance.now() - t0,
+                      inBytes: content.length, outBytes: result.mpy.length })
     return result.mpy
 }
 
@@ -165,98 +226,282 @@ export function detectIndentStyle(content) {
 }
 
 let _tools_vm;
-let _ruff_wspace;
+let _tools_pool;
+const compileCache = new CompileCache()
+
+export { loadVFS, getRuffWorkspace }
 
-export async function loadVFS(vm, url) {
-    // Fetch the tar.gz file from the URL
-    const response = await fetch(url);
-    if (!response.ok) {
-        throw new Error(`Failed to fetch ${url}`);
+/* The tools VM of this thread: used where there is no worker for it (e.g. under Node) */
+export async function getToolsVM() {
+    if (!_tools_vm) {
+        _tools_vm = createToolsVM().catch((err) => {
+            _tools_vm = null
+            throw err
+        })
     }
-    const decompressedStream = response.body.pipeThrough(new DecompressionStream('gzip'));
-    const decompressedBuffer = await new Response(decompressedStream).arrayBuffer();
-
-    const tar = await TarReader.load(decompressedBuffer)
-
-    // Unpack VFS
-    for (const entry of tar.fileInfos) {
-        if (entry.type == 53) {
-            vm.FS.mkdir("/" + entry.name)
-        } else if (entry.type == 48) {
-            let data = await tar.getFileBlob(entry.name)
-            data = await data.arrayBuffer()
-            vm.FS.writeFile("/" + entry.name, new Uint8Array(data))
+    return _tools_vm
+}
+
+/*
+ * One tools worker per core, leaving one for the page, and no more than 4:
+ * each holds a VM with a 32 MB heap.
+ */
+function getToolsPool() {
+    if (_tools_pool === undefined) {
+        if (typeof Worker === 'undefined') {
+            _tools_pool = null
+        } else {
+            const cores = navigator.hardwareConcurrency || 2
+            _tools_pool = new ToolsPool(`${VIPER_IDE_BASE_URL}/tools_worker.js`, Math.min(cores - 1, 4))
         }
     }
+    return _tools_pool
 }
 
-export async function getToolsVM() {
-    if (_tools_vm) { return _tools_vm }
-
-    _tools_vm = await loadMicroPython({
-        pystack: 64 * 1024,
-        heapsize: 32 * 1024 * 1024,
-        url: `${VIPER_IDE_BASE_URL}/assets/micropython.wasm`,
-        //stdout: (data) => { console.log(data) },
-    })
-
-    await loadVFS(_tools_vm, `${VIPER_IDE_BASE_URL}/assets/tools_vfs.tar.gz`)
+/*
+ * Runs a job (see runJob() in tools_vm.js) in the tools worker pool if there can be
+ * one, in this thread otherwise. `signal` cancels it; `pin` is for jobs that use
+ * state kept in the worker (the symbol index, Ruff). `tool` names the job in the
+ * profile (see tools_profile.js), when profiling is on.
+ */
+export async function runTools(job, { signal=null, pin=false, tool='tools' } = {}) {
+    if (!toolsProfiling()) {
+        return (await dispatchTools(job, { signal, pin })).result
+    }
+    const rec = { tool }
+    const t0 = performance.now()
+    try {
+        const { result, worker } = await dispatchTools({ ...job, profile: true }, { signal, pin })
+        Object.assign(rec, result.stats, { worker })
+        return result.result
+    } catch (err) {
+        rec.error = err.message || String(err)
+        throw err
+    } finally {
+        rec.ms = performance.now() - t0
+        recordToolsCall(rec)
+    }
+}
 
-    return _tools_vm
+async function dispatchTools(job, { signal, pin }) {
+    const pool = getToolsPool()
+    if (pool) {
+        try {
+            return { result: await pool.run(job, { signal, pin }), worker: true }
+        } catch (err) {
+            if (!(err instanceof ToolsWorkerUnavailable)) { throw err }
+        }
+    }
+    if (signal) { signal.throwIfAborted() }
+    const run = job.profile ? runProfiledJob : runJob
+    return { result: await run(getToolsVM, job), worker: false }
 }
 
-export async function getRuffWorkspace() {
-    if (_ruff_wspace) { return _ruff_wspace }
-    try {
-        await __wbg_init({
-            module_or_path: `${VIPER_IDE_BASE_URL}/assets/ruff_wasm_bg.wasm`,
-        })
-        console.log('Ruff', RuffWorkspace.version())
-        _ruff_wspace = new RuffWorkspace({
-            'line-length': 120,
-            lint: {
-                ignore: [
-                    'I001',     // Import block is un-sorted or un-formatted
-                    'UP031',    // Use format specifiers instead of percent format
-                ],
-            },
-            builtins: [
-                'const',            // should be imported, but often used as a builtin
-                'execfile',         // often used as a builtin
-                // Viper code
-                //'ViperTypeError', // rarely used
-                //'int',            // already a builtin
-                'uint',
-                'ptr',
-                'ptr8',
-                'ptr16',
-                'ptr32',
-            ],
-        }, PositionEncoding.Utf16)
-    } catch (err) {
-        console.error(`Failed to init Ruff workspace: ${err}`)
+/* Starts a tools worker ahead of the first job; best called when the page is idle */
+export function warmUpTools() {
+    const pool = getToolsPool()
+    if (pool) {
+        pool.warmUp()
     }
-    return _ruff_wspace
 }
 
-export async function minifyPython(buffer) {
-    const vm = await getToolsVM()
-    vm.FS.writeFile("/tmp/file.py", buffer)
+function mpyCross(name, source, options) {
+    return runTools({ compile: [name, source, options] }, { tool: 'mpy-cross' })
+}
+
 
-    vm.runPython(`
-import python_minifier
-with open('/tmp/file.py') as f:
-    d = f.read()
+/*
+ * Minifies with the tools VM's own parser (see tools_vfs/lib/minify.py). Code it
+ * cannot parse goes through python_minifier instead, which is much heavier to load
+ * and comes in an archive of its own, only fetched for that.
+ */
+export async function minifyPython(buffer, { signal=null } = {}) {
+    const [res] = await runTools({
+        input: buffer,
+        output: 'utf8',
+        code: `
+import json, toolio
+d = toolio.read_text()
+try:
+    import minify
+    d = minify.minify(d)
+except Exception:
+    d = None
+toolio.write(json.dumps(d))
+d = None
+`,
+    }, { signal, tool: 'minify' })
+    const content = JSON.parse(res)
+    if (content !== null) {
+        return content
+    }
+
+    const [fallback] = await runTools({
+        archives: [MINIFIER_ARCHIVE],
+        input: buffer,
+        output: 'utf8',
+        code: `
+import python_minifier, toolio
 d = python_minifier.minify(
-    d,
+    toolio.read_text(),
     remove_literal_statements=True,
     hoist_literals=False
 )
-with open('/tmp/file.min.py', 'w') as f:
-    f.write(d)
-`)
+toolio.write(d)
+d = None
+`,
+    }, { signal, tool: 'python_minifier' })
+    return fallback
+}
+
+/*
+ * minifyPython() over a whole project in one tools VM call, so the parser is loaded
+ * once and the files cross into the VM and back once. `files` are [path, content]
+ * pairs; returns [{ path, content, error }] in the same order, with `content` null
+ * where the file could not be minified. With `optimize`, files also go through the
+ * optimizer, using the const() values of every file in the batch; with `fold`, only
+ * through its const() pass.
+ */
+export async function minifyPythonFiles(files, { optimize=false, fold=false, root=null, signal=null } = {}) {
+    const codec = new TextDecoder("utf-8")
+    const input = files.map(([fn, content]) => [
+        fn, (typeof content === 'string') ? content : codec.decode(content)
+    ])
+    const [out] = await runTools({
+        input: JSON.stringify(input),
+        output: 'utf8',
+        code: `
+import json, minify, toolio
+files = json.loads(toolio.read_text())
+res = minify.minify_files(files, ${optimize ? 'True' : 'False'}, ${root ? reprStr(root) : 'None'}, ${fold ? 'True' : 'False'})
+files = None
+toolio.write(json.dumps(res))
+res = None
+`,
+    }, { signal, tool: 'minify' })
+    const res = JSON.parse(out)
+
+    // What the tools VM minifier could not handle goes through python_minifier
+    const failed = res.map((r, i) => i).filter(i => res[i][1] === null)
+    if (failed.length) {
+        const [fallback] = await runTools({
+            archives: [MINIFIER_ARCHIVE],
+            input: JSON.stringify(failed.map(i => input[i])),
+            output: 'utf8',
+            code: `
+import json, python_minifier, toolio
+files = json.loads(toolio.read_text())
+res = []
+for path, d in files:
+    try:
+        res.append([python_minifier.minify(d, remove_literal_statements=True, hoist_literals=False), None])
+    except Exception as e:
+        res.append([None, str(e)])
+files = None
+toolio.write(json.dumps(res))
+res = None
+`,
+        }, { signal, tool: 'python_minifier' })
+        JSON.parse(fallback).forEach(([content, error], j) => {
+            const r = res[failed[j]]
+            if (content !== null) {
+                r[1] = content
+                r[2] = null
+            } else {
+                r[2] = error || r[2]
+            }
+        })
+    }
+    return res.map(([path, content, error]) => ({ path, content, error }))
+}
+
+/*
+ * Optimized source for mpy-cross: const() values substituted and folded, small
+ * constant range() loops unrolled (unless `unroll` is 0), builtins used in loops bound
+ * to locals (unless `hoist` is false). Throws if the source
+ * cannot be parsed by the tools VM parser.
+ *
+ * `consts` are the constants of other modules, as returned by projectConsts().
+ * `path` is where the file is installed, so its relative imports can be resolved;
+ * module names are taken relative to `root` (default: /, /lib, /flash or /flash/lib).
+ */
+export async function optimizePython(content, { consts=null, unroll=8, hoist=true, path=null, root=null, signal=null } = {}) {
+    const [res] = await runTools({
+        input: JSON.stringify([content, consts || {}]),
+        output: 'utf8',
+        code: `
+import json, optimize, toolio
+d, consts = json.loads(toolio.read_text())
+d = optimize.optimize(d, consts, ${parseInt(unroll) || 0}, ${hoist ? 'True' : 'False'}, path=${path ? reprStr(path) : 'None'}, root=${root ? reprStr(root) : 'None'})
+toolio.write(d)
+d = consts = None
+`,
+    }, { signal, tool: 'optimize' })
+    return res
+}
 
-    return vm.FS.readFile("/tmp/file.min.py", { encoding: 'utf8' })
+/*
+ * The const() pass of the optimizer alone, over a whole project in one tools VM call:
+ * each file gets the const() values of every file in the batch substituted and folded.
+ * Takes and returns what minifyPythonFiles() does.
+ */
+export async function foldPythonFiles(files, { root=null, signal=null } = {}) {
+    const codec = new TextDecoder("utf-8")
+    const input = files.map(([fn, content]) => [
+        fn, (typeof content === 'string') ? content : codec.decode(content)
+    ])
+    const [out] = await runTools({
+        input: JSON.stringify(input),
+        output: 'utf8',
+        code: `
+import json, optimize, toolio
+files = json.loads(toolio.read_text())
+res = optimize.fold_files(files, ${root ? reprStr(root) : 'None'})
+files = None
+toolio.write(json.dumps(res))
+res = None
+`,
+    }, { signal, tool: 'fold' })
+    return JSON.parse(out).map(([path, content, error]) => ({ path, content, error }))
+}
+
+/*
+ * The importable const() ints of a set of modules, as { module: { NAME: value } }.
+ * `files` are [path, content] pairs; files which do not parse are skipped.
+ */
+export async function projectConsts(files, { root=null, signal=null } = {}) {
+    const codec = new TextDecoder("utf-8")
+    const input = files.map(([fn, content]) => [
+        fn, (typeof content === 'string') ? content : codec.decode(content)
+    ])
+    const [res] = await runTools({
+        input: JSON.stringify(input),
+        output: 'utf8',
+        code: `
+import json, optimize, toolio
+files = json.loads(toolio.read_text())
+res = optimize.project_consts(files, ${root ? reprStr(root) : 'None'})
+files = None
+toolio.write(json.dumps(res))
+res = None
+`,
+    }, { signal, tool: 'project-consts' })
+    return JSON.parse(res)
+}
+
+/* Names of the modules `content` imports, parent packages included */
+export async function importedModules(content, { path=null, root=null, signal=null } = {}) {
+    const [res] = await runTools({
+        input: content,
+        output: 'utf8',
+        code: `
+import json, optimize, toolio
+res = optimize.imported_modules(toolio.read_text(), ${path ? reprStr(path) : 'None'}, ${root ? reprStr(root) : 'None'})
+toolio.write(json.dumps(res))
+res = None
+`,
+    }, { signal, tool: 'imported-modules' })
+    return JSON.parse(res)
 }
 
 export async function prettifyPython(buffer) {
@@ -264,30 +509,105 @@ export async function prettifyPython(buffer) {
     return ruff.format(buffer)
 }
 
-export async function disassembleMPY(buffer) {
-    const vm = await getToolsVM()
-    vm.FS.writeFile("/tmp/file.mpy", buffer)
-
-    vm.runPython(`
-import builtins
+export async function disassembleMPY(buffer, { signal=null } = {}) {
+    const [res] = await runTools({
+        write: [["/tmp/file.mpy", buffer]],
+        output: 'utf8',
+        code: `
+import builtins, toolio
 mpytool = __import__('mpy-tool')
 
-# Redirect output to a file
-f = open('/tmp/file.mpy.dis', 'w')
+# Redirect output to the job output
 pp = builtins.print
 def new_print(*a, **kw):
-    pp(*a, file=f)
+    toolio.write(' '.join(str(x) for x in a) + '\\n')
 
 # Run disassembler
 builtins.print = new_print
-mpytool.main(['-d', '/tmp/file.mpy'])
+try:
+    mpytool.main(['-d', '/tmp/file.mpy'])
+finally:
+    # Cleanup
+    builtins.print = pp
+`,
+    }, { signal, tool: 'disassemble' })
+    return res
+}
 
-# Cleanup
-builtins.print = pp
-f.close()
-`)
+/*
+ * Project-wide symbol index, kept in the tools VM (see tools_vfs/lib/symindex.py).
+ * `files` lists every .py file of the project as [path, content] pairs. Files whose
+ * content hash is unchanged are not parsed again, and files missing from the list
+ * are dropped, so this can be called with the whole project after every change.
+ * Resolves to { files, parsed, unchanged, removed, errors }, `errors` mapping the
+ * files that could not be parsed to { message, line }.
+ */
+export async function indexPythonProject(files) {
+    const codec = new TextDecoder("utf-8")
+    const input = files.map(([fn, content]) => [
+        fn, (typeof content === 'string') ? content : codec.decode(content)
+    ])
+    const [res] = await runTools({
+        input: JSON.stringify(input),
+        output: 'utf8',
+        code: `
+import json, symindex, toolio
+files = json.loads(toolio.read_text())
+res = symindex.index.sync(files)
+files = None
+toolio.write(json.dumps(res))
+`,
+    }, { pin: true, tool: 'symindex' })
+    const stats = JSON.parse(res)
+    for (const [path, [message, line]] of Object.entries(stats.errors)) {
+        stats.errors[path] = { message, line }
+    }
+    return stats
+}
+
+async function querySymbolIndex(expr) {
+    const [res] = await runTools({
+        output: 'utf8',
+        code: `
+import json, symindex, toolio
+toolio.write(json.dumps(${expr}))
+`,
+    }, { pin: true, tool: 'symindex' })
+    return JSON.parse(res)
+}
+
+/* Where `name`, as used in `fromFile`, is defined - best candidate first */
+export async function findDefinition(name, fromFile) {
+    const res = await querySymbolIndex(`symindex.index.definitions(${reprStr(name)}, ${reprStr(fromFile || '')})`)
+    return res.map(([file, line, kind, scope]) => ({ file, line, kind, scope }))
+}
+
+/* Where `name` is used, aliases it is imported as included, by file and line */
+export async function findReferences(name) {
+    const res = await querySymbolIndex(`symindex.index.references(${reprStr(name)})`)
+    return res.map(([file, line]) => ({ file, line }))
+}
+
+/* The index as a string, to persist it across sessions and hand it back to importSymbolIndex() */
+export async function exportSymbolIndex() {
+    const [res] = await runTools({
+        output: 'utf8',
+        code: `
+import symindex, toolio
+toolio.write(symindex.index.dumps())
+`,
+    }, { pin: true, tool: 'symindex' })
+    return res
+}
 
-    return vm.FS.readFile("/tmp/file.mpy.dis", { encoding: 'utf8' })
+export async function importSymbolIndex(data) {
+    await runTools({
+        input: data,
+        code: `
+import symindex, toolio
+symindex.index.loads(toolio.read_text())
+`,
+    }, { pin: true, tool: 'symindex' })
 }
 
 // Renders a string as a quoted Python string literal
@@ -0,0 +1,169 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ */
+
+/*
+ * A tar reader that works on a stream, as the archive arrives: nothing is
+ * buffered beyond the 512-byte header being read, and file bodies are handed
+ * over as views into the chunks of the stream, so they can go straight where
+ * they belong (e.g. an Emscripten FS) without an intermediate copy.
+ *
+ * Reads what Python's tarfile writes (see gen_tar() in build.py): ustar headers,
+ * with pax or GNU records for long names. Links, devices and the like are skipped.
+ * This module has no imports, so it loads under the test harness as-is.
+ */
+
+const BLOCK = 512
+
+const decoder = new TextDecoder()
+
+function field(header, at, len) {
+    const bytes = header.subarray(at, at + len)
+    const end = bytes.indexOf(0)
+    return decoder.decode(end < 0 ? bytes : bytes.subarray(0, end))
+}
+
+function octal(header, at, len) {
+    const s = field(header, at, len).trim()
+    return s ? parseInt(s, 8) : 0
+}
+
+function checksumOk(header) {
+    let sum = 0
+    for (let i = 0; i < BLOCK; i++) {
+        // The checksum field itself counts as spaces
+        sum += (i >= 148 && i < 156) ? 0x20 : header[i]
+    }
+    return sum === octal(header, 148, 8)
+}
+
+/* The `path` of a pax extended header: records of "<length> <key>=<value>\n" */
+function paxPath(data) {
+    let at = 0
+    while (at < data.length) {
+        const space = data.indexOf(0x20, at)
+        if (space < 0) { break }
+        const len = parseInt(decoder.decode(data.subarray(at, space)), 10)
+        if (!(len > 0)) { break }
+        const record = decoder.decode(data.subarray(space + 1, at + len - 1))
+        const eq = record.indexOf('=')
+        if (record.slice(0, eq) === 'path') {
+            return record.slice(eq + 1)
+        }
+        at += len
+    }
+    return null
+}
+
+/* Collects the body of a pax or GNU long name record */
+function collector(size, done) {
+    const data = new Uint8Array(size)
+    let at = 0
+    return {
+        write(bytes) {
+            data.set(bytes, at)
+            at += bytes.length
+        },
+        close() {
+            done(data)
+        },
+    }
+}
+
+/*
+ * Reads the tar archive in `stream` (a ReadableStream of bytes). Directories are
+ * reported to `dir(path)`, regular files to `file(path, size)`, which returns
+ * { write(bytes), close() } for the body - or null to skip it. The views passed
+ * to write() are only valid during the call. Paths are as stored in the archive,
+ * without a trailing slash. Resolves once the end of the archive is reached.
+ */
+export async function readTar(stream, { dir=null, file=null } = {}) {
+    const reader = stream.getReader()
+    const header = new Uint8Array(BLOCK)
+    let filled = 0          // bytes of the header read so far
+    let body = 0            // bytes of the current body still to come
+    let padding = 0         // and of the padding to the next block after it
+    let out = null          // where the body goes
+    let longName = null     // from a pax or GNU record, for the next entry
+
+    const startEntry = () => {
+        if (!checksumOk(header)) {
+            throw new Error('Malformed tar header')
+        }
+        let path = field(header, 0, 100)
+        if (field(header, 257, 5) === 'ustar') {
+            const prefix = field(header, 345, 155)
+            if (prefix) { path = prefix + '/' + path }
+        }
+        if (longName !== null) {
+            path = longName
+            longName = null
+        }
+        path = path.replace(/\/+$/, '')
+        const size = octal(header, 124, 12)
+        const type = String.fromCharCode(header[156] || 0x30)
+
+        body = size
+        padding = (BLOCK - size % BLOCK) % BLOCK
+        out = null
+        if (type === 'x') {
+            out = collector(size, (data) => { longName = paxPath(data) })
+        } else if (type === 'L') {
+            out = collector(size, (data) => { longName = field(data, 0, data.length) })
+        } else if (type === '5') {
+            if (dir) { dir(path) }
+        } else if (type === '0' || type === '7') {
+            out = file ? file(path, size) : null
+        }
+        if (out && !size) {
+            out.close()
+            out = null
+        }
+    }
+
+    try {
+        for (;;) {
+            const { done, value } = await reader.read()
+            if (done) {
+                throw new Error('Truncated tar archive')
+            }
+            let at = 0
+            while (at < value.length) {
+                if (body) {
+                    const n = Math.min(body, value.length - at)
+                    if (out) {
+                        out.write(value.subarray(at, at + n))
+                    }
+                    at += n
+                    body -= n
+                    if (!body && out) {
+                        out.close()
+                        out = null
+                    }
+                } else if (padding) {
+                    const n = Math.min(padding, value.length - at)
+                    at += n
+                    padding -= n
+                } else {
+                    const n = Math.min(BLOCK - filled, value.length - at)
+                    header.set(value.subarray(at, at + n), filled)
+                    at += n
+                    filled += n
+                    if (filled < BLOCK) { continue }
+                    filled = 0
+                    // A zero block ends the archive; what follows it is of no interest
+                    if (header.every(b => b === 0)) {
+                        return
+                    }
+                    startEntry()
+                }
+            }
+        }
+    } finally {
+        reader.cancel().catch(() => {})
+    }
+}
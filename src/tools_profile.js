@@ -0,0 +1,119 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * Profile of the calls into the tools: how long each took, end to end and in the
+ * VM, the Python heap in use before and after (gc.mem_alloc()), the bytes that
+ * went in and came out, and for cached operations whether the cache had it.
+ *
+ * Off unless turned on, at runtime, with setToolsProfiling() - the "Profile tools"
+ * setting does that. The last MAX_RECORDS calls are kept. This module has no
+ * imports and touches no browser globals, so it works in the bench harness too.
+ */
+
+const MAX_RECORDS = 1000
+
+let enabled = false
+let records = []
+
+export function setToolsProfiling(on) {
+    enabled = !!on
+}
+
+export function toolsProfiling() {
+    return enabled
+}
+
+/*
+ * Adds a record: { tool, ms } at least, and what else is known of the call -
+ * vmMs, heapBefore, heapAfter, inBytes, outBytes, cache ('hit' or 'miss'),
+ * worker (whether it ran in a tools worker), io (how its input and output got
+ * in and out of the VM: 'direct' or 'fs'), error.
+ */
+export function recordToolsCall(rec) {
+    if (!enabled) { return }
+    records.push({ at: Date.now(), ...rec })
+    if (records.length > MAX_RECORDS) {
+        records = records.slice(-MAX_RECORDS)
+    }
+}
+
+export function clearToolsProfile() {
+    records = []
+}
+
+/* Totals per tool: calls, errors, cache hits and misses, time, bytes and heap growth */
+export function summarizeToolsProfile() {
+    const tools = new Map()
+    for (const r of records) {
+        let s = tools.get(r.tool)
+        if (!s) {
+            tools.set(r.tool, s = { tool: r.tool, calls: 0, errors: 0, hits: 0, misses: 0,
+                                    totalMs: 0, maxMs: 0, vmMs: 0, inBytes: 0, outBytes: 0,
+                                    heapGrowth: 0 })
+        }
+        s.calls += 1
+        s.errors += r.error ? 1 : 0
+        s.hits += (r.cache === 'hit') ? 1 : 0
+        s.misses += (r.cache === 'miss') ? 1 : 0
+        s.totalMs += r.ms
+        s.maxMs = Math.max(s.maxMs, r.ms)
+        s.vmMs += r.vmMs || 0
+        s.inBytes += r.inBytes || 0
+        s.outBytes += r.outBytes || 0
+        if (r.heapBefore != null && r.heapAfter != null) {
+            s.heapGrowth = Math.max(s.heapGrowth, r.heapAfter - r.heapBefore)
+        }
+    }
+    return [...tools.values()].sort((a, b) => b.totalMs - a.totalMs)
+}
+
+/* Everything recorded, as JSON */
+export function exportToolsProfile() {
+    return JSON.stringify({
+        version: (typeof VIPER_IDE_VERSION !== 'undefined') ? VIPER_IDE_VERSION : null,
+        exported: new Date().toISOString(),
+        summary: summarizeToolsProfile(),
+        records,
+    }, null, 2)
+}
+
+/* A Markdown report: the summary, then the most recent calls */
+export function toolsProfileMarkdown({ recent=50 } = {}) {
+    const ms = (v) => v.toFixed(1)
+    const kb = (v) => (v / 1024).toFixed(1)
+    const lines = [
+        '# Tools profile',
+        '',
+        enabled ? `${records.length} calls recorded.`
+                : 'Profiling is off: turn on **Profile tools** in the settings.',
+        '',
+    ]
+    const summary = summarizeToolsProfile()
+    if (summary.length) {
+        lines.push(
+            '| Tool | Calls | Errors | Cache hit/miss | Total ms | Mean ms | Max ms | VM ms | In KiB | Out KiB | Max heap growth KiB |',
+            '|:--|--:|--:|--:|--:|--:|--:|--:|--:|--:|--:|',
+        )
+        for (const s of summary) {
+            lines.push(`| ${s.tool} | ${s.calls} | ${s.errors} | ${s.hits}/${s.misses} | ${ms(s.totalMs)} | ` +
+                       `${ms(s.totalMs / s.calls)} | ${ms(s.maxMs)} | ${ms(s.vmMs)} | ${kb(s.inBytes)} | ` +
+                       `${kb(s.outBytes)} | ${kb(s.heapGrowth)} |`)
+        }
+        lines.push('', `## Last ${Math.min(recent, records.length)} calls`, '',
+                   '| Time | Tool | ms | VM ms | Heap KiB before → after | In KiB | Out KiB | Cache | Where | I/O |',
+                   '|:--|:--|--:|--:|--:|--:|--:|:--|:--|:--|')
+        for (const r of records.slice(-recent).reverse()) {
+            const heap = (r.heapBefore != null) ? `${kb(r.heapBefore)} → ${kb(r.heapAfter)}` : ''
+            lines.push(`| ${new Date(r.at).toLocaleTimeString()} | ${r.tool}${r.error ? ' ⚠️' : ''} | ` +
+                       `${ms(r.ms)} | ${r.vmMs != null ? ms(r.vmMs) : ''} | ${heap} | ` +
+                       `${r.inBytes != null ? kb(r.inBytes) : ''} | ${r.outBytes != null ? kb(r.outBytes) : ''} | ` +
+                       `${r.cache || ''} | ${(r.worker === undefined) ? '' : r.worker ? 'worker' : 'page'} | ` +
+                       `${r.io || ''} |`)
+        }
+    }
+    return lines.join('\n') + '\n'
+}
@@ -38,14 +38,25 @@ def dump(t):
     return buf.getvalue()
 
 
+# Public (not "_"-prefixed) field names, per node class
+_public_fields = {}
+
+
+def public_fields(cls):
+    try:
+        return _public_fields[cls]
+    except KeyError:
+        f = _public_fields[cls] = tuple(k for k in cls._fields if not k.startswith("_"))
+        return f
+
+
 def iter_fields(t):
-    for k in t._fields:
-        if k.startswith("_"):
-            continue
+    for k in public_fields(t.__class__):
         yield (k, getattr(t, k, None))
 
 def iter_child_nodes(node):
-    for name, field in iter_fields(node):
+    for name in public_fields(node.__class__):
+        field = getattr(node, name, None)
         if isinstance(field, AST):
             yield field
         elif isinstance(field, list):
@@ -53,6 +64,33 @@ def iter_child_nodes(node):
                 if isinstance(item, AST):
                     yield item
 
+
+def walk(node, prune=None):
+    # Breadth-first, like CPython's. The queue is a list consumed from a
+    # moving head (MicroPython's deque wants a fixed maxlen), compacted as
+    # it goes so memory stays proportional to the frontier, not the tree.
+    # If prune(node) is true, that node is still yielded but its children
+    # are not.
+    todo = [node]
+    head = 0
+    while head < len(todo):
+        node = todo[head]
+        head += 1
+        if head >= 256 and head * 2 >= len(todo):
+            del todo[:head]
+            head = 0
+        yield node
+        if prune is not None and prune(node):
+            continue
+        for name in public_fields(node.__class__):
+            field = getattr(node, name, None)
+            if isinstance(field, AST):
+                todo.append(field)
+            elif isinstance(field, list):
+                for item in field:
+                    if isinstance(item, AST):
+                        todo.append(item)
+
 def copy_location(new_node, old_node):
     return new_node
 
@@ -82,31 +120,83 @@ def parse(source, filename="<unknown>", mode="exec"):
     return parse_stream(io.StringIO(source), filename, mode)
 
 
+def unparse(node, indent="    ", keep_lines=False, compact=False):
+    from . import unparser
+    return unparser.unparse(node, indent, keep_lines, compact)
+
+
+def literal_eval(node_or_string):
+    from . import literal
+    return literal.literal_eval(node_or_string)
+
+
 class NodeVisitor:
 
     def visit(self, node):
-        n = node.__class__.__name__
-        m = getattr(self, "visit_" + n, None)
+        m = self.visitor(node.__class__)
         if m:
             return m(node)
         else:
             return self.generic_visit(node)
 
+    # Bound visit_<Class> method for a node class, or None. Looked up once
+    # per class and visitor instance, not per node.
+    def visitor(self, cls):
+        try:
+            return self._visitors[cls]
+        except AttributeError:
+            self._visitors = {}
+        except KeyError:
+            pass
+        m = self._visitors[cls] = getattr(self, "visit_" + cls.__name__, None)
+        return m
+
+    # Whether children without a visit_* method can be walked inline
+    # rather than through self.visit() - true unless a subclass overrides
+    # visit() or generic_visit() themselves.
+    def _walks_inline(self, base):
+        cls = type(self)
+        return cls.visit is NodeVisitor.visit and cls.generic_visit is base.generic_visit
+
     def generic_visit(self, node):
-        for f in node._fields:
-            val = getattr(node, f)
-            if isinstance(val, list):
-                for v in val:
-                    if isinstance(v, AST):
-                        self.visit(v)
-            elif isinstance(val, AST):
-                self.visit(val)
+        if not self._walks_inline(NodeVisitor):
+            for child in iter_child_nodes(node):
+                self.visit(child)
+            return
+        # Depth-first, in field order, from an explicit stack of child
+        # iterators: only visit_* methods calling back into generic_visit()
+        # recurse, plain subtrees do not, however deep.
+        stack = [iter_child_nodes(node)]
+        while stack:
+            for child in stack[-1]:
+                m = self.visitor(child.__class__)
+                if m:
+                    m(child)
+                else:
+                    stack.append(iter_child_nodes(child))
+                    break
+            else:
+                stack.pop()
 
 
 class NodeTransformer(NodeVisitor):
 
     def generic_visit(self, node):
-        for f in node._fields:
+        inline = self._walks_inline(NodeTransformer)
+        stack = [self._transform_fields(node, inline)]
+        while stack:
+            for child in stack[-1]:
+                stack.append(self._transform_fields(child, inline))
+                break
+            else:
+                stack.pop()
+        return node
+
+    # Rewrites the fields of one node. A child that would only go through
+    # generic_visit() is yielded instead, for the caller to transform before
+    # resuming - its own result is then the child itself.
+    def _transform_fields(self, node, inline):
+        for f in public_fields(node.__class__):
             val = getattr(node, f)
             if isinstance(val, list):
                 newl = []
@@ -114,7 +204,7 @@ class NodeTransformer(NodeVisitor):
                     if not isinstance(v, AST):
                         newl.append(v)
                         continue
-                    newv = self.visit(v)
+                    newv = yield from self._transform_child(v, inline)
                     if newv is None:
                         pass
                     elif isinstance(newv, list):
@@ -123,7 +213,14 @@ class NodeTransformer(NodeVisitor):
                         newl.append(newv)
                 setattr(node, f, newl)
             elif isinstance(val, AST):
-                newv = self.visit(val)
+                newv = yield from self._transform_child(val, inline)
                 setattr(node, f, newv)
 
-        return node
\ No newline at end of file
+    def _transform_child(self, node, inline):
+        if not inline:
+            return self.visit(node)
+        m = self.visitor(node.__class__)
+        if m:
+            return m(node)
+        yield node
+        return node
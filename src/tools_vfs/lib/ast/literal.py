@@ -0,0 +1,370 @@
+# Evaluation of Python literals: numbers, strings, bytes, True/False/None
+# and tuples, lists, dicts and sets of them.
+#
+# Source text is evaluated straight from the token stream, so a large data
+# file never turns into an AST first. Containers are built from an explicit
+# stack of open brackets, so nesting depth does not matter either.
+
+import io
+import utokenize as tokenize
+from . import types as ast
+from .parser import literal_eval as eval_str
+
+_CLOSE = {"(": ")", "[": "]", "{": "}"}
+# Marks a "{" frame which has not seen a key yet
+_NOKEY = object()
+
+
+def _malformed(t):
+    if isinstance(t, ast.AST):
+        return ValueError("malformed node: %s" % t.__class__.__name__)
+    return ValueError("malformed literal: %r on line %s" % (t.string, t.start))
+
+
+class _Tokens:
+    # Token stream with the layout-only tokens dropped and one token of
+    # pushback.
+
+    def __init__(self, readline, skip):
+        self.it = tokenize.generate_tokens(readline)
+        self.skip = skip
+        self.back = None
+        self.last = None
+
+    def next(self):
+        t = self.back
+        if t is not None:
+            self.back = None
+            return t
+        for t in self.it:
+            if t.type not in self.skip:
+                self.last = t
+                return t
+        raise ValueError("unexpected end of literal")
+
+    def push(self, t):
+        self.back = t
+
+    def is_op(self, t, s):
+        return t.type == tokenize.OP and t.string == s
+
+
+def _number(s):
+    d = s.replace("_", "")
+    if d.isdigit() and d[0] == "0" and d.strip("0"):
+        # int(s, 0) refuses this, float(s) would not
+        raise ValueError("invalid decimal literal: %r" % s)
+    try:
+        return int(s, 0)
+    except ValueError:
+        if s.endswith("j"):
+            return complex(s)
+        return float(s)
+
+
+def _str(t):
+    s = t.string
+    if "f" in s[:s.find(s[-1])]:
+        raise _malformed(t)
+    return eval_str(s)
+
+
+# A number in any number of brackets, as in (1), with t its first token
+def _operand(t, toks):
+    n = 0
+    while toks.is_op(t, "("):
+        n += 1
+        t = toks.next()
+    if t.type != tokenize.NUMBER:
+        raise _malformed(t)
+    v = _number(t.string)
+    for _ in range(n):
+        t = toks.next()
+        if not toks.is_op(t, ")"):
+            raise _malformed(t)
+    return v
+
+
+# v, or the complex number if v is the real part of one, as in 1+2j
+def _complex(v, toks):
+    t = toks.next()
+    if t.type != tokenize.OP or t.string not in ("+", "-") or type(v) not in (int, float):
+        toks.push(t)
+        return v
+    im = _operand(toks.next(), toks)
+    if not isinstance(im, complex):
+        raise _malformed(toks.last)
+    return v + im if t.string == "+" else v - im
+
+
+def _scalar(t, toks):
+    typ = t.type
+    if typ == tokenize.STRING:
+        v = _str(t)
+        while True:
+            t = toks.next()
+            if t.type != tokenize.STRING:
+                toks.push(t)
+                return v
+            v += _str(t)
+
+    if typ == tokenize.NUMBER:
+        return _complex(_number(t.string), toks)
+    if typ == tokenize.OP and t.string in ("+", "-"):
+        v = _operand(toks.next(), toks)
+        return _complex(-v if t.string == "-" else v, toks)
+
+    if typ == tokenize.NAME:
+        s = t.string
+        if s == "True":
+            return True
+        if s == "False":
+            return False
+        if s == "None":
+            return None
+        if s == "set":
+            if toks.is_op(toks.next(), "(") and toks.is_op(toks.next(), ")"):
+                return set()
+
+    raise _malformed(t)
+
+
+def _value(toks):
+    # Frames of open brackets: [opener, items, pending key, saw a comma].
+    # Items is a list, or a dict once a "{" turns out to be one.
+    stack = []
+    while True:
+        t = toks.next()
+        if t.type == tokenize.OP and t.string in _CLOSE:
+            opener = t.string
+            t = toks.next()
+            if not toks.is_op(t, _CLOSE[opener]):
+                toks.push(t)
+                stack.append([opener, [], _NOKEY, False])
+                continue
+            v = () if opener == "(" else [] if opener == "[" else {}
+        else:
+            v = _scalar(t, toks)
+
+        # Hand the value to its container, closing as many as end here
+        while stack:
+            f = stack[-1]
+            t = toks.next()
+            s = t.string if t.type == tokenize.OP else None
+            items = f[1]
+            if f[0] == "{":
+                if s == ":":
+                    if f[2] is not _NOKEY or isinstance(items, list) and items:
+                        raise _malformed(t)
+                    if isinstance(items, list):
+                        items = f[1] = {}
+                    f[2] = v
+                    break
+                if isinstance(items, dict):
+                    if f[2] is _NOKEY:
+                        raise _malformed(t)
+                    items[f[2]] = v
+                    f[2] = _NOKEY
+                else:
+                    items.append(v)
+            else:
+                items.append(v)
+
+            if s == ",":
+                f[3] = True
+                t = toks.next()
+                if not toks.is_op(t, _CLOSE[f[0]]):
+                    toks.push(t)
+                    break
+            elif s != _CLOSE[f[0]]:
+                raise _malformed(t)
+
+            stack.pop()
+            if f[0] == "(":
+                v = tuple(items) if f[3] else items[0]
+                if not f[3]:
+                    # As in (1)+(2j)
+                    v = _complex(v, toks)
+            elif f[0] == "[":
+                v = items
+            elif isinstance(items, dict):
+                v = items
+            else:
+                v = set(items)
+        else:
+            return v
+
+
+def _eval_tokens(toks, end):
+    v = _value(toks)
+    t = toks.next()
+    if not toks.is_op(t, ","):
+        if t.type not in end:
+            raise _malformed(t)
+        return v, t
+    # Bare tuple, as in "1, 2"
+    items = [v]
+    while True:
+        t = toks.next()
+        if t.type in end:
+            return tuple(items), t
+        toks.push(t)
+        items.append(_value(toks))
+        t = toks.next()
+        if t.type in end:
+            return tuple(items), t
+        if not toks.is_op(t, ","):
+            raise _malformed(t)
+
+
+_CONTAINERS = (ast.List, ast.Tuple, ast.Set, ast.Dict)
+
+
+def _eval_node(node):
+    # Post-order over the node with an explicit stack of
+    # [node, children, values so far]
+    stack = []
+    while True:
+        while isinstance(node, (ast.Expression, ast.Expr)):
+            node = node.body if isinstance(node, ast.Expression) else node.value
+        if isinstance(node, ast.Dict):
+            kids = []
+            for i, k in enumerate(node.keys):
+                if k is None:
+                    raise _malformed(node)
+                kids.append(k)
+                kids.append(node.values[i])
+        elif isinstance(node, _CONTAINERS):
+            kids = node.elts
+        elif isinstance(node, ast.UnaryOp):
+            kids = [node.operand]
+        elif isinstance(node, ast.BinOp):
+            kids = [node.left, node.right]
+        else:
+            kids = None
+
+        if kids is None:
+            v = _leaf(node)
+        elif kids:
+            stack.append([node, kids, []])
+            node = kids[0]
+            continue
+        else:
+            v = _build(node, [])
+
+        while stack:
+            f = stack[-1]
+            vals = f[2]
+            vals.append(v)
+            if len(vals) < len(f[1]):
+                node = f[1][len(vals)]
+                break
+            stack.pop()
+            v = _build(f[0], vals)
+        else:
+            return v
+
+
+def _leaf(node):
+    if isinstance(node, ast.Num):
+        return node.n
+    if isinstance(node, (ast.Str, ast.Bytes)):
+        return node.s
+    if isinstance(node, (ast.NameConstant, ast.Constant)):
+        return node.value
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "set" \
+            and not node.args and not node.keywords:
+        return set()
+    raise _malformed(node)
+
+
+def _build(node, vals):
+    if isinstance(node, ast.List):
+        return vals
+    if isinstance(node, ast.Tuple):
+        return tuple(vals)
+    if isinstance(node, ast.Set):
+        return set(vals)
+    if isinstance(node, ast.Dict):
+        d = {}
+        for i in range(0, len(vals), 2):
+            d[vals[i]] = vals[i + 1]
+        return d
+    if isinstance(node, ast.UnaryOp) and isinstance(vals[0], (int, float, complex)) \
+            and not isinstance(vals[0], bool):
+        if isinstance(node.op, ast.USub):
+            return -vals[0]
+        if isinstance(node.op, ast.UAdd):
+            return +vals[0]
+    if isinstance(node, ast.BinOp) and isinstance(vals[0], (int, float)) \
+            and isinstance(vals[1], complex):
+        if isinstance(node.op, ast.Add):
+            return vals[0] + vals[1]
+        if isinstance(node.op, ast.Sub):
+            return vals[0] - vals[1]
+    raise _malformed(node)
+
+
+_SKIP_ALL = (tokenize.NL, tokenize.COMMENT, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT)
+_SKIP_NL = (tokenize.NL, tokenize.COMMENT)
+_END = (tokenize.ENDMARKER,)
+_END_STMT = (tokenize.NEWLINE, tokenize.ENDMARKER)
+
+
+def literal_eval(node_or_string):
+    if isinstance(node_or_string, ast.AST):
+        return _eval_node(node_or_string)
+    toks = _Tokens(io.StringIO(node_or_string).readline, _SKIP_ALL)
+    return _eval_tokens(toks, _END)[0]
+
+
+# Values of the module-level "NAME = literal" (or "NAME = const(literal)")
+# assignments in source, as a dict. Any other statement is skipped, so
+# this works on data modules which also import or define things.
+def literal_assignments(source):
+    toks = _Tokens(io.StringIO(source).readline, _SKIP_NL)
+    res = {}
+    depth = 0
+    while True:
+        t = toks.next()
+        if t.type == tokenize.ENDMARKER:
+            return res
+        if t.type == tokenize.INDENT:
+            depth += 1
+            continue
+        if t.type == tokenize.DEDENT:
+            depth -= 1
+            continue
+        if t.type == tokenize.NEWLINE:
+            continue
+        if depth == 0 and t.type == tokenize.NAME:
+            name = t.string
+            t = toks.next()
+            if toks.is_op(t, "="):
+                try:
+                    res[name] = _assigned(toks)
+                    continue
+                except (ValueError, NotImplementedError):
+                    t = toks.last
+        # Skip the rest of the statement; brackets make NL, not NEWLINE
+        while t.type not in (tokenize.NEWLINE, tokenize.ENDMARKER):
+            t = toks.next()
+        if t.type == tokenize.ENDMARKER:
+            return res
+
+
+def _assigned(toks):
+    t = toks.next()
+    if t.type == tokenize.NAME and t.string == "const":
+        if not toks.is_op(toks.next(), "("):
+            raise ValueError
+        v = _value(toks)
+        t = toks.next()
+        if not toks.is_op(t, ")"):
+            raise _malformed(t)
+        t = toks.next()
+        if t.type not in _END_STMT:
+            raise _malformed(t)
+        return v
+    toks.push(t)
+    return _eval_tokens(toks, _END_STMT)[0]
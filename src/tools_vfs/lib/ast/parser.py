@@ -30,7 +30,7 @@ from utokenize import *
 from . import types as ast
 
 
-log = logging.Logger(__name__)
+log = logging.getLogger(__name__)
 
 
 TOK_TYPE = 0
@@ -40,10 +40,77 @@ BP_UNTIL_COMMA = 6
 BP_LVALUE = 160 - 1
 
 
+# What Parser.error() raises: the message, and the line it is about
+class ParseError(SyntaxError):
+
+    def __init__(self, msg, lineno):
+        super().__init__("%s at line %d" % (msg, lineno))
+        self.msg = msg
+        self.lineno = lineno
+
+
 class GenComp(ast.expr):
     _fields = ('elt', 'generators')
 
 
+# nud()/led() implementations that need a sub-expression do not call
+# Parser.expr() themselves: they are generators which yield the binding
+# power to parse it at, and get the parsed node sent back. Parser.run()
+# drives them from an explicit stack, so nesting depth of e.g. data
+# literals is bounded by the heap rather than by the (small) pystack.
+_gen_type = type((lambda: (yield))())
+
+
+_escapes = {
+    "a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r",
+    "t": "\t", "v": "\v", "\\": "\\", "'": "'", '"': '"',
+    "\n": "",
+}
+
+
+# Decodes the body of a non-raw string literal. Pieces are collected and
+# joined once, so this is linear in the length of the literal.
+def unescape(s, is_bytes=False):
+    i = s.find("\\")
+    if i < 0:
+        return s.encode() if is_bytes else s
+    res = []
+    start = 0
+    n = len(s)
+    while i >= 0:
+        if i > start:
+            res.append(s[start:i])
+        c = s[i + 1]
+        code = None
+        if c >= "0" and c <= "7":
+            j = i + 2
+            while j < n and j < i + 4 and s[j] >= "0" and s[j] <= "7":
+                j += 1
+            code = int(s[i + 1:j], 8)
+        elif c == "x":
+            j = i + 4
+            code = int(s[i + 2:j], 16)
+        elif c == "u" and not is_bytes:
+            j = i + 6
+            code = int(s[i + 2:j], 16)
+        elif c == "U" and not is_bytes:
+            j = i + 10
+            code = int(s[i + 2:j], 16)
+        else:
+            j = i + 2
+            nc = _escapes.get(c)
+            res.append(s[i:j] if nc is None else nc)
+        if code is not None:
+            res.append(bytes([code]) if is_bytes else chr(code))
+        start = j
+        i = s.find("\\", j)
+    if start < n:
+        res.append(s[start:])
+    if is_bytes:
+        return b"".join(p if isinstance(p, bytes) else p.encode() for p in res)
+    return "".join(res)
+
+
 def literal_eval(s):
     if s.endswith('"') or s.endswith("'"):
         if s.endswith('"""') or s.endswith("'''"):
@@ -58,53 +125,7 @@ def literal_eval(s):
             if is_bytes:
                 res = bytes(res, "utf-8")
         else:
-            if is_bytes:
-                res = b""
-            else:
-                res = ""
-            while s:
-                if s[0] == "\\":
-                    c = s[1]
-                    if c >= "0" and c <= "7":
-                        s = s[1:]
-                        ns = ""
-                        while s and s[0] >= "0" and s[0] <= "7" and len(ns) < 3:
-                            ns += s[0]
-                            s = s[1:]
-                        if is_bytes:
-                            nc = bytes([int(ns, 8)])
-                        else:
-                            nc = chr(int(ns, 8))
-                    elif c == "x":
-                        if is_bytes:
-                            nc = bytes([int(s[2:4], 16)])
-                        else:
-                            nc = chr(int(s[2:4], 16))
-                        s = s[4:]
-                    elif c == "u" and not is_bytes:
-                        nc = chr(int(s[2:6], 16))
-                        s = s[6:]
-                    elif c == "U" and not is_bytes:
-                        nc = chr(int(s[2:10], 16))
-                        s = s[10:]
-                    else:
-                        nc = {
-                            "a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r",
-                            "t": "\t", "v": "\v", "\\": "\\", "'": "'", '"': '"',
-                            "\n": "",
-                        }.get(c)
-                        if nc is None:
-                            nc = s[0:2]
-                        s = s[2:]
-                    if is_bytes and not isinstance(nc, bytes):
-                        nc = nc.encode()
-                    res += nc
-                else:
-                    if is_bytes:
-                        res += s[0].encode()
-                    else:
-                        res += s[0]
-                    s = s[1:]
+            res = unescape(s, is_bytes)
         return res
 
     raise NotImplementedError
@@ -135,14 +156,14 @@ class TokDelim(TokBase):
 class TokPrefix(TokBase):
     @classmethod
     def nud(cls, p, t):
-        arg = p.expr(cls.nbp)
+        arg = yield cls.nbp
         node = ast.UnaryOp(op=cls.ast_un_op(), operand=arg)
         return node
 
 class TokInfix(TokBase):
     @classmethod
     def led(cls, p, left, t):
-        right = p.expr(cls.lbp)
+        right = yield cls.lbp
         if cls.ast_bin_op in (ast.And, ast.Or) and isinstance(left, ast.BoolOp) and isinstance(left.op, cls.ast_bin_op) and not getattr(left, "parenform", False):
             left.values.append(right)
             return left
@@ -165,7 +186,7 @@ class TokInfix(TokBase):
 class TokInfixRAssoc(TokBase):
     @classmethod
     def led(cls, p, left, t):
-        right = p.expr(cls.lbp - 1)
+        right = yield cls.lbp - 1
         node = ast.BinOp(op=cls.ast_bin_op(), left=left, right=right)
         return node
 
@@ -178,7 +199,7 @@ class TokYield(TokBase):
         yield_from = False
         if p.match("from"):
             yield_from = True
-        value = p.match_expr(rbp=4)
+        value = yield from p.match_expr_steps(rbp=4)
         if yield_from:
             return ast.YieldFrom(value=value)
         else:
@@ -191,7 +212,7 @@ class TokComma(TokBase):
     def led(cls, p, left, t):
         elts = [left]
         while not p.is_delim():
-            e = p.expr(5)
+            e = yield 5
             elts.append(e)
             if not p.match(","):
                 break
@@ -211,7 +232,7 @@ class TokFor(TokBase):
         target, expr = p.match_for_in(20)
         ifs = []
         while p.match("if"):
-            ifs.append(p.expr(20))
+            ifs.append((yield 20))
         comp = ast.comprehension(target=target, iter=expr, ifs=ifs, is_async=is_async)
         if isinstance(left, GenComp):
             left.generators.append(comp)
@@ -226,7 +247,7 @@ class TokLambda(TokBase):
     def nud(cls, p, t):
         arg_spec = p.require_typedargslist(True)
         p.expect(":")
-        body = p.expr(10)
+        body = yield 10
         node = ast.Lambda(args=arg_spec, body=body)
         return node
 
@@ -234,9 +255,9 @@ class TokIf(TokBase):
     lbp = 20
     @classmethod
     def led(cls, p, left, t):
-        cond = p.expr(20)
+        cond = yield 20
         p.expect("else")
-        orelse = p.expr(19)
+        orelse = yield 19
         node = ast.IfExp(test=cond, body=left, orelse=orelse)
         return node
 
@@ -291,7 +312,7 @@ class TokIs(TokInfix):
         op = ast.Is
         if p.match("not"):
             op = ast.IsNot
-        right = p.expr(cls.lbp)
+        right = yield cls.lbp
         node = cls.bin_op(op, left, right)
         return node
 
@@ -337,7 +358,7 @@ class TokMul(TokInfix):
 
     @classmethod
     def nud(cls, p, t):
-        value = p.expr(160 - 1)
+        value = yield 160 - 1
         return ast.Starred(value=value, ctx=ast.Load())
 
 class TokMatMul(TokInfix):
@@ -368,7 +389,7 @@ class TokAwait(TokPrefix):
     #nbp = 150
     @classmethod
     def nud(cls, p, t):
-        value = p.expr(150)
+        value = yield 150
         return ast.Await(value=value)
 
 class TokDot(TokBase):
@@ -376,7 +397,7 @@ class TokDot(TokBase):
     @classmethod
     def led(cls, p, left, t):
         attr = p.expect(NAME)
-        node = ast.Attribute(value=left, attr=attr, ctx=ast.Load())
+        node = ast.Attribute(value=left, attr=attr, ctx=ast.Load(), lineno=t.start)
         return node
 
 class TokOpenSquare(TokBase):
@@ -386,12 +407,12 @@ class TokOpenSquare(TokBase):
         dims = []
         rbp = 0
         while True:
-            idx = p.match_expr(rbp=rbp)
+            idx = yield from p.match_expr_steps(rbp=rbp)
             if p.match(":"):
-                upper = p.match_expr(rbp=BP_UNTIL_COMMA)
+                upper = yield from p.match_expr_steps(rbp=BP_UNTIL_COMMA)
                 step = None
                 if p.match(":"):
-                    step = p.match_expr(rbp=BP_UNTIL_COMMA)
+                    step = yield from p.match_expr_steps(rbp=BP_UNTIL_COMMA)
                 slc = ast.Slice(lower=idx, upper=upper, step=step)
             else:
                 slc = ast.Index(value=idx)
@@ -410,7 +431,7 @@ class TokOpenSquare(TokBase):
     def nud(cls, p, t):
         elts = []
         while not p.match("]"):
-            val = p.expr(BP_UNTIL_COMMA)
+            val = yield BP_UNTIL_COMMA
             if isinstance(val, GenComp):
                 p.expect("]")
                 return ast.ListComp(
@@ -432,13 +453,13 @@ class TokOpenBrace(TokBase):
         while not p.match("}"):
             if p.match("**"):
                 is_dict = True
-                v = p.expr(BP_UNTIL_COMMA)
+                v = yield BP_UNTIL_COMMA
                 keys.append(None)
                 vals.append(v)
                 p.match(",")
                 continue
 
-            k = p.expr(BP_UNTIL_COMMA)
+            k = yield BP_UNTIL_COMMA
             if isinstance(k, GenComp):
                 p.expect("}")
                 return ast.SetComp(
@@ -450,7 +471,7 @@ class TokOpenBrace(TokBase):
                 is_dict = bool(p.check(":"))
             if is_dict:
                 p.expect(":")
-                v = p.expr(BP_UNTIL_COMMA)
+                v = yield BP_UNTIL_COMMA
                 if isinstance(v, GenComp):
                     p.expect("}")
                     return ast.DictComp(
@@ -469,7 +490,7 @@ class TokOpenParens(TokBase):
     lbp = 160
     @classmethod
     def led(cls, p, left, t):
-        args, keywords = p.match_call_args()
+        args, keywords = yield from p.call_args_steps()
         node = ast.Call(func=left, args=args, keywords=keywords)
         return node
 
@@ -479,7 +500,7 @@ class TokOpenParens(TokBase):
         if p.match(")"):
             # Empty tuple
             return ast.Tuple(elts=[], ctx=ast.Load())
-        e = p.expr()
+        e = yield 0
         p.expect(")")
         e.parenform = True
         if isinstance(e, GenComp):
@@ -501,11 +522,19 @@ class TokNumber(TokBase):
 
 class TokString(TokBase):
     lbp = 200
+    # f-strings are not parsed into JoinedStr: they come out as Str, with
+    # the source text of the literal(s) kept in .raw so it can be written
+    # back as is.
     # Adjacent strings
     @classmethod
     def led(cls, p, left, t):
         assert isinstance(left, (ast.Str, ast.Bytes))
+        raw = getattr(left, "raw", None)
+        if raw is None and t.string.startswith("f"):
+            raw = left.raw = [repr(left.s)]
         left.s += literal_eval(t.string)
+        if raw is not None:
+            raw.append(t.string)
         return left
 
     @classmethod
@@ -513,13 +542,15 @@ class TokString(TokBase):
         v = literal_eval(t.string)
         if isinstance(v, bytes):
             return ast.Bytes(s=v)
+        elif t.string.startswith("f"):
+            return ast.Str(s=v, raw=[t.string])
         else:
             return ast.Str(s=v)
 
 class TokName(TokBase):
     @classmethod
     def nud(cls, p, t):
-        return ast.Name(id=t[TOK_STRING], ctx=ast.Load())
+        return ast.Name(id=t[TOK_STRING], ctx=ast.Load(), lineno=t.start)
 
 class TokConst(TokBase):
     @classmethod
@@ -604,23 +635,24 @@ class Parser:
 
     def error(self, msg="syntax error"):
         sys.stderr.write("<input>:%d: error: %s\n" % (self.tok.start, msg))
-        raise Exception
+        raise ParseError(msg, self.tok.start)
 
-    # Recursively set "lvalue" node access context (to other value than
-    # default ast.Load).
+    # Set "lvalue" node access context (to other value than default
+    # ast.Load) on a whole target tree.
     @staticmethod
     def set_ctx(t, ctx):
-        if isinstance(t, list):
-            for e in t:
-                Parser.set_ctx(e, ctx)
-        elif isinstance(t, ast.AST):
-            t.ctx = ctx
-            if isinstance(t, ast.Subscript):
-                return
-            for k in t._fields:
-                v = getattr(t, k, None)
-                if not (isinstance(t, ast.Attribute) and k == "value"):
-                    Parser.set_ctx(v, ctx)
+        stack = [t]
+        while stack:
+            t = stack.pop()
+            if isinstance(t, list):
+                stack.extend(t)
+            elif isinstance(t, ast.AST):
+                t.ctx = ctx
+                if isinstance(t, ast.Subscript):
+                    continue
+                for k in t._fields:
+                    if not (isinstance(t, ast.Attribute) and k == "value"):
+                        stack.append(getattr(t, k, None))
 
     def check(self, what):
         if isinstance(what, str):
@@ -871,6 +903,7 @@ class Parser:
             return self.match_simple_stmt()
 
     def match_import_stmt(self):
+        lineno = self.tok.start
         if self.match("import"):
             names = []
             while True:
@@ -881,7 +914,7 @@ class Parser:
                 names.append(ast.alias(name=name, asname=asname))
                 if not self.match(","):
                     break
-            return ast.Import(names=names)
+            return ast.Import(names=names, lineno=lineno)
         elif self.match("from"):
             level = 0
             while True:
@@ -914,7 +947,7 @@ class Parser:
                         break
                 if is_paren:
                     self.match(")")
-            return ast.ImportFrom(module=module, names=names, level=level)
+            return ast.ImportFrom(module=module, names=names, level=level, lineno=lineno)
 
     def match_if_stmt(self):
 
@@ -1039,28 +1072,60 @@ class Parser:
         return TokName
 
     def expr(self, rbp=0):
+        return self.run(self.expr_steps(rbp))
+
+    # Pratt loop for one expression. Unlike the nud()/led() generators it
+    # drives, this yields its result (any non-int) instead of returning it,
+    # which saves run() a StopIteration per sub-expression.
+    def expr_steps(self, rbp=0):
         t = self.tok
         self.next()
-        cls_nud = self.get_token_class(t)
-        left = cls_nud.nud(self, t)
+        left = self.get_token_class(t).nud(self, t)
+        if type(left) is _gen_type:
+            left = yield from left
         t = self.tok
         cls_led = self.get_token_class(t)
         while rbp < cls_led.lbp:
             self.next()
             left = cls_led.led(self, left, t)
+            if type(left) is _gen_type:
+                left = yield from left
             t = self.tok
             cls_led = self.get_token_class(t)
-        return left
+        yield left
+
+    # Runs a generator from the nud()/led() family to completion: every
+    # int it yields is answered with the expression parsed at that binding
+    # power, using an explicit stack of pending expr_steps() instead of
+    # recursion.
+    def run(self, steps):
+        stack = [steps]
+        val = None
+        while True:
+            try:
+                val = stack[-1].send(val)
+            except StopIteration as e:
+                # Only the root can return, expr_steps() yields its result
+                return e.value
+            if type(val) is int:
+                stack.append(self.expr_steps(val))
+                val = None
+            else:
+                stack.pop()
+                if not stack:
+                    return val
 
-    def match_expr(self, ctx=None, rbp=0):
+    def match_expr_steps(self, rbp=0):
         # Adhoc, consider making suitable TokDelim.nud() return None
         if self.is_delim():
             return None
         if rbp >= BP_UNTIL_COMMA and self.check(","):
             return None
+        return (yield rbp)
 
-        n = self.expr(rbp)
-        if ctx:
+    def match_expr(self, ctx=None, rbp=0):
+        n = self.run(self.match_expr_steps(rbp))
+        if ctx and n is not None:
             self.set_ctx(n, ctx())
         return n
 
@@ -1146,6 +1211,9 @@ class Parser:
         return arg_spec
 
     def match_call_args(self):
+        return self.run(self.call_args_steps())
+
+    def call_args_steps(self):
         args = []
         keywords = []
         if not self.check(")"):
@@ -1155,12 +1223,12 @@ class Parser:
                     starred = "*"
                 elif self.match("**"):
                     starred = "**"
-                arg = self.expr(BP_UNTIL_COMMA)
+                arg = yield BP_UNTIL_COMMA
                 if isinstance(arg, GenComp):
                     arg = ast.GeneratorExp(elt=arg.elt, generators=arg.generators)
                 if self.match("="):
                     assert isinstance(arg, ast.Name)
-                    val = self.expr(BP_UNTIL_COMMA)
+                    val = yield BP_UNTIL_COMMA
                     keywords.append(ast.keyword(arg=arg.id, value=val))
                 else:
                     if starred == "**":
@@ -0,0 +1,351 @@
+# Compact binary encoding of ast.types trees, and a parse cache using it.
+#
+# Layout, all integers are unsigned LEB128 varints:
+#
+#   b"AST" version
+#   n_strings, then n_strings x (length, utf-8 bytes)
+#   one value
+#
+# A value starts with a tag byte. Nodes are NODE + their index in KINDS,
+# followed, unless the class has no fields, by lineno + 1 (0 if unset), a
+# bit mask of the EXTRAS the node has, each field in _fields order, and then
+# those extras in EXTRAS order. Lists are a count and the items. Every
+# str is an index into the string table, so identifiers repeated all over
+# a module are stored once - the same idea as the qstr table of a .mpy.
+#
+# Both directions work from an explicit stack, so tree depth does not
+# matter any more than it does to the parser.
+
+import struct
+from . import types as ast
+
+VERSION = 2
+
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_FLOAT = 4
+T_STR = 5
+T_BYTES = 6
+T_LIST = 7
+T_COMPLEX = 8
+NODE = 16
+
+# Node classes by their kind index. Append only: reordering changes the
+# format and needs a VERSION bump.
+KINDS = (
+    "Module", "Interactive", "Expression", "Suite",
+    "FunctionDef", "AsyncFunctionDef", "ClassDef", "Return", "Delete",
+    "Assign", "AugAssign", "AnnAssign", "For", "AsyncFor", "While", "If",
+    "With", "AsyncWith", "Raise", "Try", "Assert", "Import", "ImportFrom",
+    "Global", "Nonlocal", "Expr", "Pass", "Break", "Continue",
+    "BoolOp", "BinOp", "UnaryOp", "Lambda", "IfExp", "Dict", "Set",
+    "ListComp", "SetComp", "DictComp", "GeneratorExp", "Await", "Yield",
+    "YieldFrom", "Compare", "Call", "Num", "Str", "FormattedValue",
+    "JoinedStr", "Bytes", "NameConstant", "Ellipsis", "Constant",
+    "Attribute", "Subscript", "Starred", "Name", "List", "Tuple",
+    "Load", "Store", "StoreConst", "Del", "AugLoad", "AugStore", "Param",
+    "Slice", "ExtSlice", "Index",
+    "And", "Or",
+    "Add", "Sub", "Mult", "MatMult", "Div", "Mod", "Pow", "LShift",
+    "RShift", "BitOr", "BitXor", "BitAnd", "FloorDiv",
+    "Invert", "Not", "UAdd", "USub",
+    "Eq", "NotEq", "Lt", "LtE", "Gt", "GtE", "Is", "IsNot", "In", "NotIn",
+    "comprehension", "ExceptHandler", "arguments", "arg", "keyword",
+    "alias", "withitem",
+)
+
+# Attributes the parser sets beyond _fields, which unparsing relies on:
+# the source text of f-strings, and whether an expression was written in
+# parentheses. Append only, like KINDS.
+EXTRAS = ("raw", "parenform")
+
+_classes = [getattr(ast, n) for n in KINDS]
+_kind_of = {}
+for _i, _c in enumerate(_classes):
+    _kind_of[_c] = _i
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _uint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def dumps(tree):
+    body = bytearray()
+    strings = {}
+    todo = [tree]
+    while todo:
+        v = todo.pop()
+        if v is None:
+            body.append(T_NONE)
+        elif v is True:
+            body.append(T_TRUE)
+        elif v is False:
+            body.append(T_FALSE)
+        elif isinstance(v, ast.AST):
+            cls = v.__class__
+            kind = _kind_of.get(cls)
+            if kind is None:
+                raise TypeError("cannot serialize %s" % cls.__name__)
+            _uint(body, NODE + kind)
+            fields = cls._fields
+            if fields:
+                _uint(body, getattr(v, "lineno", -1) + 1)
+                mask = 0
+                for i in range(len(EXTRAS) - 1, -1, -1):
+                    x = getattr(v, EXTRAS[i], None)
+                    if x is not None:
+                        mask |= 1 << i
+                        todo.append(x)
+                _uint(body, mask)
+                for f in reversed(fields):
+                    todo.append(getattr(v, f, None))
+        elif isinstance(v, str):
+            i = strings.get(v)
+            if i is None:
+                i = strings[v] = len(strings)
+            body.append(T_STR)
+            _uint(body, i)
+        elif isinstance(v, int):
+            body.append(T_INT)
+            _uint(body, v * 2 if v >= 0 else -v * 2 - 1)
+        elif isinstance(v, float):
+            body.append(T_FLOAT)
+            body.extend(struct.pack("<d", v))
+        elif isinstance(v, complex):
+            body.append(T_COMPLEX)
+            body.extend(struct.pack("<dd", v.real, v.imag))
+        elif isinstance(v, bytes):
+            body.append(T_BYTES)
+            _uint(body, len(v))
+            body.extend(v)
+        elif isinstance(v, list):
+            body.append(T_LIST)
+            _uint(body, len(v))
+            for i in range(len(v) - 1, -1, -1):
+                todo.append(v[i])
+        else:
+            raise TypeError("cannot serialize %r" % (v,))
+
+    out = bytearray(b"AST")
+    out.append(VERSION)
+    table = [None] * len(strings)
+    for s, i in strings.items():
+        table[i] = s
+    _uint(out, len(table))
+    for s in table:
+        b = s.encode()
+        _uint(out, len(b))
+        out.extend(b)
+    out.extend(body)
+    return bytes(out)
+
+
+def dump(tree, f):
+    f.write(dumps(tree))
+
+
+def loads(data):
+    data = memoryview(data)
+    if len(data) < 4 or bytes(data[:3]) != b"AST" or data[3] != VERSION:
+        raise FormatError("not a serialized AST, or another version")
+    pos = 4
+
+    def uint():
+        nonlocal pos
+        n = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    table = []
+    for _ in range(uint()):
+        n = uint()
+        table.append(str(data[pos:pos + n], "utf-8"))
+        pos += n
+
+    # Frames of partly read containers: [node class or None for a list,
+    # lineno, values read so far, how many are expected, mask of EXTRAS]
+    stack = []
+    while True:
+        tag = uint()
+        if tag >= NODE:
+            cls = _classes[tag - NODE]
+            fields = cls._fields
+            if fields:
+                lineno = uint() - 1
+                mask = uint()
+                stack.append([cls, lineno, [], len(fields) + bin(mask).count("1"), mask])
+                continue
+            v = cls()
+        elif tag == T_LIST:
+            n = uint()
+            if n:
+                stack.append([None, 0, [], n, 0])
+                continue
+            v = []
+        elif tag == T_STR:
+            v = table[uint()]
+        elif tag == T_INT:
+            n = uint()
+            v = -(n >> 1) - 1 if n & 1 else n >> 1
+        elif tag == T_NONE:
+            v = None
+        elif tag == T_TRUE:
+            v = True
+        elif tag == T_FALSE:
+            v = False
+        elif tag == T_FLOAT:
+            v = struct.unpack_from("<d", data, pos)[0]
+            pos += 8
+        elif tag == T_COMPLEX:
+            re, im = struct.unpack_from("<dd", data, pos)
+            v = complex(re, im)
+            pos += 16
+        elif tag == T_BYTES:
+            n = uint()
+            v = bytes(data[pos:pos + n])
+            pos += n
+        else:
+            raise FormatError("bad tag %d at %d" % (tag, pos - 1))
+
+        # Hand the value to its container, completing as many as it fills
+        while stack:
+            top = stack[-1]
+            vals = top[2]
+            vals.append(v)
+            if len(vals) < top[3]:
+                break
+            stack.pop()
+            cls = top[0]
+            if cls is None:
+                v = vals
+                continue
+            kw = {}
+            fields = cls._fields
+            for i, f in enumerate(fields):
+                kw[f] = vals[i]
+            v = cls(**kw)
+            if top[1] >= 0:
+                v.lineno = top[1]
+            i = len(fields)
+            for bit, name in enumerate(EXTRAS):
+                if top[4] & (1 << bit):
+                    setattr(v, name, vals[i])
+                    i += 1
+        else:
+            return v
+
+
+def load(f):
+    return loads(f.read())
+
+
+class ParseCache:
+    # Parsed modules kept as serialized files under `path`, keyed by the
+    # hash of their source, with least recently used ones evicted past
+    # max_entries or max_bytes. The LRU order itself lives in path/index.
+    # Each parse() reads its tree back anew, so callers are free to change
+    # the tree they get.
+
+    def __init__(self, path="/tmp/ast_cache", max_entries=64, max_bytes=4 * 1024 * 1024):
+        import os
+        self.os = os
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+        # [[hash, size], ...], most recently used last
+        self.lru = []
+        try:
+            with open(path + "/index") as f:
+                for line in f:
+                    h, size = line.split()
+                    self.lru.append([h, int(size)])
+        except (OSError, ValueError):
+            self.lru = []
+
+    @staticmethod
+    def key(source):
+        import hashlib
+        from binascii import hexlify
+        if isinstance(source, str):
+            source = source.encode()
+        return str(hexlify(hashlib.sha256(source).digest()[:16]), "ascii")
+
+    def _save_index(self):
+        with open(self.path + "/index", "w") as f:
+            for h, size in self.lru:
+                f.write("%s %d\n" % (h, size))
+
+    def _touch(self, h, size):
+        for i, e in enumerate(self.lru):
+            if e[0] == h:
+                del self.lru[i]
+                break
+        self.lru.append([h, size])
+        total = 0
+        for e in self.lru:
+            total += e[1]
+        while self.lru and (len(self.lru) > self.max_entries or total > self.max_bytes):
+            old, old_size = self.lru.pop(0)
+            total -= old_size
+            try:
+                self.os.remove("%s/%s.ast" % (self.path, old))
+            except OSError:
+                pass
+        self._save_index()
+
+    def parse(self, source, filename="<unknown>"):
+        h = self.key(source)
+        fn = "%s/%s.ast" % (self.path, h)
+        try:
+            with open(fn, "rb") as f:
+                data = f.read()
+            tree = loads(data)
+        except (OSError, FormatError):
+            tree = None
+        if tree is not None:
+            self.hits += 1
+            self._touch(h, len(data))
+            return tree
+        self.misses += 1
+        from . import parse
+        if isinstance(source, bytes):
+            source = str(source, "utf-8")
+        tree = parse(source, filename)
+        data = dumps(tree)
+        with open(fn, "wb") as f:
+            f.write(data)
+        self._touch(h, len(data))
+        return tree
+
+
+_cache = None
+
+
+# ast.parse(), through the ParseCache the tools of this VM share: the
+# symbol index, the optimizer and the minifier all parse the same files
+def cached_parse(source, filename="<unknown>"):
+    global _cache
+    if _cache is None:
+        _cache = ParseCache()
+    return _cache.parse(source, filename)
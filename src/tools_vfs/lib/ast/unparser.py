@@ -0,0 +1,616 @@
+# Turns ast.types trees back into source code.
+#
+# Statements are written recursively (their nesting is bounded by
+# indentation anyway), expressions from an explicit stack of pending
+# pieces, so long operator chains and deeply nested data do not recurse.
+#
+# With keep_lines, blank lines are inserted so that statements whose
+# source line is known land on that line again, keeping line numbers in
+# tracebacks meaningful after a round trip.
+#
+# With compact, the output is as short as the syntax allows: no spaces
+# around symbols, and simple statements joined with ";", onto the header
+# of their block too when the whole block is simple.
+
+from . import types as ast
+
+# Operator precedence, loosest binding first
+P_TUPLE = 1
+P_YIELD = 2
+P_TEST = 3
+P_OR = 4
+P_AND = 5
+P_NOT = 6
+P_CMP = 7
+P_BOR = 8
+P_BXOR = 9
+P_BAND = 10
+P_SHIFT = 11
+P_ARITH = 12
+P_TERM = 13
+P_FACTOR = 14
+P_POWER = 15
+P_AWAIT = 16
+P_ATOM = 17
+
+_binops = {
+    ast.Add: ("+", P_ARITH), ast.Sub: ("-", P_ARITH),
+    ast.Mult: ("*", P_TERM), ast.MatMult: ("@", P_TERM), ast.Div: ("/", P_TERM),
+    ast.FloorDiv: ("//", P_TERM), ast.Mod: ("%", P_TERM),
+    ast.Pow: ("**", P_POWER),
+    ast.LShift: ("<<", P_SHIFT), ast.RShift: (">>", P_SHIFT),
+    ast.BitOr: ("|", P_BOR), ast.BitXor: ("^", P_BXOR), ast.BitAnd: ("&", P_BAND),
+}
+
+_unops = {
+    ast.Not: ("not ", P_NOT), ast.Invert: ("~", P_FACTOR),
+    ast.UAdd: ("+", P_FACTOR), ast.USub: ("-", P_FACTOR),
+}
+
+_cmpops = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">",
+    ast.GtE: ">=", ast.Is: "is", ast.IsNot: "is not", ast.In: "in",
+    ast.NotIn: "not in",
+}
+
+_augops = {
+    ast.Add: "+=", ast.Sub: "-=", ast.Mult: "*=", ast.MatMult: "@=",
+    ast.Div: "/=", ast.FloorDiv: "//=", ast.Mod: "%=", ast.Pow: "**=",
+    ast.LShift: "<<=", ast.RShift: ">>=", ast.BitOr: "|=", ast.BitXor: "^=",
+    ast.BitAnd: "&=",
+}
+
+# Fields holding nested statements, skipped when looking for the line a
+# compound statement starts on
+_BLOCK_FIELDS = ("body", "orelse", "handlers", "finalbody")
+
+_COMPOUND = (
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For, ast.AsyncFor,
+    ast.While, ast.If, ast.With, ast.AsyncWith, ast.Try,
+)
+
+
+def _num(n):
+    if isinstance(n, float):
+        if n != n:
+            return "(1e999-1e999)"
+        if n in (1e999, -1e999):
+            return "1e999" if n > 0 else "-1e999"
+    return repr(n)
+
+
+class Unparser:
+
+    def __init__(self, indent="    ", keep_lines=False, compact=False):
+        self.indent = indent
+        self.keep_lines = keep_lines
+        self.compact = compact
+        if compact:
+            self.comma, self.colon, self.eq, self.semi = ",", ":", "=", ";"
+        else:
+            self.comma, self.colon, self.eq, self.semi = ", ", ": ", " = ", "; "
+        self.lines = []
+        # Physical lines so far: a line may hold a multi-line f-string
+        self.lineno = 0
+        self.level = 0
+
+    def result(self):
+        self.lines.append("")
+        return "\n".join(self.lines)
+
+    def line(self, text, node=None, target=None):
+        if self.keep_lines and (node is not None or target):
+            if target is None:
+                target = _stmt_line(node)
+            if target:
+                while self.lineno < target - 1:
+                    self.lines.append("")
+                    self.lineno += 1
+        if self.keep_lines:
+            self.lineno += 1 + text.count("\n")
+        self.lines.append(self.indent * self.level + text)
+
+    def block(self, stmts):
+        self.level += 1
+        if not stmts:
+            self.line("pass")
+        elif self.compact and not self.keep_lines \
+                and not any(isinstance(s, _COMPOUND) for s in stmts):
+            # body() puts them all on one line, which goes on the header's
+            self.body(stmts)
+            s = self.lines.pop()
+            self.lines[-1] += s.lstrip()
+        elif self.keep_lines and len(stmts) == 1 and not isinstance(stmts[0], _COMPOUND) \
+                and _stmt_line(stmts[0]) in (None, self.lineno):
+            # "if x: return y" stays on one line, or everything after it
+            # would be a line late. Being early is fine, later statements
+            # are padded back to their line.
+            self.stmt(stmts[0])
+            s = self.lines.pop()
+            self.lines[-1] += " " + s.lstrip()
+            self.lineno -= 1
+        else:
+            self.body(stmts)
+        self.level -= 1
+
+    def body(self, stmts):
+        prev_simple = False
+        for s in stmts:
+            simple = not isinstance(s, _COMPOUND)
+            if simple and prev_simple and (
+                    self.keep_lines and _stmt_line(s) is None
+                    or self.compact and not self.keep_lines):
+                # Statements with no line of their own (e.g. added by the
+                # optimizer) share the previous one
+                self.stmt(s)
+                text = self.lines.pop()
+                self.lines[-1] += self.semi + text.lstrip()
+                if self.keep_lines:
+                    self.lineno -= 1
+            else:
+                self.stmt(s)
+            prev_simple = simple
+
+    # Expressions
+
+    def expr(self, node, prec=P_TUPLE):
+        out = []
+        todo = [(node, prec)]
+        while todo:
+            v = todo.pop()
+            if isinstance(v, str):
+                out.append(v)
+                continue
+            parts = self.expr_parts(v[0], v[1])
+            for i in range(len(parts) - 1, -1, -1):
+                todo.append(parts[i])
+        return "".join(out)
+
+    # Precedence for a place taking a bare tuple, where a yield still
+    # needs its parentheses
+    @staticmethod
+    def tuple_prec(node):
+        return P_TEST if isinstance(node, (ast.Yield, ast.YieldFrom)) else P_TUPLE
+
+    # The pieces node is written as: strings, and (node, precedence) pairs
+    # for sub-expressions, parenthesized when their own precedence is lower.
+    def expr_parts(self, node, prec):
+        m = getattr(self, "x_" + node.__class__.__name__, None)
+        if m is None:
+            raise ValueError("cannot unparse %s" % node.__class__.__name__)
+        own, parts = m(node)
+        if own < prec:
+            return ["("] + parts + [")"]
+        return parts
+
+    def binop(self, op):
+        # Word operators ("in", "is not") always need their spaces
+        if self.compact and not op[-1].isalpha():
+            return op
+        return " %s " % op
+
+    def seq(self, parts, nodes, prec=P_TEST, sep=None):
+        if sep is None:
+            sep = self.comma
+        for i, n in enumerate(nodes):
+            if i:
+                parts.append(sep)
+            parts.append((n, prec))
+        return parts
+
+    def x_Name(self, node):
+        return P_ATOM, [node.id]
+
+    def x_Num(self, node):
+        n = node.n
+        # A negative literal is really a unary minus
+        if not isinstance(n, complex) and n < 0:
+            return P_FACTOR, [_num(n)]
+        return P_ATOM, [_num(n)]
+
+    def x_Str(self, node):
+        raw = getattr(node, "raw", None)
+        if raw is not None:
+            return P_ATOM, [" ".join(raw)]
+        return P_ATOM, [repr(node.s)]
+
+    def x_Bytes(self, node):
+        return P_ATOM, [repr(node.s)]
+
+    def x_NameConstant(self, node):
+        return P_ATOM, [repr(node.value)]
+
+    def x_Constant(self, node):
+        v = node.value
+        if isinstance(v, (int, float)) and not isinstance(v, bool) and v < 0:
+            return P_FACTOR, [_num(v)]
+        if v is ...:
+            return P_ATOM, ["..."]
+        return P_ATOM, [_num(v) if isinstance(v, float) else repr(v)]
+
+    def x_Ellipsis(self, node):
+        return P_ATOM, ["..."]
+
+    def x_Tuple(self, node):
+        elts = node.elts
+        if not elts:
+            return P_ATOM, ["()"]
+        parts = self.seq([], elts)
+        if len(elts) == 1:
+            parts.append(",")
+        return P_TUPLE, parts
+
+    def x_List(self, node):
+        return P_ATOM, self.seq(["["], node.elts) + ["]"]
+
+    def x_Set(self, node):
+        if not node.elts:
+            return P_ATOM, ["{*()}"]
+        return P_ATOM, self.seq(["{"], node.elts) + ["}"]
+
+    def x_Dict(self, node):
+        parts = ["{"]
+        for i, k in enumerate(node.keys):
+            if i:
+                parts.append(self.comma)
+            if k is None:
+                parts += ["**", (node.values[i], P_BOR)]
+            else:
+                parts += [(k, P_TEST), self.colon, (node.values[i], P_TEST)]
+        parts.append("}")
+        return P_ATOM, parts
+
+    def comprehensions(self, parts, generators):
+        for g in generators:
+            parts.append(" async for " if g.is_async else " for ")
+            parts += [(g.target, P_TUPLE), " in ", (g.iter, P_TEST + 1)]
+            for cond in g.ifs:
+                parts += [" if ", (cond, P_TEST + 1)]
+        return parts
+
+    def x_ListComp(self, node):
+        return P_ATOM, self.comprehensions(["[", (node.elt, P_TEST)], node.generators) + ["]"]
+
+    def x_SetComp(self, node):
+        return P_ATOM, self.comprehensions(["{", (node.elt, P_TEST)], node.generators) + ["}"]
+
+    def x_DictComp(self, node):
+        parts = ["{", (node.key, P_TEST), self.colon, (node.value, P_TEST)]
+        return P_ATOM, self.comprehensions(parts, node.generators) + ["}"]
+
+    def x_GeneratorExp(self, node):
+        return P_ATOM, self.comprehensions(["(", (node.elt, P_TEST)], node.generators) + [")"]
+
+    def x_BinOp(self, node):
+        op, p = _binops[node.op.__class__]
+        if p == P_POWER:
+            # Right associative
+            return p, [(node.left, p + 1), " ** ", (node.right, P_FACTOR)]
+        return p, [(node.left, p), self.binop(op), (node.right, p + 1)]
+
+    def x_UnaryOp(self, node):
+        op, p = _unops[node.op.__class__]
+        return p, [op, (node.operand, p)]
+
+    def x_BoolOp(self, node):
+        if isinstance(node.op, ast.And):
+            p, sep = P_AND, " and "
+        else:
+            p, sep = P_OR, " or "
+        return p, self.seq([], node.values, p + 1, sep)
+
+    def x_Compare(self, node):
+        parts = [(node.left, P_CMP + 1)]
+        for i, op in enumerate(node.ops):
+            parts += [self.binop(_cmpops[op.__class__]), (node.comparators[i], P_CMP + 1)]
+        return P_CMP, parts
+
+    def x_IfExp(self, node):
+        return P_TEST, [(node.body, P_TEST + 1), " if ", (node.test, P_TEST + 1),
+                        " else ", (node.orelse, P_TEST)]
+
+    def x_Lambda(self, node):
+        args = self.arguments(node.args)
+        return P_TEST, ["lambda " + args + self.colon if args else "lambda" + self.colon, (node.body, P_TEST)]
+
+    def x_Yield(self, node):
+        if node.value is None:
+            return P_YIELD, ["yield"]
+        return P_YIELD, ["yield ", (node.value, self.tuple_prec(node.value))]
+
+    def x_YieldFrom(self, node):
+        return P_YIELD, ["yield from ", (node.value, P_TEST)]
+
+    def x_Await(self, node):
+        return P_AWAIT, ["await ", (node.value, P_ATOM)]
+
+    def x_Starred(self, node):
+        return P_BOR, ["*", (node.value, P_BOR)]
+
+    def x_Attribute(self, node):
+        v = node.value
+        # "1.real" would be read as a float
+        if isinstance(v, ast.Num) and isinstance(v.n, int):
+            return P_ATOM, ["(", (v, P_TUPLE), ")." + node.attr]
+        return P_ATOM, [(v, P_ATOM), "." + node.attr]
+
+    def x_Call(self, node):
+        parts = [(node.func, P_ATOM), "("]
+        self.seq(parts, node.args)
+        for i, kw in enumerate(node.keywords):
+            if i or node.args:
+                parts.append(self.comma)
+            if kw.arg is None:
+                parts += ["**", (kw.value, P_BOR)]
+            else:
+                parts += [kw.arg + "=", (kw.value, P_TEST)]
+        parts.append(")")
+        return P_ATOM, parts
+
+    def x_Subscript(self, node):
+        return P_ATOM, [(node.value, P_ATOM), "["] + self.slice(node.slice) + ["]"]
+
+    def slice(self, s):
+        if isinstance(s, ast.Index):
+            v = s.value
+            # A tuple index reads fine without its parentheses
+            if isinstance(v, ast.Tuple) and v.elts:
+                parts = self.seq([], v.elts)
+                if len(v.elts) == 1:
+                    parts.append(",")
+                return parts
+            return [(v, self.tuple_prec(v))]
+        if isinstance(s, ast.Slice):
+            parts = []
+            if s.lower is not None:
+                parts.append((s.lower, P_TEST))
+            parts.append(":")
+            if s.upper is not None:
+                parts.append((s.upper, P_TEST))
+            if s.step is not None:
+                parts += [":", (s.step, P_TEST)]
+            return parts
+        if isinstance(s, ast.ExtSlice):
+            parts = []
+            for i, d in enumerate(s.dims):
+                if i:
+                    parts.append(self.comma)
+                parts += self.slice(d)
+            return parts
+        # Python 3.9+ style trees put the expression right in .slice
+        return [(s, P_TUPLE)]
+
+    def arguments(self, a):
+        res = []
+        n_plain = len(a.args) - len(a.defaults)
+        for i, arg in enumerate(a.args):
+            s = self.arg(arg)
+            if i >= n_plain:
+                s += ("=" if arg.annotation is None else " = ") + self.expr(a.defaults[i - n_plain], P_TEST)
+            res.append(s)
+        if a.vararg:
+            res.append("*" + self.arg(a.vararg))
+        elif a.kwonlyargs:
+            res.append("*")
+        for i, arg in enumerate(a.kwonlyargs):
+            s = self.arg(arg)
+            d = a.kw_defaults[i] if i < len(a.kw_defaults) else None
+            if d is not None:
+                s += ("=" if arg.annotation is None else " = ") + self.expr(d, P_TEST)
+            res.append(s)
+        if a.kwarg:
+            res.append("**" + self.arg(a.kwarg))
+        return self.comma.join(res)
+
+    def arg(self, arg):
+        if arg.annotation is None:
+            return arg.arg
+        return arg.arg + ": " + self.expr(arg.annotation, P_TEST)
+
+    # Statements
+
+    def stmt(self, node):
+        m = getattr(self, "s_" + node.__class__.__name__, None)
+        if m is None:
+            raise ValueError("cannot unparse %s" % node.__class__.__name__)
+        m(node)
+
+    def s_Module(self, node):
+        self.body(node.body)
+
+    s_Interactive = s_Module
+
+    def s_Expression(self, node):
+        self.line(self.expr(node.body))
+
+    def s_Expr(self, node):
+        self.line(self.expr(node.value, P_YIELD), node)
+
+    def s_Pass(self, node):
+        self.line("pass", node)
+
+    def s_Break(self, node):
+        self.line("break", node)
+
+    def s_Continue(self, node):
+        self.line("continue", node)
+
+    def s_Return(self, node):
+        if node.value is None:
+            self.line("return", node)
+        else:
+            self.line("return " + self.expr(node.value, self.tuple_prec(node.value)), node)
+
+    def s_Delete(self, node):
+        self.line("del " + self.comma.join(self.expr(t, P_BOR) for t in node.targets), node)
+
+    def s_Assign(self, node):
+        targets = "".join(self.expr(t) + self.eq for t in node.targets)
+        self.line(targets + self.expr(node.value, P_YIELD), node)
+
+    def s_AugAssign(self, node):
+        self.line(self.expr(node.target) + self.binop(_augops[node.op.__class__])
+                  + self.expr(node.value, P_YIELD), node)
+
+    def s_AnnAssign(self, node):
+        s = self.expr(node.target) + ": " + self.expr(node.annotation, P_TEST)
+        if node.value is not None:
+            s += self.eq + self.expr(node.value, P_YIELD)
+        self.line(s, node)
+
+    def s_Raise(self, node):
+        s = "raise"
+        if node.exc is not None:
+            s += " " + self.expr(node.exc, P_TEST)
+            if node.cause is not None:
+                s += " from " + self.expr(node.cause, P_TEST)
+        self.line(s, node)
+
+    def s_Assert(self, node):
+        s = "assert " + self.expr(node.test, P_TEST)
+        if node.msg is not None:
+            s += self.comma + self.expr(node.msg, P_TEST)
+        self.line(s, node)
+
+    def s_Global(self, node):
+        self.line("global " + self.comma.join(node.names), node)
+
+    def s_Nonlocal(self, node):
+        self.line("nonlocal " + self.comma.join(node.names), node)
+
+    def alias(self, a):
+        return a.name + (" as " + a.asname if a.asname else "")
+
+    def s_Import(self, node):
+        self.line("import " + self.comma.join(self.alias(a) for a in node.names), node)
+
+    def s_ImportFrom(self, node):
+        self.line("from %s%s import %s" % (
+            "." * (node.level or 0), node.module or "",
+            self.comma.join(self.alias(a) for a in node.names)
+        ), node)
+
+    def decorators(self, node):
+        # node.lineno is that of the "def" or "class" line
+        decs = node.decorator_list
+        line = getattr(node, "lineno", None)
+        for i, d in enumerate(decs):
+            self.line("@" + self.expr(d, P_TEST), target=line and line - len(decs) + i)
+
+    def s_FunctionDef(self, node, prefix="def "):
+        self.decorators(node)
+        s = prefix + node.name + "(" + self.arguments(node.args) + ")"
+        if node.returns is not None:
+            s += " -> " + self.expr(node.returns, P_TEST)
+        self.line(s + ":", node)
+        self.block(node.body)
+
+    def s_AsyncFunctionDef(self, node):
+        self.s_FunctionDef(node, "async def ")
+
+    def s_ClassDef(self, node):
+        self.decorators(node)
+        parts = [self.expr(b, P_TEST) for b in node.bases]
+        for kw in node.keywords:
+            if kw.arg is None:
+                parts.append("**" + self.expr(kw.value, P_BOR))
+            else:
+                parts.append(kw.arg + "=" + self.expr(kw.value, P_TEST))
+        s = "class " + node.name
+        if parts:
+            s += "(" + self.comma.join(parts) + ")"
+        self.line(s + ":", node)
+        self.block(node.body)
+
+    def orelse(self, node):
+        if node.orelse:
+            self.line("else:")
+            self.block(node.orelse)
+
+    def s_For(self, node, prefix="for "):
+        self.line("%s%s in %s:" % (
+            prefix, self.expr(node.target), self.expr(node.iter, self.tuple_prec(node.iter))
+        ), node)
+        self.block(node.body)
+        self.orelse(node)
+
+    def s_AsyncFor(self, node):
+        self.s_For(node, "async for ")
+
+    def s_While(self, node):
+        self.line("while %s:" % self.expr(node.test, P_TEST), node)
+        self.block(node.body)
+        self.orelse(node)
+
+    def s_If(self, node, prefix="if "):
+        self.line("%s%s:" % (prefix, self.expr(node.test, P_TEST)), node)
+        self.block(node.body)
+        orelse = node.orelse
+        if len(orelse) == 1 and isinstance(orelse[0], ast.If):
+            self.s_If(orelse[0], "elif ")
+        else:
+            self.orelse(node)
+
+    def s_With(self, node, prefix="with "):
+        items = []
+        for it in node.items:
+            s = self.expr(it.context_expr, P_TEST)
+            if it.optional_vars is not None:
+                s += " as " + self.expr(it.optional_vars, P_BOR)
+            items.append(s)
+        self.line(prefix + self.comma.join(items) + ":", node)
+        self.block(node.body)
+
+    def s_AsyncWith(self, node):
+        self.s_With(node, "async with ")
+
+    def s_Try(self, node):
+        self.line("try:", node)
+        self.block(node.body)
+        for h in node.handlers:
+            s = "except"
+            if h.type is not None:
+                s += " " + self.expr(h.type, P_TEST)
+                if h.name:
+                    s += " as " + h.name
+            self.line(s + ":", h)
+            self.block(h.body)
+        self.orelse(node)
+        if node.finalbody:
+            self.line("finally:")
+            self.block(node.finalbody)
+
+
+# First known source line of a statement, not counting nested blocks
+def _stmt_line(node):
+    line = getattr(node, "lineno", None)
+    if line is not None:
+        return line
+    todo = [node]
+    while todo:
+        n = todo.pop()
+        line = getattr(n, "lineno", None)
+        if line is not None:
+            return line
+        for f in reversed(n._fields):
+            if n is node and f in _BLOCK_FIELDS:
+                continue
+            v = getattr(n, f, None)
+            if isinstance(v, ast.AST):
+                todo.append(v)
+            elif isinstance(v, list):
+                for i in range(len(v) - 1, -1, -1):
+                    if isinstance(v[i], ast.AST):
+                        todo.append(v[i])
+    return None
+
+
+def unparse(node, indent="    ", keep_lines=False, compact=False):
+    u = Unparser(indent, keep_lines, compact)
+    if isinstance(node, (ast.stmt, ast.mod)):
+        u.stmt(node)
+        return u.result()
+    if isinstance(node, list):
+        u.body(node)
+        return u.result()
+    return u.expr(node)
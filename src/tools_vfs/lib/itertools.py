@@ -1,5 +1,12 @@
 import builtins
 
+_TEE_CHUNK = 64
+
+# CPython's itertools, as generators. Where an item is a tuple anyway it is
+# built once per item; everything else passes items straight through, and
+# the common cases (islice without a step, accumulate with +, ...) get
+# loops of their own.
+
 
 def count(start=0, step=1):
     while True:
@@ -31,33 +38,130 @@ def repeat(el, n=None):
             yield el
 
 
-def chain(*p):
+def _chain(p):
     for i in p:
         yield from i
 
 
+class chain:
+    # A class only so that chain.from_iterable() exists (MicroPython
+    # functions can't have attributes): what it makes are plain generators
+
+    def __new__(cls, *p):
+        return _chain(p)
+
+    @staticmethod
+    def from_iterable(p):
+        return _chain(p)
+
+
+def compress(data, selectors):
+    for d, s in zip(data, selectors):
+        if s:
+            yield d
+
+
+def dropwhile(predicate, iterable):
+    it = builtins.iter(iterable)
+    for x in it:
+        if not predicate(x):
+            yield x
+            break
+    yield from it
+
+
+def takewhile(predicate, iterable):
+    for x in iterable:
+        if not predicate(x):
+            return
+        yield x
+
+
+def filterfalse(predicate, iterable):
+    if predicate is None:
+        for x in iterable:
+            if not x:
+                yield x
+    else:
+        for x in iterable:
+            if not predicate(x):
+                yield x
+
+
 def islice(p, start, stop=(), step=1):
     if stop == ():
         stop = start
         start = 0
-    # TODO: optimizing or breaking semantics?
-    if start >= stop:
+    if start is None:
+        start = 0
+    if step is None:
+        step = 1
+    if start < 0 or (stop is not None and stop < 0) or step < 1:
+        raise ValueError("invalid islice arguments")
+    if isinstance(p, (list, tuple)):
+        # Nothing to consume: let slicing do the work
+        yield from p[start:stop:step]
         return
     it = builtins.iter(p)
-    for i in range(start):
-        next(it)
+    # Skip to start, then take every step-th item, consuming exactly as
+    # many items from a shared iterator as CPython would
+    i = 0
+    if start:
+        for _ in it:
+            i += 1
+            if i == start:
+                break
+        else:
+            return
+    if stop is not None and start >= stop:
+        return
+    if step == 1:
+        if stop is None:
+            yield from it
+            return
+        n = stop - start
+        for x in it:
+            yield x
+            n -= 1
+            if not n:
+                return
+        return
+    nxt = start
+    for x in it:
+        if i == nxt:
+            yield x
+            nxt += step
+        i += 1
+        if i == stop:
+            return
 
+
+def _tee(it, link):
+    # link is [items, next link]: chunks of up to _TEE_CHUNK items shared by
+    # all the tee'd iterators, so an item is fetched once, stored without
+    # allocating anything for it, and kept only until the slowest one has it
+    i = 0
     while True:
-        yield next(it)
-        for i in range(step - 1):
-            next(it)
-        start += step
-        if start >= stop:
-            return
+        buf = link[0]
+        while i < len(buf):
+            yield buf[i]
+            i += 1
+        if link[1] is None:
+            if len(buf) < _TEE_CHUNK:
+                try:
+                    buf.append(next(it))
+                except StopIteration:
+                    return
+                continue
+            link[1] = [[], None]
+        link = link[1]
+        i = 0
 
 
 def tee(iterable, n=2):
-    return [builtins.iter(iterable)] * n
+    it = builtins.iter(iterable)
+    link = [[], None]
+    return tuple(_tee(it, link) for _ in range(n))
 
 
 def starmap(function, iterable):
@@ -65,16 +169,198 @@ def starmap(function, iterable):
         yield function(*args)
 
 
-def accumulate(iterable, func=lambda x, y: x + y):
+def accumulate(iterable, func=None, *, initial=None):
+    it = builtins.iter(iterable)
+    acc = initial
+    if acc is None:
+        try:
+            acc = next(it)
+        except StopIteration:
+            return
+    yield acc
+    if func is None:
+        for element in it:
+            acc += element
+            yield acc
+    else:
+        for element in it:
+            acc = func(acc, element)
+            yield acc
+
+
+def pairwise(iterable):
     it = builtins.iter(iterable)
     try:
-        acc = next(it)
+        a = next(it)
     except StopIteration:
         return
-    yield acc
-    for element in it:
-        acc = func(acc, element)
-        yield acc
+    for b in it:
+        yield a, b
+        a = b
+
+
+def batched(iterable, n):
+    if n < 1:
+        raise ValueError("n must be at least one")
+    if isinstance(iterable, (list, tuple)):
+        for i in range(0, len(iterable), n):
+            yield tuple(iterable[i:i + n])
+        return
+    batch = []
+    for x in iterable:
+        batch.append(x)
+        if len(batch) == n:
+            yield tuple(batch)
+            batch = []
+    if batch:
+        yield tuple(batch)
+
+
+class _ZipDone(Exception):
+    pass
+
+
+def zip_longest(*iterables, fillvalue=None):
+    # zip() does the work: each input is followed by fillvalues, and the
+    # last one to run out stops it
+    left = [len(iterables)]
+
+    def filler():
+        left[0] -= 1
+        if not left[0]:
+            raise _ZipDone
+        while True:
+            yield fillvalue
+
+    try:
+        yield from zip(*[_chain((i, filler())) for i in iterables])
+    except _ZipDone:
+        pass
+
+
+def groupby(iterable, key=None):
+    it = builtins.iter(iterable)
+    try:
+        value = next(it)
+    except StopIteration:
+        return
+    k = value if key is None else key(value)
+    done = False
+    # Only the group handed out last may advance the input, so each one
+    # knows its number and stops once it's stale
+    group = 0
+
+    def grouper(n, target):
+        nonlocal value, k, done
+        if n != group:
+            return
+        yield value
+        if n != group:
+            return
+        for value in it:
+            k = value if key is None else key(value)
+            if k != target:
+                return
+            yield value
+            if n != group:
+                return
+        done = True
+
+    while not done:
+        group += 1
+        target = k
+        g = grouper(group, target)
+        yield k, g
+        if not done and k == target:
+            # Skip what is left of the group
+            for _ in g:
+                pass
+
+
+def product(*iterables, repeat=1):
+    pools = [tuple(p) for p in iterables] * repeat
+    for p in pools:
+        if not p:
+            return
+    n = len(pools)
+    idx = [0] * n
+    cur = [p[0] for p in pools]
+    while True:
+        yield tuple(cur)
+        # Odometer: bump the last index, carrying to the left, so only the
+        # positions that changed are looked up again
+        i = n - 1
+        while i >= 0:
+            p = pools[i]
+            idx[i] += 1
+            if idx[i] < len(p):
+                cur[i] = p[idx[i]]
+                break
+            idx[i] = 0
+            cur[i] = p[0]
+            i -= 1
+        if i < 0:
+            return
+
+
+def permutations(iterable, r=None):
+    pool = tuple(iterable)
+    n = len(pool)
+    r = n if r is None else r
+    if r > n:
+        return
+    indices = list(range(n))
+    cycles = list(range(n, n - r, -1))
+    yield tuple(pool[i] for i in indices[:r])
+    while n:
+        for i in range(r - 1, -1, -1):
+            cycles[i] -= 1
+            if cycles[i] == 0:
+                indices[i:] = indices[i + 1:] + indices[i:i + 1]
+                cycles[i] = n - i
+            else:
+                j = cycles[i]
+                indices[i], indices[-j] = indices[-j], indices[i]
+                yield tuple(pool[i] for i in indices[:r])
+                break
+        else:
+            return
+
+
+def combinations(iterable, r):
+    pool = tuple(iterable)
+    n = len(pool)
+    if r > n:
+        return
+    indices = list(range(r))
+    yield tuple(pool[i] for i in indices)
+    while True:
+        for i in range(r - 1, -1, -1):
+            if indices[i] != i + n - r:
+                break
+        else:
+            return
+        indices[i] += 1
+        for j in range(i + 1, r):
+            indices[j] = indices[j - 1] + 1
+        yield tuple(pool[i] for i in indices)
+
+
+def combinations_with_replacement(iterable, r):
+    pool = tuple(iterable)
+    n = len(pool)
+    if not n and r:
+        return
+    indices = [0] * r
+    yield tuple(pool[i] for i in indices)
+    while True:
+        for i in range(r - 1, -1, -1):
+            if indices[i] != n - 1:
+                break
+        else:
+            return
+        indices[i:] = [indices[i] + 1] * (r - i)
+        yield tuple(pool[i] for i in indices)
 
 
 # Full analog of CPython builtin iter with 2 arguments
@@ -87,6 +373,8 @@ def iter(*args):
 
         def __init__(self, args):
             self.f, self.sentinel = args
+        def __iter__(self):
+            return self
         def __next__(self):
             v = self.f()
             if v == self.sentinel:
@@ -94,12 +382,3 @@ def iter(*args):
             return v
 
     return _iter(args)
-
-
-def product(*iterables):
-    if not iterables:
-        yield ()
-        return
-    for i in iterables[0]:
-        for r in product(*iterables[1:]):
-            yield (i,) + r
\ No newline at end of file
@@ -1,5 +1,6 @@
 from micropython import const
 import io
+import os
 import sys
 import time
 
@@ -22,21 +23,71 @@ _level_dict = {
 }
 
 _loggers = {}
+# Every Logger, named or not: they all follow the root logger's level
+_all_loggers = []
 _stream = sys.stderr
 _default_fmt = "%(levelname)s:%(name)s:%(message)s"
 _default_datefmt = "%Y-%m-%d %H:%M:%S"
 
 
 class LogRecord:
-    def set(self, name, level, message):
+    def set(self, name, level, msg, args=()):
         self.name = name
         self.levelno = level
         self.levelname = _level_dict[level]
-        self.message = message
+        self.msg = msg
+        self.args = args
+        self.message = None
         self.ct = time.time()
         self.msecs = int((self.ct - int(self.ct)) * 1000)
         self.asctime = None
 
+    def getMessage(self):
+        # Formatted on first use, so a record no handler prints costs no
+        # formatting at all
+        if self.message is None:
+            msg = self.msg
+            args = self.args
+            if args:
+                if isinstance(args[0], dict):
+                    args = args[0]
+                msg = msg % args
+            self.message = msg
+        return self.message
+
+    def copy(self):
+        # A record of its own, for a handler to keep: pooled ones are reused
+        r = LogRecord()
+        r.name = self.name
+        r.levelno = self.levelno
+        r.levelname = self.levelname
+        r.msg = r.message = self.getMessage()
+        r.args = ()
+        r.ct = self.ct
+        r.msecs = self.msecs
+        r.asctime = self.asctime
+        return r
+
+
+# Records of the log() calls in progress are taken from here and put back,
+# so logging does not allocate one per call. Handlers which keep a record
+# past emit() must keep a copy.
+_records = []
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+# The methods Logger rebinds to _noop while their level is disabled
+_level_methods = (
+    (DEBUG, "debug"),
+    (INFO, "info"),
+    (WARNING, "warning"),
+    (ERROR, "error"),
+    (CRITICAL, "critical"),
+)
+
 
 class Handler:
     def __init__(self, level=NOTSET):
@@ -55,6 +106,13 @@ class Handler:
     def format(self, record):
         return self.formatter.format(record)
 
+    def flush(self):
+        pass
+
+    def emitBatch(self, records):
+        for r in records:
+            self.emit(r)
+
 
 class StreamHandler(Handler):
     def __init__(self, stream=None):
@@ -62,14 +120,23 @@ class StreamHandler(Handler):
         self.stream = _stream if stream is None else stream
         self.terminator = "\n"
 
-    def close(self):
+    def flush(self):
         if hasattr(self.stream, "flush"):
             self.stream.flush()
 
+    def close(self):
+        self.flush()
+
     def emit(self, record):
         if record.levelno >= self.level:
             self.stream.write(self.format(record) + self.terminator)
 
+    def emitBatch(self, records):
+        # One write for the lot
+        text = "".join([self.format(r) + self.terminator for r in records if r.levelno >= self.level])
+        if text:
+            self.stream.write(text)
+
 
 class FileHandler(StreamHandler):
     def __init__(self, filename, mode="a", encoding="UTF-8"):
@@ -80,6 +147,116 @@ class FileHandler(StreamHandler):
         self.stream.close()
 
 
+class RotatingFileHandler(FileHandler):
+    # Once the file would grow past maxBytes, it is renamed to filename.1
+    # (filename.1 to filename.2 and so on, up to backupCount) and a new one
+    # started. With backupCount 0 the file is just started over.
+    def __init__(self, filename, mode="a", encoding="UTF-8", maxBytes=0, backupCount=0):
+        super().__init__(filename, mode, encoding)
+        self.filename = filename
+        self.encoding = encoding
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        try:
+            self.size = os.stat(filename)[6]
+        except OSError:
+            self.size = 0
+
+    def doRollover(self):
+        self.stream.close()
+        for i in range(self.backupCount - 1, 0, -1):
+            self._rename("%s.%d" % (self.filename, i), "%s.%d" % (self.filename, i + 1))
+        if self.backupCount:
+            self._rename(self.filename, self.filename + ".1")
+        self.stream = open(self.filename, mode="w", encoding=self.encoding)
+        self.size = 0
+
+    @staticmethod
+    def _rename(src, dst):
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        try:
+            os.rename(src, dst)
+        except OSError:
+            pass
+
+    def write(self, text):
+        # Sizes are counted in characters, which is what the stream takes
+        if self.maxBytes and self.size and self.size + len(text) > self.maxBytes:
+            self.doRollover()
+        self.stream.write(text)
+        self.size += len(text)
+
+    def emit(self, record):
+        if record.levelno >= self.level:
+            self.write(self.format(record) + self.terminator)
+
+    def emitBatch(self, records):
+        # As few writes as rollovers allow
+        chunk = []
+        size = self.size
+        for r in records:
+            if r.levelno < self.level:
+                continue
+            line = self.format(r) + self.terminator
+            if self.maxBytes and chunk and size + len(line) > self.maxBytes:
+                self.write("".join(chunk))
+                chunk = []
+                size = self.size
+            chunk.append(line)
+            size += len(line)
+        if chunk:
+            self.write("".join(chunk))
+
+
+class MemoryHandler(Handler):
+    # Keeps records and hands them to target in batches: when capacity of
+    # them are buffered, when one at flushLevel or above comes in, or when
+    # the oldest has waited flushInterval seconds. Targets with emitBatch()
+    # get each batch in one call, so a file sees one write per batch.
+    def __init__(self, capacity, flushLevel=ERROR, target=None, flushOnClose=True, flushInterval=None):
+        super().__init__()
+        self.capacity = capacity
+        self.flushLevel = flushLevel
+        self.target = target
+        self.flushOnClose = flushOnClose
+        self.flushInterval = flushInterval
+        self.buffer = []
+        self.first = 0
+
+    def setTarget(self, target):
+        self.target = target
+
+    def shouldFlush(self, record):
+        if len(self.buffer) >= self.capacity or record.levelno >= self.flushLevel:
+            return True
+        return self.flushInterval is not None and record.ct - self.first >= self.flushInterval
+
+    def emit(self, record):
+        if record.levelno < self.level:
+            return
+        if not self.buffer:
+            self.first = record.ct
+        self.buffer.append(record.copy())
+        if self.shouldFlush(record):
+            self.flush()
+
+    def flush(self):
+        if self.target is not None:
+            if self.buffer:
+                self.target.emitBatch(self.buffer)
+                self.target.flush()
+            self.buffer = []
+
+    def close(self):
+        if self.flushOnClose:
+            self.flush()
+        else:
+            self.buffer = []
+
+
 class Formatter:
     def __init__(self, fmt=None, datefmt=None):
         self.fmt = _default_fmt if fmt is None else fmt
@@ -98,7 +275,7 @@ class Formatter:
             record.asctime = self.formatTime(self.datefmt, record)
         return self.fmt % {
             "name": record.name,
-            "message": record.message,
+            "message": record.getMessage(),
             "msecs": record.msecs,
             "asctime": record.asctime,
             "levelname": record.levelname,
@@ -110,29 +287,46 @@ class Logger:
         self.name = name
         self.level = level
         self.handlers = []
-        self.record = LogRecord()
+        # The level methods as they are, before disabled ones are rebound
+        self._methods = [(lvl, m, getattr(self, m)) for lvl, m in _level_methods]
+        _all_loggers.append(self)
+        self._update()
+
+    def _update(self):
+        # A disabled level's method is a no-op: a call to it then costs no
+        # level check, formatting or record
+        level = self.getEffectiveLevel()
+        for lvl, name, method in self._methods:
+            setattr(self, name, _noop if lvl < level else method)
 
     def setLevel(self, level):
         self.level = level
+        if _loggers.get("root") is self:
+            for logger in _all_loggers:
+                logger._update()
+        else:
+            self._update()
 
     def isEnabledFor(self, level):
         return level >= self.getEffectiveLevel()
 
     def getEffectiveLevel(self):
-        return self.level or getLogger().level or _DEFAULT_LEVEL
+        root = _loggers.get("root")
+        return self.level or (root and root.level) or _DEFAULT_LEVEL
 
     def log(self, level, msg, *args):
         if self.isEnabledFor(level):
-            if args:
-                if isinstance(args[0], dict):
-                    args = args[0]
-                msg = msg % args
-            self.record.set(self.name, level, msg)
+            record = _records.pop() if _records else LogRecord()
+            record.set(self.name, level, msg, args)
             handlers = self.handlers
             if not handlers:
                 handlers = getLogger().handlers
-            for h in handlers:
-                h.emit(self.record)
+            try:
+                for h in handlers:
+                    h.emit(record)
+            finally:
+                record.msg = record.args = record.message = None
+                _records.append(record)
 
     def debug(self, msg, *args):
         self.log(DEBUG, msg, *args)
@@ -327,28 +327,51 @@ unsorted_qstr_list = {
 RE_NO_ESCAPE = re.compile(r"^[a-zA-Z0-9_]$")
 
 
+def _esc_char(c):
+    if RE_NO_ESCAPE.match(c):
+        return c
+    c = ord(c)
+    try:
+        name = codepoint2name[c]
+    except KeyError:
+        name = "0x%02x" % c
+    return "_" + name + "_"
+
+
+# Escapes of the first 256 code points, which is all a qstr usually has
+qstr_escape_table = [_esc_char(chr(c)) for c in range(256)]
+
+# Results by string: a module's qstrs repeat a lot, across modules too
+_escape_cache = {}
+_hash_cache = {}
+
+
 # this must match the equivalent function in qstr.c
 def compute_hash(qstr, bytes_hash):
-    hash = 5381
+    key = (qstr, bytes_hash)
+    hash = _hash_cache.get(key)
+    if hash is not None:
+        return hash
+    # if bytes_hash is zero, assume a 16-bit mask (to match qstr.c).
+    # Only the low bits are kept, and * and ^ never carry downwards, so
+    # masking as we go gives the same result without growing a big int.
+    mask = (1 << (8 * (bytes_hash or 2))) - 1
+    hash = 5381 & mask
     for b in qstr:
-        hash = (hash * 33) ^ b
+        hash = ((hash * 33) ^ b) & mask
     # Make sure that valid hash is never zero, zero means "hash not computed"
-    # if bytes_hash is zero, assume a 16-bit mask (to match qstr.c)
-    return (hash & ((1 << (8 * (bytes_hash or 2))) - 1)) or 1
+    hash = hash or 1
+    _hash_cache[key] = hash
+    return hash
 
 
 def qstr_escape(qst):
-    def esc_char(c):
-        if RE_NO_ESCAPE.match(c):
-            return c
-        c = ord(c)
-        try:
-            name = codepoint2name[c]
-        except KeyError:
-            name = "0x%02x" % c
-        return "_" + name + "_"
-
-    return "".join(map(esc_char, qst))
+    res = _escape_cache.get(qst)
+    if res is None:
+        table = qstr_escape_table
+        res = "".join([table[o] if o < 256 else _esc_char(c) for c, o in zip(qst, map(ord, qst))])
+        _escape_cache[qst] = res
+    return res
 
 
 static_qstr_list_ident = list(map(qstr_escape, static_qstr_list))
@@ -426,29 +449,201 @@ def make_bytes(cfg_bytes_len, cfg_bytes_hash, qstr):
     return '%d, %d, "%s"' % (qhash, qlen, qdata)
 
 
+def make_pool(cfg_bytes_len, cfg_bytes_hash, qstrs):
+    # make_bytes() for a whole list of qstrs at once: returns their hashes,
+    # their lengths, and all their UTF-8 data back to back in one bytearray.
+    # qstrs already encoded may be given as bytes.
+    hashes = []
+    lengths = []
+    data = bytearray()
+    max_len = 1 << (8 * cfg_bytes_len)
+    for qstr in qstrs:
+        qbytes = qstr if isinstance(qstr, bytes) else bytes_cons(qstr, "utf8")
+        qlen = len(qbytes)
+        if qlen >= max_len:
+            print("qstr is too long:", qstr)
+            assert False
+        hashes.append(compute_hash(qbytes, cfg_bytes_hash))
+        lengths.append(qlen)
+        data += qbytes
+    return hashes, lengths, data
+
+
+# Lookup indexes for a sorted qstr pool, and what lookups cost with each.
+# qstr.c binary-searches sorted pools; these trade a little flash for
+# fewer string comparisons per lookup, which is what interning a frozen
+# module's names on import comes down to.
+
+
+def bisect_probes(n):
+    # String comparisons a binary search over n sorted entries makes to
+    # find each of them
+    probes = [0] * n
+    todo = [(0, n, 1)]
+    while todo:
+        lo, hi, depth = todo.pop()
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        probes[mid] = depth
+        todo.append((lo, mid, depth + 1))
+        todo.append((mid + 1, hi, depth + 1))
+    return probes
+
+
+def make_bucket_index(hashes, n_buckets):
+    # Entries whose hash is b modulo n_buckets (a power of two) are
+    # order[starts[b]:starts[b + 1]], in pool order
+    mask = n_buckets - 1
+    starts = [0] * (n_buckets + 1)
+    for h in hashes:
+        starts[(h & mask) + 1] += 1
+    for b in range(n_buckets):
+        starts[b + 1] += starts[b]
+    fill = starts[:]
+    order = [0] * len(hashes)
+    for i, h in enumerate(hashes):
+        b = h & mask
+        order[fill[b]] = i
+        fill[b] += 1
+    return starts, order
+
+
+def bucket_probes(starts):
+    # Comparisons to find each entry through make_bucket_index()
+    probes = []
+    for b in range(len(starts) - 1):
+        probes.extend(range(1, starts[b + 1] - starts[b] + 1))
+    return probes
+
+
+_M32 = 0xFFFFFFFF
+
+
+def fmix32(h):
+    # MurmurHash3's finalizer
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & _M32
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & _M32
+    return h ^ (h >> 16)
+
+
+def full_hash(qbytes):
+    # compute_hash() before it is masked down, as qstr.c has it in a size_t
+    # (taking size_t to be 32 bits)
+    h = 5381
+    for b in qbytes:
+        h = ((h * 33) ^ b) & _M32
+    return h
+
+
+def make_perfect_hash(qbytes_list, load=4, max_seed=1 << 16):
+    # Minimal perfect hash by hash-and-displace. With h = full_hash(qstr),
+    # an entry's bucket is fmix32(h) % len(seeds), and its index in the
+    # pool is slots[fmix32(h ^ seeds[bucket]) % len(slots)]: one string
+    # comparison finds it, or tells it is not there. Unless h is shared:
+    # no function of h can tell b"i16" from b"out", so every qstr whose h
+    # an earlier one has goes to `overflow` instead, pool indices to look
+    # through when the slot holds another string.
+    # Returns (seeds, slots, overflow). Raises ValueError if no seed fits
+    # a bucket.
+    full = []
+    keys = []
+    overflow = []
+    seen = set()
+    for i, q in enumerate(qbytes_list):
+        h = full_hash(q)
+        full.append(h)
+        if h in seen:
+            overflow.append(i)
+        else:
+            seen.add(h)
+            keys.append(i)
+    n = len(keys)
+    n_buckets = max(1, (n + load - 1) // load)
+    buckets = [[] for _ in range(n_buckets)]
+    for i in keys:
+        buckets[fmix32(full[i]) % n_buckets].append(i)
+
+    seeds = [0] * n_buckets
+    slots = [-1] * n
+    for b in sorted(range(n_buckets), key=lambda b: -len(buckets[b])):
+        bucket = buckets[b]
+        if not bucket:
+            break
+        for seed in range(1, max_seed):
+            taken = []
+            for i in bucket:
+                s = fmix32(full[i] ^ seed) % n
+                if slots[s] >= 0 or s in taken:
+                    break
+                taken.append(s)
+            else:
+                break
+        else:
+            raise ValueError("no perfect hash found")
+        seeds[b] = seed
+        for j, i in enumerate(bucket):
+            slots[taken[j]] = i
+    return seeds, slots, overflow
+
+
+def phash_lookup(qbytes_list, seeds, slots, overflow, qbytes):
+    # Pool index of qbytes through make_perfect_hash()'s tables, or -1, and
+    # the string comparisons that took
+    h = full_hash(qbytes)
+    probes = 0
+    if slots:
+        i = slots[fmix32(h ^ seeds[fmix32(h) % len(seeds)]) % len(slots)]
+        probes += 1
+        if qbytes_list[i] == qbytes:
+            return i, probes
+    for i in overflow:
+        probes += 1
+        if qbytes_list[i] == qbytes:
+            return i, probes
+    return -1, probes
+
+
+def phash_probes(qbytes_list, seeds, slots, overflow):
+    # Comparisons to find each entry through make_perfect_hash()'s tables
+    return [phash_lookup(qbytes_list, seeds, slots, overflow, q)[1] for q in qbytes_list]
+
+
+def probe_stats(probes):
+    # (average, worst) comparisons
+    if not probes:
+        return 0.0, 0
+    return sum(probes) / len(probes), max(probes)
+
+
 def print_qstr_data(qcfgs, qstrs):
     # get config variables
     cfg_bytes_len = int(qcfgs["BYTES_IN_LEN"])
     cfg_bytes_hash = int(qcfgs["BYTES_IN_HASH"])
 
     # print out the starter of the generated C header file
-    print("// This file was automatically generated by makeqstrdata.py")
-    print("")
+    out = ["// This file was automatically generated by makeqstrdata.py", ""]
 
     # add NULL qstr with no hash or data
-    print('QDEF0(MP_QSTRnull, 0, 0, "")')
-
-    # add static qstrs to the first unsorted pool
-    for qstr in static_qstr_list:
-        qbytes = make_bytes(cfg_bytes_len, cfg_bytes_hash, qstr)
-        print("QDEF0(MP_QSTR_%s, %s)" % (qstr_escape(qstr), qbytes))
+    out.append('QDEF0(MP_QSTRnull, 0, 0, "")')
 
-    # add remaining qstrs to the sorted (by value) pool (unless they're in
-    # unsorted_qstr_list, in which case add them to the unsorted pool)
+    # static qstrs go to the first unsorted pool; the remaining ones to the
+    # sorted (by value) pool, unless they're in unsorted_qstr_list, in
+    # which case they go to the unsorted pool too
+    entries = [(0, qstr_escape(qstr), qstr) for qstr in static_qstr_list]
     for ident, qstr in sorted(qstrs.values(), key=lambda x: x[1]):
-        qbytes = make_bytes(cfg_bytes_len, cfg_bytes_hash, qstr)
-        pool = 0 if qstr in unsorted_qstr_list else 1
-        print("QDEF%d(MP_QSTR_%s, %s)" % (pool, ident, qbytes))
+        entries.append((0 if qstr in unsorted_qstr_list else 1, ident, qstr))
+
+    hashes, lengths, data = make_pool(cfg_bytes_len, cfg_bytes_hash, [e[2] for e in entries])
+    pos = 0
+    for i, (pool, ident, qstr) in enumerate(entries):
+        qlen = lengths[i]
+        qdata = escape_bytes(qstr, data[pos:pos + qlen])
+        pos += qlen
+        out.append('QDEF%d(MP_QSTR_%s, %d, %d, "%s")' % (pool, ident, hashes[i], qlen, qdata))
+    print("\n".join(out))
 
 
 def do_work(infiles):
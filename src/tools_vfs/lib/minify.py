@@ -0,0 +1,222 @@
+# Source minifier for MicroPython code, built on the tools VM's own parser,
+# so that it loads in a fraction of the time python_minifier takes.
+#
+#  - statements which are just a literal (docstrings, mostly) are dropped
+#  - local variables of functions get the shortest names not otherwise used
+#    in the module, the most used ones first
+#  - the tree is written back with ast.unparse(compact=True)
+#
+# Arguments keep their names, as callers may pass them by keyword. Functions
+# whose locals could be reached by name are left alone: those with nested
+# functions, classes or lambdas, with f-strings (their expressions are kept
+# as source text), calling locals()/eval()/exec(), or using the inline
+# assemblers, which take register names as plain names.
+
+import ast
+from ast.serialize import cached_parse
+from keyword import kwlist
+
+_BLOCK_FIELDS = ("body", "orelse", "finalbody")
+_LITERALS = (ast.Num, ast.Str, ast.Bytes, ast.NameConstant, ast.Constant, ast.Ellipsis)
+_NESTED = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+_INTROSPECT = {"locals", "vars", "dir", "eval", "exec"}
+_COMP = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+_KEYWORDS = set(kwlist)
+
+_FIRST = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_REST = _FIRST + "0123456789_"
+
+
+def short_names(taken):
+    # "a", "b", ... "Z", "aa", "ab", ... skipping taken names and keywords
+    n = 0
+    while True:
+        i = n
+        s = _FIRST[i % len(_FIRST)]
+        i //= len(_FIRST)
+        while i:
+            i -= 1
+            s += _REST[i % len(_REST)]
+            i //= len(_REST)
+        n += 1
+        if s not in taken and s not in _KEYWORDS:
+            yield s
+
+
+def strip_literals(tree):
+    count = 0
+    for node in ast.walk(tree):
+        for f in _BLOCK_FIELDS:
+            # A lambda's body is an expression
+            body = getattr(node, f, None)
+            if not body or not isinstance(body, list):
+                continue
+            keep = [s for s in body if not (
+                isinstance(s, ast.Expr) and isinstance(s.value, _LITERALS)
+                and getattr(s.value, "raw", None) is None
+            )]
+            if len(keep) == len(body):
+                continue
+            count += len(body) - len(keep)
+            if not keep and not isinstance(node, ast.Module):
+                keep = [ast.Pass()]
+            body[:] = keep
+    return count
+
+
+def used_names(tree):
+    # Every name the module mentions or binds, in any scope
+    res = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            res.add(node.id)
+        elif isinstance(node, ast.arg):
+            res.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            res.add(node.name)
+        elif isinstance(node, ast.alias):
+            res.add(node.asname or node.name.split(".", 1)[0])
+        elif isinstance(node, ast.ExceptHandler):
+            if node.name:
+                res.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            res.update(node.names)
+    return res
+
+
+def renameable(func):
+    for d in func.decorator_list:
+        while isinstance(d, ast.Call):
+            d = d.func
+        name = d.attr if isinstance(d, ast.Attribute) else getattr(d, "id", "")
+        if name.startswith("asm_"):
+            return False
+    for node in ast.walk(func):
+        if node is not func and isinstance(node, _NESTED):
+            return False
+        if isinstance(node, ast.Str) and getattr(node, "raw", None) is not None:
+            return False
+        if isinstance(node, ast.Name) and node.id in _INTROSPECT:
+            return False
+    return True
+
+
+def body_nodes(func):
+    # The nodes of a function's body. Its decorators, defaults and annotations
+    # are evaluated in the enclosing scope, so they are not the function's.
+    for stmt in func.body:
+        for node in ast.walk(stmt):
+            yield node
+
+
+def function_locals(func):
+    # {name: uses} of the variables a function binds. Arguments, imported
+    # names and global/nonlocal ones are left out, and so are names only
+    # bound by comprehensions, which have scopes of their own.
+    fixed = set()
+    a = func.args
+    for arg in a.args + a.kwonlyargs + [a.vararg, a.kwarg]:
+        if arg is not None:
+            fixed.add(arg.arg)
+    comp_targets = set()
+    for node in body_nodes(func):
+        if isinstance(node, (ast.Global, ast.Nonlocal)):
+            fixed.update(node.names)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            fixed.update(a.asname or a.name.split(".", 1)[0] for a in node.names)
+        elif isinstance(node, _COMP):
+            for g in node.generators:
+                for n in ast.walk(g.target):
+                    comp_targets.add(id(n))
+
+    stored = set()
+    uses = {}
+    for node in body_nodes(func):
+        if isinstance(node, ast.Name):
+            uses[node.id] = uses.get(node.id, 0) + 1
+            if not isinstance(node.ctx, ast.Load) and id(node) not in comp_targets:
+                stored.add(node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            uses[node.name] = uses.get(node.name, 0) + 1
+            stored.add(node.name)
+    return {k: uses[k] for k in stored if k not in fixed}
+
+
+def shorten_locals(tree):
+    taken = used_names(tree)
+    count = 0
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)) or not renameable(func):
+            continue
+        names = function_locals(func)
+        new = {}
+        gen = short_names(taken)
+        s = next(gen)
+        for k in sorted(names, key=lambda k: -names[k]):
+            if len(s) < len(k):
+                new[k] = s
+                s = next(gen)
+        if not new:
+            continue
+        count += len(new)
+        for node in body_nodes(func):
+            if isinstance(node, ast.Name):
+                node.id = new.get(node.id, node.id)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                node.name = new.get(node.name, node.name)
+    return count
+
+
+def minify_tree(tree, remove_literal_statements=True, rename_locals=True, indent=" ", stats=None):
+    literals = strip_literals(tree) if remove_literal_statements else 0
+    renamed = shorten_locals(tree) if rename_locals else 0
+    if stats is not None:
+        stats["literals"] = literals
+        stats["renamed"] = renamed
+    return ast.unparse(tree, indent=indent, compact=True)
+
+
+def minify(source, remove_literal_statements=True, rename_locals=True, indent=" ", stats=None):
+    return minify_tree(cached_parse(source), remove_literal_statements, rename_locals, indent, stats)
+
+
+# A whole project at once: [(path, source)] -> [[path, result, error]],
+# error being None or the message. With optimize, files also go through
+# optimize.py first, with the const() values of the whole batch; with fold,
+# only through its const() pass.
+def minify_files(files, optimize=False, root=None, fold=False):
+    trees = []
+    for path, source in files:
+        try:
+            trees.append(cached_parse(source))
+        except Exception as e:
+            trees.append(e)
+
+    opt = None
+    if optimize or fold:
+        import optimize as opt
+        consts = {}
+        for i, (path, source) in enumerate(files):
+            if not isinstance(trees[i], Exception) and path.endswith(".py"):
+                consts.update(opt.tree_consts(trees[i], path, root))
+
+    res = []
+    for i, (path, source) in enumerate(files):
+        tree = trees[i]
+        trees[i] = None
+        if isinstance(tree, Exception):
+            # The parser has already printed the details
+            res.append([path, None, str(tree) or "syntax error"])
+            continue
+        try:
+            if opt is not None:
+                package = opt.package_name(path, root)
+                if optimize:
+                    tree = opt.Optimizer(consts, package=package).optimize(tree)
+                else:
+                    tree = opt.Optimizer(consts, 0, False, package).optimize(tree)
+            res.append([path, minify_tree(tree), None])
+        except Exception as e:
+            res.append([path, None, str(e) or e.__class__.__name__])
+    return res
@@ -0,0 +1,695 @@
+# Source-to-source optimizer for MicroPython code, run before mpy-cross.
+#
+# Passes, in order:
+#  - const() values, this module's and those of other modules given in
+#    `consts` (see project_consts() below), are substituted where their
+#    names are used, and integer and string expressions over literals are
+#    folded. Floats are left alone: the board may well compute them in
+#    single precision.
+#  - for loops over a small constant range() are unrolled.
+#  - in functions, builtins used inside loops are bound to locals before
+#    the loop, so each iteration does a fast local load instead of a dict
+#    lookup. Module attributes are not: binding one before the loop looks it
+#    up even if the loop never runs, and misses it being rebound meanwhile.
+#
+# Everything is conservative: a name is only treated as constant, builtin
+# or module if the module binds it exactly once (or never, for builtins),
+# and functions using the native emitters are not restructured.
+# The result is source again, with statements kept on their original
+# lines where possible so tracebacks from the board still make sense.
+
+import ast
+from ast.serialize import cached_parse
+
+# Builtins worth hoisting. range and super are missing on purpose: the
+# compiler special-cases "for x in range()" and zero-argument super() by
+# name.
+HOIST_BUILTINS = {
+    "abs", "all", "any", "bool", "bytearray", "bytes", "callable", "chr",
+    "dict", "divmod", "enumerate", "float", "getattr", "hasattr", "hash",
+    "id", "int", "isinstance", "issubclass", "iter", "len", "list", "map",
+    "max", "memoryview", "min", "next", "ord", "pow", "print", "repr",
+    "round", "setattr", "sorted", "str", "sum", "tuple", "type", "zip",
+}
+
+EMITTERS = {"native", "viper", "asm_thumb", "asm_xtensa"}
+
+# Folded ints beyond this are not worth it (and may not fit the board)
+INT_LIMIT = 1 << 64
+STR_LIMIT = 256
+
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda,
+           ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+# Builtins through which a function can read its locals by name
+_INTROSPECT = {"locals", "vars", "eval", "exec"}
+
+
+def literal(node):
+    # (True, value) for a literal int, str or bytes node, else (False, None)
+    if isinstance(node, ast.Num):
+        if isinstance(node.n, int) and not isinstance(node.n, bool):
+            return True, node.n
+    elif isinstance(node, ast.Str):
+        if getattr(node, "raw", None) is None:
+            return True, node.s
+    elif isinstance(node, ast.Bytes):
+        return True, node.s
+    return False, None
+
+
+def make_literal(v):
+    if isinstance(v, int):
+        return ast.Num(v)
+    if isinstance(v, bytes):
+        return ast.Bytes(s=v)
+    return ast.Str(s=v)
+
+
+def fold_binop(op, a, b):
+    # Result of a op b, or None if it should be left to run time
+    if isinstance(a, int) and isinstance(b, int):
+        if isinstance(op, ast.Add):
+            v = a + b
+        elif isinstance(op, ast.Sub):
+            v = a - b
+        elif isinstance(op, ast.Mult):
+            v = a * b
+        elif isinstance(op, ast.FloorDiv):
+            if not b:
+                return None
+            v = a // b
+        elif isinstance(op, ast.Mod):
+            if not b:
+                return None
+            v = a % b
+        elif isinstance(op, ast.Pow):
+            if b < 0 or b > 64:
+                return None
+            v = a ** b
+        elif isinstance(op, ast.LShift):
+            if b < 0 or b > 64:
+                return None
+            v = a << b
+        elif isinstance(op, ast.RShift):
+            if b < 0:
+                return None
+            v = a >> b
+        elif isinstance(op, ast.BitOr):
+            v = a | b
+        elif isinstance(op, ast.BitAnd):
+            v = a & b
+        elif isinstance(op, ast.BitXor):
+            v = a ^ b
+        else:
+            return None
+        if -INT_LIMIT < v < INT_LIMIT:
+            return v
+        return None
+    if isinstance(op, ast.Add) and type(a) is type(b) and not isinstance(a, int):
+        v = a + b
+    elif isinstance(op, ast.Mult) and isinstance(b, int) and not isinstance(a, int):
+        v = a * b
+    else:
+        return None
+    if len(v) <= STR_LIMIT:
+        return v
+    return None
+
+
+def fold_unaryop(op, a):
+    if not isinstance(a, int):
+        return None
+    if isinstance(op, ast.USub):
+        return -a
+    if isinstance(op, ast.UAdd):
+        return a
+    if isinstance(op, ast.Invert):
+        return ~a
+    return None
+
+
+def dotted(node):
+    # "a.b.c" for a chain of attributes on a name, else None
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    parts.reverse()
+    return ".".join(parts)
+
+
+def uses_emitter(node):
+    for d in node.decorator_list:
+        if isinstance(d, ast.Attribute) and d.attr in EMITTERS:
+            return True
+        if isinstance(d, ast.Name) and d.id in EMITTERS:
+            return True
+    return False
+
+
+# Contexts and operators carry no state and can be shared. (The parser
+# leaves contexts referring to themselves, too.)
+_SHARED = (ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+
+
+def clone(node):
+    if isinstance(node, list):
+        return [clone(v) for v in node]
+    if not isinstance(node, ast.AST) or isinstance(node, _SHARED):
+        return node
+    new = ast.Num(node.n) if isinstance(node, ast.Num) else node.__class__()
+    for k, v in node.__dict__.items():
+        setattr(new, k, clone(v))
+    return new
+
+
+def breaks_out(stmts):
+    # Whether stmts, the body of a loop, have a break or continue of that
+    # loop. Those in nested loops are theirs, except in their else.
+    for s in stmts:
+        if isinstance(s, (ast.Break, ast.Continue)):
+            return True
+        if isinstance(s, _SCOPES):
+            continue
+        if isinstance(s, (ast.For, ast.AsyncFor, ast.While)):
+            if breaks_out(s.orelse):
+                return True
+            continue
+        for f in ("body", "handlers", "orelse", "finalbody"):
+            v = getattr(s, f, None)
+            if isinstance(v, list) and breaks_out(v):
+                return True
+    return False
+
+
+# How many times each name is bound anywhere in tree: assignment and loop
+# targets, del, def/class, arguments, imports, except ... as, global and
+# nonlocal declarations. "*" counts star imports.
+def bindings(tree):
+    res = {}
+
+    def bind(name):
+        res[name] = res.get(name, 0) + 1
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, (ast.Store, ast.Del)):
+                bind(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bind(node.name)
+        elif isinstance(node, ast.arguments):
+            for a in node.args + node.kwonlyargs:
+                bind(a.arg)
+            if node.vararg:
+                bind(node.vararg.arg)
+            if node.kwarg:
+                bind(node.kwarg.arg)
+        elif isinstance(node, ast.Import):
+            for a in node.names:
+                bind(a.asname or a.name.split(".", 1)[0])
+        elif isinstance(node, ast.ImportFrom):
+            for a in node.names:
+                bind(a.asname or a.name)
+        elif isinstance(node, ast.ExceptHandler):
+            if node.name:
+                bind(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            for n in node.names:
+                bind(n)
+    return res
+
+
+def module_consts(tree, binds=None):
+    # {name: value} of the module-level NAME = const(literal) definitions,
+    # for names bound nowhere else. Values may refer to earlier consts.
+    if binds is None:
+        binds = bindings(tree)
+    res = {}
+    folder = Folder(res)
+    for node in tree.body:
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1):
+            continue
+        t = node.targets[0]
+        v = node.value
+        if not (isinstance(t, ast.Name) and binds.get(t.id) == 1):
+            continue
+        if not (isinstance(v, ast.Call) and isinstance(v.func, ast.Name) and v.func.id == "const"
+                and len(v.args) == 1 and not v.keywords):
+            continue
+        ok, val = literal(folder.visit(v.args[0]))
+        if ok:
+            res[t.id] = val
+    return res
+
+
+class Folder(ast.NodeTransformer):
+    # Substitutes constants and folds literal expressions. `names` maps
+    # plain names to values, `dotted` maps "module.NAME" style references.
+
+    def __init__(self, names, dotted_names=None):
+        self.names = names
+        self.dotted = dotted_names or {}
+        self.count = 0
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.names:
+            self.count += 1
+            return make_literal(self.names[node.id])
+        return node
+
+    def visit_Attribute(self, node):
+        if self.dotted and isinstance(node.ctx, ast.Load):
+            d = dotted(node)
+            if d in self.dotted:
+                self.count += 1
+                return make_literal(self.dotted[d])
+        return self.generic_visit(node)
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        ok_a, a = literal(node.left)
+        ok_b, b = literal(node.right)
+        if ok_a and ok_b:
+            v = fold_binop(node.op, a, b)
+            if v is not None:
+                self.count += 1
+                return make_literal(v)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        ok, a = literal(node.operand)
+        if ok:
+            v = fold_unaryop(node.op, a)
+            if v is not None:
+                self.count += 1
+                return make_literal(v)
+        return node
+
+
+class Unroller(ast.NodeTransformer):
+    # "for i in range(<const>)" with at most `limit` iterations becomes
+    # that many copies of the body, each with i replaced by its value - or,
+    # where anything besides the body may read i, preceded by "i = <value>".
+
+    # Upper bound on body size times iterations, in AST nodes
+    BUDGET = 400
+
+    def __init__(self, limit, binds):
+        self.limit = limit
+        self.binds = binds
+        self.count = 0
+        self.func = None    # the function the loops being visited are in
+
+    def visit_FunctionDef(self, node):
+        if uses_emitter(node):
+            return node
+        outer = self.func
+        self.func = node
+        try:
+            return self.generic_visit(node)
+        finally:
+            self.func = outer
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        outer = self.func
+        self.func = None
+        try:
+            return self.generic_visit(node)
+        finally:
+            self.func = outer
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        r = self.trip_range(node)
+        if r is None:
+            return node
+        if breaks_out(node.body):
+            return node
+        body = ast.Module(body=node.body)
+        size = 0
+        body_binds = {}
+        for n in ast.walk(body):
+            size += 1
+            # Closures would see the value of the variable at call time
+            if isinstance(n, _SCOPES):
+                return node
+            if isinstance(n, ast.Name) and not isinstance(n.ctx, ast.Load):
+                body_binds[n.id] = 1
+        if size * len(r) > self.BUDGET:
+            return node
+
+        var = node.target.id
+        assign = var in body_binds or not self.plain_local(var)
+        res = []
+        subst = Folder({} if assign else {var: 0})
+        for i in r:
+            body = clone(node.body)
+            if assign:
+                res.append(ast.Assign(targets=[ast.Name(id=var, ctx=ast.Store())], value=ast.Num(i)))
+            else:
+                subst.names[var] = i
+            for s in body:
+                res.append(subst.visit(s))
+        if res and not assign:
+            # The loop variable is still set afterwards
+            res.append(ast.Assign(targets=[ast.Name(id=var, ctx=ast.Store())], value=ast.Num(r[-1])))
+        res.extend(node.orelse)
+        if not res:
+            res.append(ast.Pass())
+        self.count += 1
+        return res
+
+    def plain_local(self, var):
+        # Whether var is a local that only the code of its own function
+        # reads: not a global or nonlocal, not used by a nested scope (which
+        # might be called from the body), and not read through locals()
+        if self.func is None:
+            return False
+        for n in ast.walk(ast.Module(body=self.func.body), lambda n: isinstance(n, _SCOPES)):
+            if isinstance(n, (ast.Global, ast.Nonlocal)) and var in n.names:
+                return False
+            if isinstance(n, _SCOPES):
+                for m in ast.walk(n):
+                    if isinstance(m, ast.Name) and m.id == var:
+                        return False
+            elif isinstance(n, ast.Name) and n.id in _INTROSPECT:
+                return False
+        return True
+
+    def trip_range(self, node):
+        if not isinstance(node.target, ast.Name) or self.binds.get("range"):
+            return None
+        it = node.iter
+        if not (isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == "range"
+                and 1 <= len(it.args) <= 3 and not it.keywords):
+            return None
+        args = []
+        for a in it.args:
+            ok, v = literal(a)
+            if not ok or not isinstance(v, int):
+                return None
+            args.append(v)
+        if len(args) == 3 and not args[2]:
+            return None
+        r = range(*args)
+        if len(r) > self.limit:
+            return None
+        return r
+
+
+class Renamer(ast.NodeTransformer):
+    # Replaces hoisted names with their locals, within one scope
+
+    def __init__(self, names):
+        self.names = names
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.names:
+            return ast.Name(id=self.names[node.id], ctx=ast.Load(), lineno=getattr(node, "lineno", None))
+        return node
+
+    def skip(self, node):
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = skip
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = skip
+
+
+class LoopHoister(ast.NodeTransformer):
+    # Within one function body: binds what the outermost loops look up
+    # over and over to locals, assigned right before each loop.
+
+    def __init__(self, opt):
+        self.opt = opt
+
+    def uses(self, node):
+        # Builtins anywhere in the per-iteration parts of the loop, not
+        # entering nested scopes
+        todo = list(node.body)
+        if isinstance(node, ast.While):
+            todo.append(node.test)
+        names = set()
+        for n in ast.walk(ast.Module(body=todo), lambda n: isinstance(n, _SCOPES)):
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) and n.id in self.opt.builtins:
+                names.add(n.id)
+        return names
+
+    def loop(self, node):
+        names = self.uses(node)
+        if not names:
+            return node
+        res = []
+        local_names = {}
+        for n in sorted(names):
+            local = local_names[n] = self.opt.fresh("_h_" + n)
+            res.append(ast.Assign(
+                targets=[ast.Name(id=local, ctx=ast.Store())],
+                value=ast.Name(id=n, ctx=ast.Load())))
+        r = Renamer(local_names)
+        node.body = [r.visit(s) for s in node.body]
+        if isinstance(node, ast.While):
+            node.test = r.visit(node.test)
+        self.opt.hoisted += len(res)
+        res.append(node)
+        return res
+
+    visit_For = visit_AsyncFor = visit_While = loop
+
+    def skip(self, node):
+        return node
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_Lambda = skip
+
+
+class Optimizer(ast.NodeTransformer):
+
+    def __init__(self, consts=None, unroll=8, hoist=True, package=None):
+        # consts: {module name: {NAME: value}} of other modules
+        # package: the one this module is in, for relative imports
+        self.consts = consts or {}
+        self.package = package
+        self.unroll = unroll
+        self.hoist = hoist
+        self.stats = {}
+        self.hoisted = 0
+
+    def fresh(self, name):
+        while name in self.taken:
+            name += "_"
+        self.taken.add(name)
+        return name
+
+    def external(self, tree):
+        # Constants reachable through this module's imports: plain names
+        # from "from m import X", and dotted ones through "import m"
+        names = {}
+        dotted_names = {}
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom):
+                table = self.consts.get(resolve_from(node, self.package))
+                if not table:
+                    continue
+                for a in node.names:
+                    local = a.asname or a.name
+                    if a.name in table and self.binds.get(local) == 1:
+                        names[local] = table[a.name]
+            elif isinstance(node, ast.Import):
+                for a in node.names:
+                    if a.asname:
+                        local, prefix = a.asname, a.name
+                    else:
+                        local = prefix = a.name.split(".", 1)[0]
+                    if self.binds.get(local) != 1:
+                        continue
+                    for m, table in self.consts.items():
+                        if m == a.name or (not a.asname and m.startswith(prefix + ".")):
+                            ref = local + m[len(prefix):]
+                            for k, v in table.items():
+                                dotted_names[ref + "." + k] = v
+        return names, dotted_names
+
+    def optimize(self, tree):
+        self.binds = binds = bindings(tree)
+        self.taken = set(binds)
+        for n in ast.walk(tree):
+            if isinstance(n, ast.Name):
+                self.taken.add(n.id)
+
+        names, dotted_names = self.external(tree)
+        names.update(module_consts(tree, binds))
+        folder = Folder(names, dotted_names)
+        tree = folder.visit(tree)
+        self.stats["folded"] = folder.count
+
+        if self.unroll:
+            u = Unroller(self.unroll, binds)
+            tree = u.visit(tree)
+            self.stats["unrolled"] = u.count
+
+        if self.hoist and not binds.get("*"):
+            self.builtins = {n for n in HOIST_BUILTINS if not binds.get(n)}
+            tree = self.visit(tree)
+            self.stats["hoisted"] = self.hoisted
+        return tree
+
+    # The NodeTransformer side: finds the functions to hoist in
+    def visit_FunctionDef(self, node):
+        if uses_emitter(node):
+            return node
+        LoopHoister(self).generic_visit(node)
+        return self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def optimize(source, consts=None, unroll=8, hoist=True, stats=None, path=None, root=None):
+    tree = cached_parse(source)
+    opt = Optimizer(consts, unroll, hoist, path and package_name(path, root))
+    tree = opt.optimize(tree)
+    if stats is not None:
+        stats.update(opt.stats)
+    return ast.unparse(tree, keep_lines=True)
+
+
+# Whole-project constants
+#
+# MicroPython folds const() only within the file defining it; everywhere
+# else "from constants import X" is a global lookup at each use. Given all
+# the files of a project (or a package), project_consts() collects their
+# importable consts so that optimize() can substitute them in the others.
+
+ROOTS = ("flash/lib/", "flash/", "lib/")
+
+# Values beyond this would not survive the trip through JSON and JS
+SAFE_INT = 1 << 53
+
+
+def module_name(path, root=None):
+    # "lib/foo/bar.py" -> "foo.bar", "/foo/__init__.py" -> "foo"
+    path = path.lstrip("/")
+    if root is not None:
+        root = root.strip("/")
+        if root and path.startswith(root + "/"):
+            path = path[len(root) + 1:]
+    else:
+        for r in ROOTS:
+            if path.startswith(r):
+                path = path[len(r):]
+                break
+    if path.endswith(".py"):
+        path = path[:-3]
+    if path.endswith("/__init__"):
+        path = path[:-9]
+    return path.replace("/", ".")
+
+
+def package_name(path, root=None):
+    # The package relative imports in path start from
+    m = module_name(path, root)
+    if path.endswith("__init__.py"):
+        return m
+    return m.rpartition(".")[0]
+
+
+def resolve_from(node, package):
+    # Absolute module name of a "from ... import", or None if it can't
+    # be told (relative import with the package unknown)
+    if not node.level:
+        return node.module
+    if package is None:
+        return None
+    parts = package.split(".") if package else []
+    if node.level - 1 > len(parts):
+        return None
+    parts = parts[:len(parts) - node.level + 1]
+    if node.module:
+        parts.append(node.module)
+    return ".".join(parts)
+
+
+def project_consts(files, root=None):
+    # {module: {NAME: int}} over [(path, source)], skipping files which
+    # don't parse
+    res = {}
+    for path, source in files:
+        if not path.endswith(".py"):
+            continue
+        try:
+            tree = cached_parse(source)
+        except Exception:
+            continue
+        res.update(tree_consts(tree, path, root))
+    return res
+
+
+def fold_files(files, root=None):
+    # Just the const() pass over a project, for source that is not going
+    # through mpy-cross: [(path, source)] -> [[path, result, error]] as
+    # minify.minify_files() returns, with the consts of the whole batch
+    trees = []
+    consts = {}
+    for path, source in files:
+        try:
+            tree = cached_parse(source)
+        except Exception as e:
+            trees.append(e)
+            continue
+        trees.append(tree)
+        if path.endswith(".py"):
+            consts.update(tree_consts(tree, path, root))
+
+    res = []
+    for i, (path, source) in enumerate(files):
+        tree = trees[i]
+        trees[i] = None
+        if isinstance(tree, Exception):
+            res.append([path, None, str(tree) or "syntax error"])
+            continue
+        try:
+            tree = Optimizer(consts, 0, False, package_name(path, root)).optimize(tree)
+            res.append([path, ast.unparse(tree, keep_lines=True), None])
+        except Exception as e:
+            res.append([path, None, str(e) or e.__class__.__name__])
+    return res
+
+
+def tree_consts(tree, path, root=None):
+    # Names starting with "_" are left out: the compiler drops those, so
+    # they can't be imported
+    table = {}
+    for k, v in module_consts(tree).items():
+        if not k.startswith("_") and isinstance(v, int) and -SAFE_INT < v < SAFE_INT:
+            table[k] = v
+    if not table:
+        return {}
+    return {module_name(path, root): table}
+
+
+def imported_modules(source, path=None, root=None):
+    # Names of the modules imported by source, including the parent
+    # packages of dotted ones
+    tree = cached_parse(source)
+    package = path and package_name(path, root)
+    res = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            m = resolve_from(node, package)
+            names = [m] if m else []
+        else:
+            continue
+        for m in names:
+            parts = m.split(".")
+            for i in range(1, len(parts) + 1):
+                m = ".".join(parts[:i])
+                if m not in res:
+                    res.append(m)
+    return res
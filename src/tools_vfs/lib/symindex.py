@@ -0,0 +1,276 @@
+# Project-wide symbol index, built on the bundled ast parser.
+#
+# Each file is parsed once and reduced to its definitions, imports and
+# name references, kept as plain lists so the whole index serializes to
+# compact JSON. A file is parsed again only when its content hash changes,
+# so queries (go-to-definition, find-references) never touch the parser.
+
+import ast
+from ast.serialize import cached_parse
+import json
+import hashlib
+from binascii import hexlify
+
+VERSION = 2
+
+# Layout of a per-file entry:
+#   [hash, defs, imports, refs, error]
+#   defs:    [[name, kind, line, scope], ...]   kind is "def", "class" or "var",
+#                                               scope the dotted enclosing name
+#   imports: [[local, module, name, line, level], ...]   name is None for
+#                                               plain "import module"
+#   refs:    {name: [line, ...]}   every Name and attribute name used
+#   error:   None, or why the file could not be parsed: [message, line],
+#            line being 0 where it is not known
+HASH = 0
+DEFS = 1
+IMPORTS = 2
+REFS = 3
+ERROR = 4
+
+
+def content_hash(source):
+    if isinstance(source, str):
+        source = source.encode()
+    return str(hexlify(hashlib.sha256(source).digest()[:12]), "ascii")
+
+
+class _Collector(ast.NodeVisitor):
+
+    def __init__(self):
+        self.defs = []
+        self.imports = []
+        self.refs = {}
+        self.scope = []
+        # Only module and class bodies define names visible from outside
+        self.in_func = 0
+
+    def ref(self, name, line):
+        lines = self.refs.get(name)
+        if lines is None:
+            self.refs[name] = [line]
+        elif lines[-1] != line:
+            lines.append(line)
+
+    def define(self, name, kind, line):
+        self.defs.append([name, kind, line, ".".join(self.scope)])
+
+    def nested(self, node, kind):
+        self.define(node.name, kind, node.lineno)
+        self.ref(node.name, node.lineno)
+        self.scope.append(node.name)
+        if kind == "def":
+            self.in_func += 1
+        self.generic_visit(node)
+        if kind == "def":
+            self.in_func -= 1
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self.nested(node, "def")
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self.nested(node, "class")
+
+    def visit_Name(self, node):
+        line = getattr(node, "lineno", 0)
+        if not self.in_func and isinstance(node.ctx, ast.Store):
+            self.define(node.id, "var", line)
+        self.ref(node.id, line)
+
+    def visit_Attribute(self, node):
+        self.ref(node.attr, getattr(node, "lineno", 0))
+        self.visit(node.value)
+
+    def visit_Import(self, node):
+        line = getattr(node, "lineno", 0)
+        for a in node.names:
+            local = a.asname or a.name.split(".", 1)[0]
+            self.imports.append([local, a.name, None, line, 0])
+            self.ref(local, line)
+
+    def visit_ImportFrom(self, node):
+        line = getattr(node, "lineno", 0)
+        for a in node.names:
+            local = a.asname or a.name
+            self.imports.append([local, node.module, a.name, line, node.level])
+            self.ref(local, line)
+
+
+def index_source(source, h=None):
+    if h is None:
+        h = content_hash(source)
+    try:
+        tree = cached_parse(source)
+    except Exception as e:
+        msg = getattr(e, "msg", None) or str(e) or e.__class__.__name__
+        return [h, [], [], {}, [msg, getattr(e, "lineno", 0)]]
+    c = _Collector()
+    c.visit(tree)
+    return [h, c.defs, c.imports, c.refs, None]
+
+
+def module_name(path):
+    if path.endswith(".py"):
+        path = path[:-3]
+    if path.endswith("/__init__"):
+        path = path[:-9]
+    return path.strip("/").replace("/", ".")
+
+
+class SymbolIndex:
+
+    def __init__(self):
+        self.files = {}
+
+    def update(self, path, source):
+        h = content_hash(source)
+        e = self.files.get(path)
+        if e is not None and e[HASH] == h:
+            return False
+        self.files[path] = index_source(source, h)
+        return True
+
+    def remove(self, path):
+        self.files.pop(path, None)
+
+    # Brings the index in line with a complete list of (path, source)
+    # pairs: new and changed files are parsed, missing ones dropped.
+    def sync(self, files):
+        seen = set()
+        parsed = 0
+        for path, source in files:
+            seen.add(path)
+            if self.update(path, source):
+                parsed += 1
+        removed = [p for p in self.files if p not in seen]
+        for p in removed:
+            del self.files[p]
+        errors = {}
+        for p, e in self.files.items():
+            if e[ERROR]:
+                errors[p] = e[ERROR]
+        return {
+            "files": len(self.files),
+            "parsed": parsed,
+            "unchanged": len(seen) - parsed,
+            "removed": len(removed),
+            "errors": errors,
+        }
+
+    def dumps(self):
+        return json.dumps({"v": VERSION, "files": self.files})
+
+    def loads(self, data):
+        data = json.loads(data)
+        # An index from another version is just dropped and rebuilt
+        self.files = data["files"] if data.get("v") == VERSION else {}
+
+    def find_module(self, module, from_path=None, level=0):
+        if level:
+            # The package level dots up from from_path; for a file at the top
+            # of the project, and beyond, that is the project root
+            base = module_name("/".join(from_path.split("/")[:-level]) if from_path else "")
+            module = ".".join(m for m in (base, module) if m)
+        if not module:
+            return None
+        best = None
+        for p in self.files:
+            m = module_name(p)
+            if m == module:
+                return p
+            if best is None and m.endswith("." + module):
+                best = p
+        return best
+
+    # Candidate definitions of name as seen from from_path, best first:
+    # the file's own module-level definition, then what an import of that
+    # name leads to, then any definition of the name anywhere (methods and
+    # attributes included).
+    def definitions(self, name, from_path=None):
+        res = []
+        seen = set()
+
+        def add(path, d):
+            key = (path, d[2])
+            if key not in seen:
+                seen.add(key)
+                res.append([path, d[2], d[1], d[3]])
+
+        todo = [(from_path, name)]
+        # Follow re-exports, but not forever
+        for _ in range(8):
+            if not todo:
+                break
+            path, n = todo.pop()
+            e = self.files.get(path)
+            if e is None:
+                continue
+            found = False
+            for d in e[DEFS]:
+                if d[0] == n and not d[3]:
+                    add(path, d)
+                    found = True
+            if found:
+                continue
+            for local, module, orig, line, level in e[IMPORTS]:
+                if local != n:
+                    continue
+                if orig is None:
+                    target = self.find_module(module, path, level)
+                    if target is not None:
+                        add(target, [n, "module", 1, ""])
+                    continue
+                target = self.find_module(module, path, level)
+                if target is None:
+                    # "from package import module"
+                    target = self.find_module((module + "." if module else "") + orig, path, level)
+                    if target is not None:
+                        add(target, [n, "module", 1, ""])
+                    continue
+                todo.append((target, orig))
+
+        for path, e in self.files.items():
+            for d in e[DEFS]:
+                if d[0] == name:
+                    add(path, d)
+        return res
+
+    # Where name is used, by file and line. Where it is imported under
+    # another name ("from constants import FOO as F"), the uses of that
+    # alias count too, as do imports of the alias from that module.
+    def aliases(self, name):
+        res = {p: {name} for p in self.files}
+        # Each round follows one more import, but not forever
+        for _ in range(8):
+            changed = False
+            for path, e in self.files.items():
+                names = res[path]
+                for local, module, orig, line, level in e[IMPORTS]:
+                    if orig is None or local in names:
+                        continue
+                    if orig != name:
+                        target = self.find_module(module, path, level)
+                        if target is None or orig not in res[target]:
+                            continue
+                    names.add(local)
+                    changed = True
+            if not changed:
+                break
+        return res
+
+    def references(self, name):
+        res = []
+        for path, names in sorted(self.aliases(name).items()):
+            refs = self.files[path][REFS]
+            lines = set()
+            for n in names:
+                lines.update(refs.get(n, ()))
+            for line in sorted(lines):
+                res.append([path, line])
+        return res
+
+
+index = SymbolIndex()
@@ -0,0 +1,72 @@
+# Input and output of a tools job, for data that is not worth a file (see
+# runToolsJob() in tools_vm.js). Where the IDE can reach the memory of the VM,
+# it copies the input straight into a bytearray here, and reads the output
+# straight out of another; otherwise both go through /tmp, like any file.
+#
+# A job reads its input with read() or read_text(), and writes its output,
+# in as many pieces as it likes, with write().
+
+try:
+    import uctypes
+except ImportError:
+    uctypes = None
+
+IN_PATH = "/tmp/toolio.in"
+OUT_PATH = "/tmp/toolio.out"
+
+_direct = False
+_in = None
+_out = bytearray()
+
+
+def begin(size, direct):
+    # Makes room for `size` bytes of input. Returns its address, or None if the
+    # input is to be written to IN_PATH instead.
+    global _direct, _in, _out
+    _direct = bool(direct and uctypes)
+    _out = bytearray()
+    if _direct:
+        _in = bytearray(size)
+        return uctypes.addressof(_in)
+    _in = None
+    return None
+
+
+def read():
+    # The input: a memoryview where it came in directly, so not copied
+    if _in is not None:
+        return memoryview(_in)
+    with open(IN_PATH, "rb") as f:
+        return f.read()
+
+
+def read_text():
+    return str(read(), "utf-8")
+
+
+def write(data):
+    # Appends to the output; str is encoded as UTF-8
+    if isinstance(data, str):
+        data = data.encode()
+    _out.extend(data)
+
+
+def end():
+    # Where the output is: its address, or None once it is written to OUT_PATH.
+    # Its length is out_len().
+    if _direct:
+        return uctypes.addressof(_out)
+    with open(OUT_PATH, "wb") as f:
+        f.write(_out)
+    return None
+
+
+def out_len():
+    return len(_out)
+
+
+def reset():
+    # Lets go of the input and output of the last job
+    global _in, _out
+    _in = None
+    _out = bytearray()
@@ -27,15 +27,15 @@ def get_indent(l):
             return i, l[i:]
 
 
-def get_str(l, readline):
+# The string starting at l[p], and the line and position it ends at
+def get_str(l, p, readline):
     lineno = 0
     s = io.StringIO()
 
-    if l.startswith('"""') or l.startswith("'''"):
-        sep = l[0:3]
+    if l.startswith('"""', p) or l.startswith("'''", p):
+        sep = l[p:p + 3]
         s.write(sep)
-        l = l[3:]
-        pos = 0
+        start = pos = p + 3
         while True:
             i = l.find(sep, pos)
             if i >= 0:
@@ -43,32 +43,33 @@ def get_str(l, readline):
                     pos = i + 1
                     continue
                 break
-            s.write(l)
+            s.write(l[start:])
             l = readline()
-            pos = 0
+            start = pos = 0
             assert l
             lineno += 1
-        s.write(l[:i + 3])
-        return s.getvalue(), l[i + 3:], lineno
+        s.write(l[start:i + 3])
+        return s.getvalue(), l, i + 3, lineno
 
-    lbuf = io.StringIO(l)
-    sep = lbuf.read(1)
+    sep = l[p]
     s.write(sep)
-    while True:
-        c = lbuf.read(1)
-        if not c:
-            break
+    p += 1
+    while p < len(l):
+        c = l[p]
+        p += 1
         s.write(c)
         if c == "\\":
-            c = lbuf.read(1)
+            c = l[p:p + 1]
+            p += 1
             s.write(c)
             if c == "\n":
-                lbuf = io.StringIO(readline())
+                l = readline()
+                p = 0
                 lineno += 1
                 continue
         elif c == sep:
             break
-    return s.getvalue(), lbuf.read(), lineno
+    return s.getvalue(), l, p, lineno
 
 
 def generate_tokens(readline):
@@ -113,86 +114,90 @@ def generate_tokens(readline):
                     yield TokenInfo(DEDENT, "", lineno, 0, org_l)
                     indent_stack.pop()
 
-        while l:
-            if l[0].isdigit() or (l.startswith(".") and len(l) > 1 and l[1].isdigit()):
+        # Scanned by position: slicing off each token would copy the rest
+        # of the line every time, which is quadratic on long lines. After a
+        # multi-line string, l is the last line of it, which need not end in
+        # "\n", so past the end of l has to read as nothing
+        p = 0
+        while p < len(l):
+            c = l[p]
+            if c.isdigit() or (c == "." and l[p + 1:p + 2].isdigit()):
                 seen_dot = False
                 t = ""
-                if l.startswith("0x") or l.startswith("0X"):
+                if l[p:p + 2] in ("0x", "0X"):
                     t = "0x"
-                    l = l[2:]
-                elif l.startswith("0o") or l.startswith("0O"):
+                    p += 2
+                elif l[p:p + 2] in ("0o", "0O"):
                     t = "0o"
-                    l = l[2:]
-                elif l.startswith("0b") or l.startswith("0B"):
+                    p += 2
+                elif l[p:p + 2] in ("0b", "0B"):
                     t = "0b"
-                    l = l[2:]
-                while l and (l[0].isdigit() or l[0] == "." or l[0] == "_" or (t.startswith("0x") and l[0] in "ABCDEFabcdef")):
-                    if l[0] == ".":
+                    p += 2
+                start = p
+                while p < len(l) and (l[p].isdigit() or l[p] == "." or l[p] == "_" or (t == "0x" and l[p] in "ABCDEFabcdef")):
+                    if l[p] == ".":
                         if seen_dot:
                             break
                         seen_dot = True
-                    t += l[0]
-                    l = l[1:]
-                if l.startswith("e") or l.startswith("E"):
-                    t += l[0]
-                    l = l[1:]
-                    if l[0] in ("+", "-"):
-                        t += l[0]
-                        l = l[1:]
-                    while l and (l[0].isdigit() or l[0] == "_"):
-                        t += l[0]
-                        l = l[1:]
-                if l.startswith("j"):
-                    t += l[0]
-                    l = l[1:]
-                yield TokenInfo(NUMBER, t, lineno, 0, org_l)
-            elif l[0].isalpha() or l.startswith("_") or ord(l[0]) >= 0xaa:
-                name = ""
-                while l and (l[0].isalpha() or l[0].isdigit() or l.startswith("_") or ord(l[0]) >= 0xaa):
-                    name += l[0]
-                    l = l[1:]
-                if (l.startswith('"') or l.startswith("'")) and name in ("b", "r", "rb", "br", "u", "f"):
-                    s, l, lineno_delta = get_str(l, readline)
+                    p += 1
+                if l[p:p + 1] in ("e", "E"):
+                    p += 1
+                    if l[p:p + 1] in ("+", "-"):
+                        p += 1
+                    while p < len(l) and (l[p].isdigit() or l[p] == "_"):
+                        p += 1
+                if l.startswith("j", p):
+                    p += 1
+                yield TokenInfo(NUMBER, t + l[start:p], lineno, 0, org_l)
+            elif c.isalpha() or c == "_" or ord(c) >= 0xaa:
+                start = p
+                while p < len(l) and (l[p].isalpha() or l[p].isdigit() or l[p] == "_" or ord(l[p]) >= 0xaa):
+                    p += 1
+                name = l[start:p]
+                if l[p:p + 1] in ('"', "'") and name in ("b", "r", "rb", "br", "u", "f"):
+                    s, l, p, lineno_delta = get_str(l, p, readline)
                     yield TokenInfo(STRING, name + s, lineno, 0, org_l)
                     lineno += lineno_delta
                 else:
                     yield TokenInfo(NAME, name, lineno, 0, org_l)
-            elif l == "\\\n":
+            elif c == "\\" and p == len(l) - 2 and l.endswith("\n"):
                 l = readline()
+                p = 0
                 lineno += 1
-            elif l[0] == "\n":
+            elif c == "\n":
                 nl = "" if no_newline else "\n"
                 if paren_level > 0:
                     yield TokenInfo(NL, nl, lineno, 0, org_l)
                 else:
                     yield TokenInfo(NEWLINE, nl, lineno, 0, org_l)
                 break
-            elif l[0].isspace():
-                l = l[1:]
-            elif l.startswith('"') or l.startswith("'"):
-                s, l, lineno_delta = get_str(l, readline)
+            elif c.isspace():
+                p += 1
+            elif c == '"' or c == "'":
+                s, l, p, lineno_delta = get_str(l, p, readline)
                 yield TokenInfo(STRING, s, lineno, 0, org_l)
                 lineno += lineno_delta
-            elif l.startswith("#"):
-                yield TokenInfo(COMMENT, l.rstrip("\n"), lineno, 0, org_l)
+            elif c == "#":
+                yield TokenInfo(COMMENT, l[p:].rstrip("\n"), lineno, 0, org_l)
                 l = "\n"
+                p = 0
             else:
                 for op in (
                     "**=", "//=", ">>=", "<<=", "+=", "-=", "*=", "/=",
                     "%=", "@=", "&=", "|=", "^=", "**", "//", "<<", ">>",
                     "==", "!=", ">=", "<=", "...", "->"
                 ):
-                    if l.startswith(op):
+                    if l.startswith(op, p):
                         yield TokenInfo(OP, op, lineno, 0, org_l)
-                        l = l[len(op):]
+                        p += len(op)
                         break
                 else:
-                    yield TokenInfo(OP, l[0], lineno, 0, org_l)
-                    if l[0] in ("(", "[", "{"):
+                    yield TokenInfo(OP, c, lineno, 0, org_l)
+                    if c in ("(", "[", "{"):
                         paren_level += 1
-                    elif l[0] in (")", "]", "}"):
+                    elif c in (")", "]", "}"):
                         paren_level -= 1
-                    l = l[1:]
+                    p += 1
 
     while indent_stack[-1] > 0:
         yield TokenInfo(DEDENT, "", lineno, 0, "")
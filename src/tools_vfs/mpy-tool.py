@@ -1583,7 +1583,76 @@ def disassemble_mpy(compiled_modules):
         cm.disassemble()
 
 
-def freeze_mpy(firmware_qstr_idents, compiled_modules):
+def print_c_array(ctype, name, values):
+    print("const %s %s[%d] = {" % (ctype, name, len(values)))
+    for i in range(0, len(values), 16):
+        print("    " + " ".join("%d," % v for v in values[i : i + 16]))
+    print("};")
+
+
+def freeze_qstr_index(kind, new, hashes):
+    # An optional lookup index over the frozen qstr pool: "buckets" (by
+    # qstr hash) or "phash" (minimal perfect hash, see makeqstrdata.py).
+    # It is guarded by MICROPY_QSTR_FROZEN_INDEX, which no MicroPython
+    # firmware defines or reads as yet: the tables are for experimenting
+    # with lookup cost, and the report is what they are for today.
+    # Returns lines for the report at the end.
+    n = len(new)
+    report = [
+        "qstr lookup, binary search: %.2f average, %d worst comparisons"
+        % qstrutil.probe_stats(qstrutil.bisect_probes(n))
+    ]
+    if not n:
+        return report
+    ctype, size = ("uint16_t", 2) if n < 0x10000 else ("uint32_t", 4)
+
+    if kind == "phash":
+        pool = [q[3] for q in new]
+        try:
+            seeds, slots, overflow = qstrutil.make_perfect_hash(pool)
+        except ValueError as er:
+            print("warning: qstr perfect hash: %s, using buckets instead" % er, file=sys.stderr)
+            report.append("qstr lookup, perfect hash: %s, using buckets" % er)
+            kind = "buckets"
+    print()
+    print("#if MICROPY_QSTR_FROZEN_INDEX")
+    if kind == "phash":
+        print("// Minimal perfect hash of the pool: with h the 32-bit qstr hash,")
+        print(
+            "// index = slots[fmix32(h ^ seeds[fmix32(h) %% %d]) %% %d]" % (len(seeds), len(slots))
+        )
+        print("// and if that entry is another string, one of the overflow entries,")
+        print("// whose h is also that of an entry in slots")
+        print("#define MP_QSTR_FROZEN_PHASH_OVERFLOW (%d)" % len(overflow))
+        print_c_array(ctype, "mp_qstr_frozen_const_phash_seeds", seeds)
+        print_c_array(ctype, "mp_qstr_frozen_const_phash_slots", slots)
+        if overflow:
+            print_c_array(ctype, "mp_qstr_frozen_const_phash_overflow", overflow)
+        report.append(
+            "qstr lookup, perfect hash: %.2f average, %d worst comparisons, %d bytes"
+            % (
+                qstrutil.probe_stats(qstrutil.phash_probes(pool, seeds, slots, overflow))
+                + ((len(seeds) + len(slots) + len(overflow)) * size,)
+            )
+        )
+    else:
+        n_buckets = 1
+        while n_buckets < n:
+            n_buckets *= 2
+        starts, order = qstrutil.make_bucket_index(hashes, n_buckets)
+        print("// Hash index of the pool: the entries with (hash & %d) == b are" % (n_buckets - 1))
+        print("// mp_qstr_frozen_const_index[starts[b]] up to [starts[b + 1]]")
+        print_c_array(ctype, "mp_qstr_frozen_const_index_starts", starts)
+        print_c_array(ctype, "mp_qstr_frozen_const_index", order)
+        report.append(
+            "qstr lookup, hash buckets: %.2f average, %d worst comparisons, %d bytes"
+            % (qstrutil.probe_stats(qstrutil.bucket_probes(starts)) + ((len(starts) + n) * size,))
+        )
+    print("#endif")
+    return report
+
+
+def freeze_mpy(firmware_qstr_idents, compiled_modules, qstr_index=None):
     # add to qstrs
     new = {}
     for q in global_qstrs.qstrs:
@@ -1660,20 +1729,21 @@ def freeze_mpy(firmware_qstr_idents, compiled_modules):
     raw_code_count = 0
     raw_code_content = 0
 
+    # Hashes, lengths and data of the whole pool in one go
+    hashes, lengths, data = qstrutil.make_pool(
+        config.MICROPY_QSTR_BYTES_IN_LEN, config.MICROPY_QSTR_BYTES_IN_HASH, [q[3] for q in new]
+    )
     if config.MICROPY_QSTR_BYTES_IN_HASH:
         print()
         print("const qstr_hash_t mp_qstr_frozen_const_hashes[] = {")
-        for _, _, _, qbytes in new:
-            qhash = qstrutil.compute_hash(qbytes, config.MICROPY_QSTR_BYTES_IN_HASH)
-            print("    %d," % qhash)
-            qstr_content += config.MICROPY_QSTR_BYTES_IN_HASH
+        print("".join("    %d,\n" % qhash for qhash in hashes), end="")
+        qstr_content += config.MICROPY_QSTR_BYTES_IN_HASH * len(hashes)
         print("};")
     print()
     print("const qstr_len_t mp_qstr_frozen_const_lengths[] = {")
-    for _, _, _, qbytes in new:
-        print("    %d," % len(qbytes))
-        qstr_content += config.MICROPY_QSTR_BYTES_IN_LEN
-        qstr_content += len(qbytes) + 1  # include NUL
+    print("".join("    %d,\n" % qlen for qlen in lengths), end="")
+    qstr_content += config.MICROPY_QSTR_BYTES_IN_LEN * len(lengths)
+    qstr_content += sum(lengths) + len(lengths)  # include NUL
     print("};")
     print()
     print("extern const qstr_pool_t mp_qstr_const_pool;")
@@ -1687,11 +1757,17 @@ def freeze_mpy(firmware_qstr_idents, compiled_modules):
         print("    (qstr_hash_t *)mp_qstr_frozen_const_hashes,")
     print("    (qstr_len_t *)mp_qstr_frozen_const_lengths,")
     print("    {")
-    for _, _, qstr, qbytes in new:
-        print('        "%s",' % qstrutil.escape_bytes(qstr, qbytes))
+    pos = 0
+    for i, q in enumerate(new):
+        qlen = lengths[i]
+        print('        "%s",' % qstrutil.escape_bytes(q[2], data[pos : pos + qlen]))
+        pos += qlen
     print("    },")
     print("};")
 
+    if qstr_index:
+        qstr_index_report = freeze_qstr_index(qstr_index, new, hashes)
+
     # Freeze all modules.
     for idx, cm in enumerate(compiled_modules):
         cm.freeze(idx)
@@ -1740,6 +1816,9 @@ def freeze_mpy(firmware_qstr_idents, compiled_modules):
     print("/*")
     print("byte sizes:")
     print("qstr content: %d unique, %d bytes" % (len(new), qstr_content))
+    if qstr_index:
+        for line in qstr_index_report:
+            print(line)
     print("bc content: %d" % bc_content)
     print("const str content: %d" % const_str_content)
     print("const int content: %d" % const_int_content)
@@ -2109,6 +2188,12 @@ def main(args=None):
         help="extract only segments of the given type (meta, qstr, obj, code)",
     )
     cmd_parser.add_argument("-q", "--qstr-header", help="qstr header file to freeze against")
+    cmd_parser.add_argument(
+        "--qstr-index",
+        choices=["buckets", "phash"],
+        help="also emit a lookup index for the frozen qstr pool (under "
+        "MICROPY_QSTR_FROZEN_INDEX, which no firmware reads yet), and report probe counts",
+    )
     cmd_parser.add_argument(
         "-mlongint-impl",
         choices=["none", "longlong", "mpz"],
@@ -2187,7 +2272,7 @@ def main(args=None):
 
         if args.freeze:
             try:
-                freeze_mpy(firmware_qstr_idents, compiled_modules)
+                freeze_mpy(firmware_qstr_idents, compiled_modules, args.qstr_index)
             except FreezeError as er:
                 print(er, file=sys.stderr)
                 sys.exit(1)
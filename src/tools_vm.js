@@ -0,0 +1,584 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * The tools VM: the MicroPython instance that runs the Python tools in tools_vfs
+ * (parser, minifier, optimizer, disassembler, symbol index).
+ *
+ * Work is handed to it as jobs - files to write into its FS, Python code to run,
+ * files to read back - so that the same job can run in this thread, or in one of
+ * the tools workers (tools_worker.js) through ToolsPool, without the callers in
+ * python_utils.js knowing which. Only this module and the worker touch the VM.
+ * mpy-cross runs the same way, as { compile: [name, source, options] } jobs, and
+ * so does Ruff, as { ruff: source } jobs.
+ *
+ * tools_vfs.tar.gz is unpacked when a VM starts. Packages that only some jobs
+ * need come in archives of their own, which a job names in `archives` and
+ * which are unpacked into a VM the first time one of its jobs needs them.
+ *
+ * What an archive unpacks to is kept in IndexedDB, per build, so that from the
+ * second page load on a VM starts without fetching and unpacking anything.
+ * Its modules come precompiled (see build.py), so there is no compiled state
+ * worth keeping besides - the rest of a VM's state cannot be saved.
+ */
+
+import { loadMicroPython } from '@micropython/micropython-webassembly-pyscript/micropython.mjs'
+import { compile as mpyCross } from '@vshymanskyy/mpy-cross-wasm'
+import __wbg_init, { PositionEncoding, Workspace as RuffWorkspace } from '@astral-sh/ruff-wasm-web'
+import { KeyValueStore, idbAvailable } from './idb_store.js'
+import { readTar } from './tar.js'
+
+/* Streams the tar.gz at `url` through readTar() */
+async function fetchTar(url, sink) {
+    const response = await fetch(url)
+    if (!response.ok) {
+        throw new Error(`Failed to fetch ${url}`)
+    }
+    await readTar(response.body.pipeThrough(new DecompressionStream('gzip')), sink)
+}
+
+/* The entries of a tar.gz, as [path, data]: data is null for a directory */
+export async function fetchVFS(url) {
+    const entries = []
+    await fetchTar(url, {
+        dir(path) {
+            entries.push(['/' + path, null])
+        },
+        file(path, size) {
+            const data = new Uint8Array(size)
+            entries.push(['/' + path, data])
+            let at = 0
+            return {
+                write(bytes) {
+                    data.set(bytes, at)
+                    at += bytes.length
+                },
+                close() {},
+            }
+        },
+    })
+    return entries
+}
+
+function mkdirVFS(vm, path) {
+    // Archives unpacked into the same VM can share directories
+    if (!vm.FS.analyzePath(path).exists) {
+        vm.FS.mkdir(path)
+    }
+}
+
+export function writeVFS(vm, entries) {
+    for (const [path, data] of entries) {
+        if (data === null) {
+            mkdirVFS(vm, path)
+        } else {
+            vm.FS.writeFile(path, data)
+        }
+    }
+}
+
+/* Unpacks the tar.gz at `url` into the FS of `vm`, each file as its blocks arrive */
+export async function loadVFS(vm, url) {
+    await fetchTar(url, {
+        dir(path) {
+            mkdirVFS(vm, '/' + path)
+        },
+        file(path, _size) {
+            const stream = vm.FS.open('/' + path, 'w')
+            return {
+                write(bytes) {
+                    vm.FS.write(stream, bytes, 0, bytes.length)
+                },
+                close() {
+                    vm.FS.close(stream)
+                },
+            }
+        },
+    })
+}
+
+const _snapshots = idbAvailable() ? new KeyValueStore('viper-tools', 'snapshots') : null
+
+/* What the archive `name` unpacks to: from the snapshot of this build, if there is one */
+async function readArchive(name) {
+    const url = `${VIPER_IDE_BASE_URL}/assets/${name}`
+    if (!_snapshots) {
+        return await fetchVFS(url)
+    }
+    const key = `${name}@${VIPER_IDE_VERSION}-${VIPER_IDE_BUILD}`
+    try {
+        const entries = await _snapshots.get(key)
+        if (entries) { return entries }
+    } catch (err) {
+        console.warn(`Cannot read tools snapshot: ${err}`)
+    }
+    const entries = await fetchVFS(url)
+    // Written in the background; snapshots of other builds are of no use any more
+    _snapshots.keys().then((keys) => Promise.all(keys
+        .filter(k => k.startsWith(name + '@') && k !== key)
+        .map(k => _snapshots.delete(k))
+    )).then(() => _snapshots.put(key, entries)).catch((err) => {
+        console.warn(`Cannot save tools snapshot: ${err}`)
+    })
+    return entries
+}
+
+/* The archive python_minifier comes in */
+export const MINIFIER_ARCHIVE = 'tools_minifier.tar.gz'
+
+const _archives = new WeakMap()    // vm -> Set of the archives unpacked into it
+
+async function loadArchives(vm, names) {
+    let loaded = _archives.get(vm)
+    if (!loaded) {
+        _archives.set(vm, loaded = new Set())
+    }
+    for (const name of names) {
+        if (!loaded.has(name)) {
+            writeVFS(vm, await readArchive(name))
+            loaded.add(name)
+        }
+    }
+}
+
+export async function createToolsVM() {
+    const [vm, entries] = await Promise.all([
+        loadMicroPython({
+            pystack: 64 * 1024,
+            heapsize: 32 * 1024 * 1024,
+            url: `${VIPER_IDE_BASE_URL}/assets/micropython.wasm`,
+            //stdout: (data) => { console.log(data) },
+        }),
+        readArchive('tools_vfs.tar.gz'),
+    ])
+    writeVFS(vm, entries)
+    return vm
+}
+
+const encoder = new TextEncoder()
+const decoder = new TextDecoder()
+
+function toBytes(data) {
+    if (typeof data === 'string') { return encoder.encode(data) }
+    return ArrayBuffer.isView(data) ? data : new Uint8Array(data)
+}
+
+/*
+ * The memory of the VM, where the MicroPython module lets us at it. Read it
+ * anew each time: the view is replaced whenever the memory grows.
+ */
+function vmHeap(vm) {
+    return (vm._module && vm._module.HEAPU8) || null
+}
+
+/*
+ * Hands the `input` of a job to the toolio module (tools_vfs/lib/toolio.py).
+ * Returns the way it went: 'direct' into the memory of the VM, or 'fs'.
+ */
+function beginToolIO(vm, toolio, input) {
+    const data = toBytes(input ?? '')
+    const addr = toolio.begin(data.length, vmHeap(vm) !== null)
+    if (addr == null) {
+        vm.FS.writeFile('/tmp/toolio.in', data)
+        return 'fs'
+    }
+    vmHeap(vm).set(data, addr)
+    return 'direct'
+}
+
+/* The output a job wrote through toolio, copied out once */
+function endToolIO(vm, toolio, encoding) {
+    const addr = toolio.end()
+    const data = (addr == null)
+        ? vm.FS.readFile('/tmp/toolio.out')
+        : vmHeap(vm).slice(addr, addr + toolio.out_len())
+    return (encoding === 'binary') ? data : decoder.decode(data)
+}
+
+/*
+ * Runs a job: { write: [[path, data]], code, read: [[path, encoding]] }
+ * (the `archives` it needs must already be unpacked).
+ * `data` is a string or bytes, `encoding` 'utf8' or 'binary'. Returns what was
+ * read, in order: strings, or Uint8Arrays for 'binary'.
+ *
+ * Data that only lives for the job is better passed as `input` (a string or
+ * bytes), which the code gets from toolio.read(), and `output` (an encoding),
+ * which it writes with toolio.write() and comes last in the result. Where the
+ * memory of the VM can be reached, neither goes through the FS; `stats.io`, if
+ * `stats` is given, is set to the way they went (see beginToolIO()).
+ */
+export function runToolsJob(vm, { write=[], code, read=[], input, output }, stats=null) {
+    for (const [path, data] of write) {
+        vm.FS.writeFile(path, data)
+    }
+    const toolio = (input !== undefined || output) ? vm.pyimport('toolio') : null
+    try {
+        if (toolio) {
+            const io = beginToolIO(vm, toolio, input)
+            if (stats) {
+                stats.io = io
+            }
+        }
+        vm.runPython(code)
+        const res = read.map(([path, encoding]) => (encoding === 'binary')
+            ? vm.FS.readFile(path)
+            : vm.FS.readFile(path, { encoding }))
+        if (output) {
+            res.push(endToolIO(vm, toolio, output))
+        }
+        return res
+    } finally {
+        if (toolio) {
+            toolio.reset()
+        }
+    }
+}
+
+let _ruff_wspace
+
+/* The Ruff workspace of this thread, or null if Ruff failed to load */
+export async function getRuffWorkspace() {
+    if (_ruff_wspace) { return _ruff_wspace }
+    try {
+        await __wbg_init({
+            module_or_path: `${VIPER_IDE_BASE_URL}/assets/ruff_wasm_bg.wasm`,
+        })
+        console.log('Ruff', RuffWorkspace.version())
+        _ruff_wspace = new RuffWorkspace({
+            'line-length': 120,
+            lint: {
+                ignore: [
+                    'I001',     // Import block is un-sorted or un-formatted
+                    'UP031',    // Use format specifiers instead of percent format
+                ],
+            },
+            builtins: [
+                'const',            // should be imported, but often used as a builtin
+                'execfile',         // often used as a builtin
+                // Viper code
+                //'ViperTypeError', // rarely used
+                //'int',            // already a builtin
+                'uint',
+                'ptr',
+                'ptr8',
+                'ptr16',
+                'ptr32',
+            ],
+        }, PositionEncoding.Utf16)
+    } catch (err) {
+        console.error(`Failed to init Ruff workspace: ${err}`)
+    }
+    return _ruff_wspace
+}
+
+/*
+ * Runs any job: mpy-cross and Ruff ones need no VM, so `getVM` is only called for
+ * the others, after unpacking the archives the job names. Returns what mpy-cross
+ * does, Ruff's diagnostics (null if Ruff is not available), or what runToolsJob()
+ * does. `stats` goes to runToolsJob().
+ */
+export async function runJob(getVM, job, stats=null) {
+    if (job.compile) {
+        const { status, out, err, mpy } = await mpyCross(...job.compile)
+        return { status, out, err, mpy }
+    }
+    if (job.ruff !== undefined) {
+        const ruff = await getRuffWorkspace()
+        return ruff ? ruff.check(job.ruff) : null
+    }
+    const vm = await getVM()
+    if (job.archives) {
+        await loadArchives(vm, job.archives)
+    }
+    return runToolsJob(vm, job, stats)
+}
+
+function byteSize(data) {
+    if (data == null) { return 0 }
+    return (typeof data === 'string') ? data.length : data.byteLength
+}
+
+/*
+ * runJob(), measured: resolves to { result, stats }, stats being what the VM
+ * side knows of the call (see recordToolsCall() in tools_profile.js) - time
+ * spent here, the Python heap in use before and after, bytes in and out, and
+ * for jobs with `input` or `output`, the way those went (`io`).
+ * String sizes are in UTF-16 units, as encoding them only to count would
+ * skew what is measured.
+ */
+export async function runProfiledJob(getVM, job) {
+    const usesVM = !job.compile && job.ruff === undefined
+    const heap = usesVM ? (await getVM()).pyimport('gc') : null
+    const stats = {
+        inBytes: (job.write || []).reduce((n, [_, d]) => n + byteSize(d), 0)
+                 + byteSize(job.input ?? job.ruff ?? (job.compile && job.compile[1])),
+    }
+    if (heap) {
+        stats.heapBefore = heap.mem_alloc()
+    }
+    const t0 = performance.now()
+    const result = await runJob(getVM, job, stats)
+    stats.vmMs = performance.now() - t0
+    if (heap) {
+        stats.heapAfter = heap.mem_alloc()
+    }
+    if (job.compile) {
+        stats.outBytes = byteSize(result.mpy)
+    } else if (usesVM) {
+        stats.outBytes = result.reduce((n, r) => n + byteSize(r), 0)
+    }
+    return { result, stats }
+}
+
+/* Buffers of a job result that can be transferred rather than copied */
+export function jobTransferables(result) {
+    if (result && result.stats) {
+        return jobTransferables(result.result)
+    }
+    if (Array.isArray(result)) {
+        return result.filter(r => r instanceof Uint8Array).map(r => r.buffer)
+    }
+    return (result && result.mpy) ? [result.mpy.buffer] : []
+}
+
+function abortError(signal) {
+    return signal.reason ?? new DOMException('The operation was aborted', 'AbortError')
+}
+
+/* The worker could not be started: the job has not been sent and can run elsewhere */
+export class ToolsWorkerUnavailable extends Error {}
+
+/*
+ * Client of one tools worker. Jobs are queued here and sent one at a time, so a
+ * job can be cancelled (through an AbortSignal) until it starts. Cancelling the
+ * running one terminates the worker, as runPython() cannot be interrupted - the
+ * next job starts a fresh VM, and whatever state the old one kept is gone.
+ *
+ * Nothing is sent before the worker reports its VM ready, so if that never
+ * happens, the jobs fail with ToolsWorkerUnavailable, their data untouched.
+ */
+export class ToolsWorker {
+    constructor(url) {
+        this.url = url
+        this.worker = null
+        this.ready = null       // resolves when the VM is up, rejects if it cannot be
+        this.queue = []
+        this.current = null
+        this.nextId = 1
+        this.broken = false
+    }
+
+    get busy() {
+        return this.current !== null
+    }
+
+    get pending() {
+        return this.queue.length + (this.current ? 1 : 0)
+    }
+
+    run(job, { signal=null } = {}) {
+        return new Promise((resolve, reject) => {
+            if (this.broken) {
+                return reject(new ToolsWorkerUnavailable('Tools worker is not available'))
+            }
+            if (signal && signal.aborted) {
+                return reject(abortError(signal))
+            }
+            const req = { id: this.nextId++, job, signal, resolve, reject }
+            if (signal) {
+                req.onAbort = () => this._abort(req)
+                signal.addEventListener('abort', req.onAbort, { once: true })
+            }
+            this.queue.push(req)
+            this._pump()
+        })
+    }
+
+    /* Starts the worker and its VM ahead of the first job */
+    warmUp() {
+        if (!this.broken) {
+            this._start().catch(() => {})
+        }
+    }
+
+    terminate() {
+        if (this.worker) {
+            this.worker.terminate()
+            this.worker = null
+            this.ready = null
+        }
+    }
+
+    _start() {
+        if (this.ready) { return this.ready }
+        this.ready = new Promise((resolve, reject) => {
+            let worker
+            try {
+                worker = new Worker(this.url)
+            } catch (err) {
+                return reject(err)
+            }
+            this.worker = worker
+            worker.onmessage = (ev) => {
+                const msg = ev.data
+                if ('ready' in msg) {
+                    if (msg.ready) {
+                        resolve()
+                    } else {
+                        reject(new Error(msg.error))
+                    }
+                } else {
+                    this._done(msg)
+                }
+            }
+            worker.onerror = (ev) => {
+                ev.preventDefault()
+                const err = new Error(ev.message || 'Tools worker failed')
+                reject(err)
+                // A worker that fails after it was up takes the running job with it
+                const req = this.current
+                if (this.worker === worker && req && req.sent) {
+                    this.current = null
+                    this._finish(req).reject(err)
+                    this.terminate()
+                    this._pump()
+                }
+            }
+        })
+        return this.ready
+    }
+
+    async _pump() {
+        if (this.current || !this.queue.length) { return }
+        const req = this.current = this.queue.shift()
+        try {
+            await this._start()
+        } catch (err) {
+            console.warn(`Tools worker unavailable: ${err.message}`)
+            this.broken = true
+            this.terminate()
+            const error = new ToolsWorkerUnavailable(err.message)
+            for (const r of [req, ...this.queue.splice(0)]) {
+                this._finish(r).reject(error)
+            }
+            this.current = null
+            return
+        }
+        if (this.current !== req) { return }    // aborted while the VM was starting
+        // Bytes are copied once here and the copy handed over, rather than cloned;
+        // strings are cloned and encoded on the worker's side
+        const transfer = []
+        const handOver = (d) => {
+            if (typeof d !== 'string') {
+                d = new Uint8Array(ArrayBuffer.isView(d) ? d : new Uint8Array(d))
+                transfer.push(d.buffer)
+            }
+            return d
+        }
+        const job = { ...req.job }
+        job.write = (job.write || []).map(([path, d]) => [path, handOver(d)])
+        if (job.input !== undefined) {
+            job.input = handOver(job.input)
+        }
+        this.worker.postMessage({ id: req.id, job }, transfer)
+        req.sent = true
+    }
+
+    _done(msg) {
+        const req = this.current
+        if (!req || req.id !== msg.id) { return }
+        this.current = null
+        const { resolve, reject } = this._finish(req)
+        if ('error' in msg) {
+            reject(new Error(msg.error))
+        } else {
+            resolve(msg.result)
+        }
+        this._pump()
+    }
+
+    _abort(req) {
+        const i = this.queue.indexOf(req)
+        if (i >= 0) {
+            this.queue.splice(i, 1)
+        } else if (this.current === req) {
+            this.current = null
+            if (req.sent) {
+                this.terminate()
+            }
+        } else {
+            return
+        }
+        this._finish(req).reject(abortError(req.signal))
+        this._pump()
+    }
+
+    _finish(req) {
+        if (req.onAbort) {
+            req.signal.removeEventListener('abort', req.onAbort)
+        }
+        return req
+    }
+}
+
+/*
+ * A bounded pool of tools workers. Workers are started as jobs need them: a job
+ * goes to an idle worker, to a new one while there are fewer than `size`, or else
+ * to the one with the shortest queue. Jobs that rely on state kept in a VM (the
+ * symbol index) are pinned to the first worker, so they always find it there.
+ */
+export class ToolsPool {
+    constructor(url, size) {
+        this.url = url
+        this.size = Math.max(1, size)
+        this.workers = []
+    }
+
+    get broken() {
+        return this.workers.some(w => w.broken)
+    }
+
+    run(job, { signal=null, pin=false } = {}) {
+        if (this.broken) {
+            return Promise.reject(new ToolsWorkerUnavailable('Tools worker is not available'))
+        }
+        return this._pick(pin).run(job, { signal })
+    }
+
+    /* Starts `count` workers ahead of the jobs, e.g. when the page is idle */
+    warmUp(count=1) {
+        while (this.workers.length < Math.min(count, this.size)) {
+            this._add()
+        }
+        for (const w of this.workers.slice(0, count)) {
+            w.warmUp()
+        }
+    }
+
+    terminate() {
+        for (const w of this.workers.splice(0)) {
+            w.terminate()
+        }
+    }
+
+    _add() {
+        const w = new ToolsWorker(this.url)
+        this.workers.push(w)
+        return w
+    }
+
+    _pick(pin) {
+        if (pin || !this.workers.length) {
+            return this.workers[0] || this._add()
+        }
+        const idle = this.workers.find(w => !w.pending)
+        if (idle) { return idle }
+        if (this.workers.length < this.size) {
+            return this._add()
+        }
+        return this.workers.reduce((a, b) => (b.pending < a.pending) ? b : a)
+    }
+}
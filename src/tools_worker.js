@@ -0,0 +1,41 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * Hosts a tools VM off the main thread, so that long minifications and
+ * disassemblies do not block the editor; mpy-cross runs here as well. Speaks
+ * to ToolsWorker (tools_vm.js):
+ *
+ *   -> { ready: true } once the VM is up, or { ready: false, error }
+ *   <- { id, job }               job as for runJob()
+ *   -> { id, result } or { id, error }
+ *
+ * A job with `profile` set is run by runProfiledJob(), its result coming back
+ * as { result, stats }.
+ *
+ * Jobs arrive one at a time. Binary results are transferred, not copied.
+ */
+
+import { createToolsVM, runJob, runProfiledJob, jobTransferables } from './tools_vm.js'
+
+let vm = null
+
+self.onmessage = async (ev) => {
+    const { id, job } = ev.data
+    try {
+        const result = await (job.profile ? runProfiledJob : runJob)(() => vm, job)
+        self.postMessage({ id, result }, jobTransferables(result))
+    } catch (err) {
+        self.postMessage({ id, error: err.message || String(err) })
+    }
+}
+
+createToolsVM().then((res) => {
+    vm = res
+    self.postMessage({ ready: true })
+}, (err) => {
+    self.postMessage({ ready: false, error: err.message || String(err) })
+})
@@ -62,6 +62,14 @@ export function joinPath(dir, name) {
     return `${dir}/${name}`
 }
 
+// Hex SHA-256 of `parts` as JSON, or null where there is no SubtleCrypto (plain http).
+export async function digestHex(parts) {
+    if (!globalThis.crypto || !crypto.subtle) { return null }
+    const data = new TextEncoder().encode(JSON.stringify(parts))
+    const hash = new Uint8Array(await crypto.subtle.digest('SHA-256', data))
+    return Array.from(hash, b => b.toString(16).padStart(2, '0')).join('')
+}
+
 // Escapes text for safe interpolation into HTML text nodes or attribute values.
 // Unlike sanitizeHTML(), this does not alter whitespace, so the result round-trips
 // exactly through the HTML parser (needed when the value is later looked up, e.g. via data-* attributes).
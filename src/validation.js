@@ -0,0 +1,120 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The software is provided "as is", without any warranties or guarantees (explicit or implied).
+ * This includes no assurances about being fit for any specific purpose.
+ *
+ * Checks Python as it is being edited: mpy-cross for what MicroPython will reject,
+ * Ruff for the rest, both in the tools workers and side by side.
+ *
+ * A check waits for typing to pause - longer for bigger files - and a document has
+ * at most one check running. What is typed meanwhile is coalesced: once the running
+ * check is done, only the latest content is checked, and whatever it superseded is
+ * never checked at all. Content that was checked before (for the same board) gets
+ * the earlier result back.
+ */
+
+import { digestHex } from './utils.js'
+import { validatePython, lintPython } from './python_utils.js'
+import { recordToolsCall } from './tools_profile.js'
+
+export class ValidationScheduler {
+    /* `validate` and `lint` stand in for validatePython() and lintPython() */
+    constructor({ delay=300, maxDelay=2000, cacheSize=16, validate=validatePython, lint=lintPython } = {}) {
+        this.delay = delay
+        this.maxDelay = maxDelay
+        this.cacheSize = cacheSize
+        this.validate = validate
+        this.lint = lint
+        this.docs = new Map()       // docId -> { timer, next, running }
+        this.results = new Map()    // digest -> promise of a result, least recently used first
+    }
+
+    /*
+     * Resolves to { backtrace, ruff }: what validatePython() and lintPython() return
+     * for `content`. Resolves to null instead if newer content of the same document
+     * came along before this one was checked.
+     */
+    check(docId, content, devInfo) {
+        let doc = this.docs.get(docId)
+        if (!doc) {
+            this.docs.set(docId, doc = { timer: null, next: null, running: false })
+        }
+        if (doc.next) {
+            doc.next.resolve(null)
+        }
+        return new Promise((resolve) => {
+            doc.next = { content, devInfo, resolve }
+            clearTimeout(doc.timer)
+            const wait = Math.min(this.delay + content.length / 50, this.maxDelay)
+            doc.timer = setTimeout(() => {
+                doc.timer = null
+                this._run(doc)
+            }, wait)
+        })
+    }
+
+    /* Drops what is pending for a document that was closed */
+    forget(docId) {
+        const doc = this.docs.get(docId)
+        if (!doc) { return }
+        clearTimeout(doc.timer)
+        if (doc.next) {
+            doc.next.resolve(null)
+        }
+        this.docs.delete(docId)
+    }
+
+    async _run(doc) {
+        if (doc.running || !doc.next) { return }
+        const { content, devInfo, resolve } = doc.next
+        doc.next = null
+        doc.running = true
+        try {
+            resolve(await this._validate(content, devInfo))
+        } catch (err) {
+            console.error('Validation failed', err)
+            resolve(null)
+        } finally {
+            doc.running = false
+            // Content that came in while this ran, and whose wait is already over
+            if (doc.next && !doc.timer) {
+                this._run(doc)
+            }
+        }
+    }
+
+    async _validate(content, devInfo) {
+        const t0 = performance.now()
+        const board = devInfo ? [devInfo.mpy_ver, devInfo.mpy_sub, devInfo.mpy_arch] : null
+        const key = await digestHex([board, content])
+        let result = key && this.results.get(key)
+        const hit = !!result
+        if (hit) {
+            this.results.delete(key)
+        } else {
+            result = Promise.all([
+                this.validate('stdin.py', content, devInfo),
+                this.lint(content).catch((err) => {
+                    console.error('Ruff failed', err)
+                    return null
+                }),
+            ]).then(([backtrace, ruff]) => ({ backtrace, ruff }))
+            if (key) {
+                result.catch(() => this.results.delete(key))
+            }
+        }
+        if (key) {
+            this.results.set(key, result)
+            for (const k of this.results.keys()) {
+                if (this.results.size <= this.cacheSize) { break }
+                this.results.delete(k)
+            }
+        }
+        const res = await result
+        recordToolsCall({ tool: 'validate', cache: key ? (hit ? 'hit' : 'miss') : undefined,
+                          ms: performance.now() - t0, inBytes: content.length })
+        return res
+    }
+}
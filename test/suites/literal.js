@@ -0,0 +1,76 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * ast.literal_eval() of the tools library (src/tools_vfs/lib/ast/literal.py) has
+ * to accept what CPython's accepts, and reject what it rejects. Runs in a tools VM
+ * (see test/tools.js), no board needed.
+ */
+
+import { assert } from 'chai'
+import { loadToolsVM, pyResult } from '../tools.js'
+
+let vm = null
+
+/* repr() of the value of `src`, or null if it is rejected */
+function literal(src) {
+    vm.FS.writeFile('/tmp/literal.txt', src)
+    return pyResult(vm, `
+from ast import literal_eval
+with open('/tmp/literal.txt') as f:
+    _src = f.read()
+try:
+    _res = repr(literal_eval(_src))
+except ValueError:
+    _res = None
+_src = None
+`)
+}
+
+/* The token strings of `src` */
+function tokens(src) {
+    vm.FS.writeFile('/tmp/literal.txt', src)
+    return pyResult(vm, `
+import io, utokenize
+with open('/tmp/literal.txt') as f:
+    _res = [t.string for t in utokenize.generate_tokens(io.StringIO(f.read()).readline)]
+`)
+}
+
+describe('Literal evaluation', function () {
+    before(async function () {
+        vm = await loadToolsVM()
+    })
+
+    it('rejects decimal integers with leading zeros', function () {
+        assert.isNull(literal('010'))
+        assert.isNull(literal('[1, 0_7]'))
+        assert.strictEqual(literal('00'), '0')
+        assert.strictEqual(literal('010.5'), '10.5')
+    })
+
+    it('accepts numbers in brackets', function () {
+        assert.strictEqual(literal('-(1)'), '-1')
+        assert.strictEqual(literal('(1)+(2j)'), '(1+2j)')
+        assert.strictEqual(literal('[((2.5)), -(1)+2j]'), '[2.5, (-1+2j)]')
+        assert.isNull(literal('-(1, 2)'))
+        assert.isNull(literal('(1+2j)+3j'))
+    })
+
+    it('evaluates a long single-line list', function () {
+        this.timeout(60000)
+        const items = []
+        for (let i = 0; i < 20000; i++) {
+            items.push(String(i))
+        }
+        assert.strictEqual(literal(`[${items.join(', ')}]`).length, items.join(', ').length + 2)
+    })
+
+    it('tokenizes what follows a string on the last line', function () {
+        // No newline at the end: the string leaves off on a line that is not
+        // terminated, right where the next token starts
+        assert.deepEqual(tokens('x = """a\nb""" + 1'), ['x', '=', '"""a\nb"""', '+', '1', ''])
+        assert.deepEqual(tokens("x = 'a\\\nb' + y"), ['x', '=', "'a\\\nb'", '+', 'y', ''])
+        assert.isNull(literal('"""a\nb""" + 1'))
+    })
+})
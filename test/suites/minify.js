@@ -0,0 +1,94 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The minifier (src/tools_vfs/lib/minify.py) must not change what a program does.
+ * Each case here is run as written and as minified, and the two have to agree.
+ * Runs in a tools VM (see test/tools.js), no board needed.
+ */
+
+import { assert } from 'chai'
+import { loadToolsVM, pyResult } from '../tools.js'
+
+let vm = null
+
+function minify(src) {
+    vm.FS.writeFile('/tmp/min_in.py', src)
+    return pyResult(vm, `
+import minify
+with open('/tmp/min_in.py') as f:
+    _res = minify.minify(f.read())
+`)
+}
+
+/* What `src` leaves in its global `out` */
+function run(src) {
+    vm.FS.writeFile('/tmp/min_run.py', src)
+    return pyResult(vm, `
+_g = {}
+with open('/tmp/min_run.py') as f:
+    exec(f.read(), _g)
+_res = _g['out']
+`)
+}
+
+/* Minifies src, checks it still does the same, and returns the minified source */
+function sameResult(src, expected) {
+    const min = minify(src)
+    assert.deepEqual(run(src), expected, 'as written')
+    assert.deepEqual(run(min), expected, `as minified:\n${min}`)
+    return min
+}
+
+describe('Minifier', function () {
+    before(async function () {
+        vm = await loadToolsVM()
+    })
+
+    it('renames locals and drops docstrings', function () {
+        const min = sameResult(`
+def f(items):
+    """Sum of the lengths"""
+    total = 0
+    for item in items:
+        total += len(item)
+    return total
+
+out = f(['a', 'bc'])
+`, 3)
+        assert.notInclude(min, 'Sum of the lengths')
+        assert.notInclude(min, 'total')
+        assert.include(min, 'def f(items)')
+    })
+
+    it('leaves names in defaults, annotations and decorators alone', function () {
+        const min = sameResult(`
+LIMIT = 5
+
+def keep(fn):
+    return fn
+
+@keep
+def f(n=LIMIT, *, m: LIMIT = LIMIT) -> LIMIT:
+    LIMIT = n * 2 + m
+    keep = LIMIT
+    return keep
+
+out = [f(), f(1, m=0)]
+`, [15, 2])
+        assert.include(min, 'n=LIMIT')
+        assert.include(min, '@keep')
+    })
+
+    it('leaves functions with nested scopes alone', function () {
+        sameResult(`
+def f():
+    value = 2
+    def get():
+        return value
+    return get()
+
+out = f()
+`, 2)
+    })
+})
@@ -0,0 +1,183 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The source-to-source optimizer (src/tools_vfs/lib/optimize.py) must not change
+ * what a program does. Each case here is run as written and as optimized, and the
+ * two have to agree.
+ *
+ * Needs no board: the optimizer, and the cases, run in a VM of their own (see
+ * test/tools.js).
+ */
+
+import { assert } from 'chai'
+import { loadToolsVM, pyResult } from '../tools.js'
+
+let vm = null
+
+function optimize(src) {
+    vm.FS.writeFile('/tmp/opt_in.py', src)
+    return pyResult(vm, `
+import optimize
+with open('/tmp/opt_in.py') as f:
+    _res = optimize.optimize(f.read())
+`)
+}
+
+/* What `src` leaves in its global `out` */
+function run(src) {
+    vm.FS.writeFile('/tmp/opt_run.py', src)
+    return pyResult(vm, `
+import opt_flag
+opt_flag.running = True
+_g = {}
+with open('/tmp/opt_run.py') as f:
+    exec(f.read(), _g)
+_res = _g['out']
+`)
+}
+
+/* Optimizes src, checks it still does the same, and returns the optimized source */
+function sameResult(src, expected) {
+    const opt = optimize(src)
+    assert.deepEqual(run(src), expected, 'as written')
+    assert.deepEqual(run(opt), expected, `as optimized:\n${opt}`)
+    return opt
+}
+
+describe('Optimizer', function () {
+    before(async function () {
+        vm = await loadToolsVM({ opt_flag: `
+running = True
+
+def stop():
+    global running
+    running = False
+
+def double(x):
+    return x * 2
+` })
+    })
+
+    it('does not hoist a module attribute the loop waits on', function () {
+        const src = `
+import opt_flag
+
+def f():
+    n = 0
+    while opt_flag.running:
+        n += 1
+        if n == 3:
+            opt_flag.stop()
+    return n
+
+out = f()
+`
+        // Checked before running it: hoisted, this would never terminate
+        assert.include(optimize(src), 'while opt_flag.running')
+        sameResult(src, 3)
+    })
+
+    it('does not hoist a module attribute looked up under a guard', function () {
+        sameResult(`
+import sys
+
+def f(items):
+    n = 0
+    for x in items:
+        if hasattr(sys, 'no_such_function'):
+            sys.no_such_function()
+        n += len(x)
+    return n
+
+out = f(['a', 'bc'])
+`, 3)
+    })
+
+    it('hoists builtins but not module functions', function () {
+        const opt = sameResult(`
+import opt_flag
+
+def f(items):
+    n = 0
+    for x in items:
+        n += opt_flag.double(len(x))
+    return n
+
+out = f(['a', 'bc'])
+`, 6)
+        assert.include(opt, '_h_len = len')
+        assert.include(opt, 'opt_flag.double(')
+    })
+
+    it('does not look up module attributes for a loop that never runs', function () {
+        sameResult(`
+import sys
+
+def f():
+    for x in []:
+        sys.no_such_function(x)
+        sys.no_such_function(x)
+    return 1
+
+out = f()
+`, 1)
+    })
+
+    it('sets the loop variable for a global reader of an unrolled loop', function () {
+        sameResult(`
+seen = []
+
+def show():
+    seen.append(i)
+
+for i in range(3):
+    show()
+
+out = seen + [i]
+`, [0, 1, 2, 2])
+    })
+
+    it('sets the loop variable for a closure reader of an unrolled loop', function () {
+        sameResult(`
+def f():
+    seen = []
+    def show():
+        seen.append(i)
+    for i in range(3):
+        show()
+    return seen
+
+out = f()
+`, [0, 1, 2])
+    })
+
+    it('substitutes the loop variable of a plain local', function () {
+        const opt = sameResult(`
+def f():
+    s = 0
+    for i in range(3):
+        s += i * 10
+    return [s, i]
+
+out = f()
+`, [30, 2])
+        assert.notInclude(opt, 'for i')
+    })
+
+    it('does not unroll a loop broken from a nested loop\'s else', function () {
+        sameResult(`
+def f():
+    n = 0
+    for i in range(3):
+        for j in range(0):
+            pass
+        else:
+            break
+        n += 1
+    return n
+
+out = f()
+`, 0)
+    })
+})
@@ -0,0 +1,64 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The lookup indexes mpy-tool --qstr-index builds over the frozen qstr pool (see
+ * src/tools_vfs/lib/makeqstrdata.py): every qstr has to be found, and a string that
+ * is not in the pool has to be reported as such. Runs in a tools VM (see
+ * test/tools.js), no board needed.
+ */
+
+import { assert } from 'chai'
+import { loadToolsVM, pyResult } from '../tools.js'
+
+let vm = null
+
+/* Builds the perfect hash of `names` and looks each of them, and `missing`, up */
+function phash(names, missing) {
+    vm.FS.writeFile('/tmp/qstrs.json', JSON.stringify({ names, missing }))
+    return pyResult(vm, `
+import json, makeqstrdata as m
+with open('/tmp/qstrs.json') as f:
+    d = json.load(f)
+pool = [n.encode() for n in d['names']]
+seeds, slots, overflow = m.make_perfect_hash(pool)
+_res = {
+    'found': [m.phash_lookup(pool, seeds, slots, overflow, q)[0] for q in pool],
+    'missing': [m.phash_lookup(pool, seeds, slots, overflow, n.encode())[0] for n in d['missing']],
+    'overflow': [d['names'][i] for i in overflow],
+    'slots': len(slots),
+}
+d = pool = None
+`)
+}
+
+describe('Frozen qstr index', function () {
+    before(async function () {
+        vm = await loadToolsVM()
+    })
+
+    it('finds every qstr through the perfect hash', function () {
+        const names = []
+        for (let i = 0; i < 500; i++) {
+            names.push(`name_${i.toString(36)}`)
+        }
+        names.sort()
+        const res = phash(names, ['not_there', ''])
+        assert.deepEqual(res.found, names.map((_, i) => i))
+        assert.deepEqual(res.missing, [-1, -1])
+        assert.strictEqual(res.slots + res.overflow.length, names.length)
+    })
+
+    it('handles qstrs whose 32-bit hashes collide', function () {
+        // These two have the same hash, so no seed can ever separate them
+        assert.strictEqual(pyResult(vm, `
+import makeqstrdata as m
+_res = m.full_hash(b'i16') == m.full_hash(b'out')
+`), true)
+        const names = ['abs', 'i16', 'len', 'out', 'print', 'range']
+        const res = phash(names, ['in', 'ou'])
+        assert.deepEqual(res.found, names.map((_, i) => i))
+        assert.deepEqual(res.missing, [-1, -1])
+        assert.deepEqual(res.overflow, ['out'])
+    })
+})
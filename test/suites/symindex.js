@@ -0,0 +1,91 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The project-wide symbol index (src/tools_vfs/lib/symindex.py) behind go to
+ * definition and find references. Runs in a tools VM (see test/tools.js), no
+ * board needed.
+ */
+
+import { assert } from 'chai'
+import { loadToolsVM, pyResult } from '../tools.js'
+
+let vm = null
+
+/* Runs `expr` against the index, after syncing it with `files` ([path, source]) if given */
+function index(expr, files) {
+    vm.FS.writeFile('/tmp/symindex.json', JSON.stringify(files || null))
+    return pyResult(vm, `
+import json, symindex
+with open('/tmp/symindex.json') as f:
+    _files = json.load(f)
+_sync = symindex.index.sync(_files) if _files is not None else None
+_res = {'sync': _sync, 'res': ${expr}}
+_files = _sync = None
+`)
+}
+
+const PROJECT = [
+    ['main.py', 'from . import util\nfrom .consts import LIMIT as L\n\nprint(util.helper(L))\n'],
+    ['util.py', 'def helper(x):\n    return x\n'],
+    ['consts.py', 'LIMIT = 5\n'],
+    ['pkg/__init__.py', 'from .mod import thing\n'],
+    ['pkg/mod.py', 'def thing():\n    pass\n'],
+]
+
+describe('Symbol index', function () {
+    before(async function () {
+        vm = await loadToolsVM()
+    })
+
+    it('finds definitions through imports', function () {
+        const { sync, res } = index(`[
+    symindex.index.definitions('helper', 'util.py'),
+    symindex.index.definitions('thing', 'pkg/__init__.py'),
+]`, PROJECT)
+        assert.strictEqual(sync.parsed, PROJECT.length)
+        assert.deepEqual(res, [
+            [['util.py', 1, 'def', '']],
+            [['pkg/mod.py', 1, 'def', '']],
+        ])
+    })
+
+    it('resolves relative imports in top-level files against the root', function () {
+        const { res } = index(`[
+    symindex.index.definitions('util', 'main.py'),
+    symindex.index.definitions('L', 'main.py'),
+]`)
+        assert.deepEqual(res, [
+            [['util.py', 1, 'module', '']],
+            [['consts.py', 1, 'var', '']],
+        ])
+    })
+
+    it('finds references, aliases included', function () {
+        const { res } = index(`symindex.index.references('LIMIT')`)
+        assert.deepEqual(res, [['consts.py', 1], ['main.py', 2], ['main.py', 4]])
+    })
+
+    it('only parses what changed', function () {
+        const files = PROJECT.filter(([path]) => path !== 'consts.py')
+            .map(([path, source]) => [path, (path === 'util.py') ? `\n\n${source}` : source])
+        const { sync, res } = index(`symindex.index.definitions('helper')`, files)
+        assert.include(sync, { files: 4, parsed: 1, unchanged: 3, removed: 1 })
+        assert.deepEqual(res, [['util.py', 3, 'def', '']])
+    })
+
+    it('reloads a saved index without parsing again', function () {
+        assert.strictEqual(index(`None`, PROJECT).sync.parsed, 2)
+        vm.FS.writeFile('/tmp/symindex.json', JSON.stringify(PROJECT))
+        const sync = pyResult(vm, `
+import json, symindex
+with open('/tmp/symindex.json') as f:
+    _files = json.load(f)
+_ix = symindex.SymbolIndex()
+_ix.loads(symindex.index.dumps())
+_res = _ix.sync(_files)
+_files = _ix = None
+`)
+        assert.include(sync, { parsed: 0, unchanged: PROJECT.length, removed: 0 })
+    })
+})
@@ -0,0 +1,145 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * The streaming tar reader the tools VM and the emulator unpack their archives with.
+ *
+ * src/tar.js has no imports, so like src/zip.js it loads under Node as-is. The
+ * archives are built here by a small ustar writer, and fed to the reader in chunks
+ * of awkward sizes, since the whole point is that a header or a body can be split
+ * anywhere.
+ */
+
+import { assert } from 'chai'
+import { readTar } from '../../src/tar.js'
+
+const enc = new TextEncoder()
+const dec = new TextDecoder()
+
+function header(name, { size=0, type='0' } = {}) {
+    const h = new Uint8Array(512)
+    const put = (at, s) => h.set(enc.encode(s), at)
+    put(0, name)
+    put(100, '0000644\0')
+    put(108, '0000000\0')
+    put(116, '0000000\0')
+    put(124, size.toString(8).padStart(11, '0') + '\0')
+    put(136, '00000000000\0')
+    put(148, '        ')
+    put(156, type)
+    put(257, 'ustar\x0000')
+    const sum = h.reduce((a, b) => a + b, 0)
+    put(148, sum.toString(8).padStart(6, '0') + '\0 ')
+    return h
+}
+
+function padded(data) {
+    const out = new Uint8Array(Math.ceil(data.length / 512) * 512)
+    out.set(data)
+    return out
+}
+
+/* entries: [name, data] with data null for a directory; a name that does not
+   fit the header gets a pax record, as tarfile does */
+function makeTar(entries) {
+    const blocks = []
+    for (const [name, data] of entries) {
+        let stored = name
+        if (enc.encode(name).length > 99) {
+            const rec = ` path=${name}\n`
+            let len = enc.encode(rec).length
+            len += String(len + String(len).length).length
+            const pax = enc.encode(`${len}${rec}`)
+            blocks.push(header('././@PaxHeader', { size: pax.length, type: 'x' }), padded(pax))
+            stored = name.slice(0, 99)
+        }
+        if (data === null) {
+            blocks.push(header(stored + '/', { type: '5' }))
+        } else {
+            blocks.push(header(stored, { size: data.length }), padded(data))
+        }
+    }
+    blocks.push(new Uint8Array(1024))
+    const tar = new Uint8Array(blocks.reduce((a, b) => a + b.length, 0))
+    let at = 0
+    for (const b of blocks) {
+        tar.set(b, at)
+        at += b.length
+    }
+    return tar
+}
+
+function streamOf(bytes, chunkSize) {
+    return new ReadableStream({
+        start(controller) {
+            for (let i = 0; i < bytes.length; i += chunkSize) {
+                controller.enqueue(bytes.slice(i, i + chunkSize))
+            }
+            controller.close()
+        }
+    })
+}
+
+async function unpack(tar, chunkSize) {
+    const entries = []
+    await readTar(streamOf(tar, chunkSize), {
+        dir(path) {
+            entries.push([path, null])
+        },
+        file(path, size) {
+            const chunks = []
+            return {
+                write(bytes) { chunks.push(bytes.slice()) },
+                close() {
+                    const data = new Uint8Array(size)
+                    let at = 0
+                    for (const c of chunks) {
+                        data.set(c, at)
+                        at += c.length
+                    }
+                    assert.strictEqual(at, size, `body of ${path}`)
+                    entries.push([path, dec.decode(data)])
+                },
+            }
+        },
+    })
+    return entries
+}
+
+describe('Streaming tar reader', function () {
+    const long = 'lib/' + 'deeply_nested_'.repeat(10) + 'module.py'
+    const files = [
+        ['lib', null],
+        ['lib/a.py', 'print("a")\n'.repeat(100)],
+        ['lib/empty.py', ''],
+        [long, 'long'],
+        ['lib/block.bin', 'x'.repeat(512)],
+    ]
+    const tar = makeTar(files.map(([n, d]) => [n, d === null ? null : enc.encode(d)]))
+
+    for (const chunkSize of [1, 7, 511, 512, 513, tar.length]) {
+        it(`reads every entry, in chunks of ${chunkSize}`, async function () {
+            assert.deepEqual(await unpack(tar, chunkSize), files)
+        })
+    }
+
+    it('skips the bodies of files it is not asked to keep', async function () {
+        const seen = []
+        await readTar(streamOf(tar, 100), { file(path) { seen.push(path); return null } })
+        assert.deepEqual(seen, files.filter(([_, d]) => d !== null).map(([n]) => n))
+    })
+
+    it('rejects a corrupted header', async function () {
+        const bad = tar.slice()
+        bad[0] ^= 1
+        let error = null
+        try { await unpack(bad, 512) } catch (err) { error = err }
+        assert.match(String(error), /Malformed tar header/)
+    })
+
+    it('rejects a truncated archive', async function () {
+        let error = null
+        try { await unpack(tar.subarray(0, 1500), 512) } catch (err) { error = err }
+        assert.match(String(error), /Truncated tar archive/)
+    })
+})
@@ -0,0 +1,121 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * ValidationScheduler: the wait before a check, coalescing what is typed while one
+ * runs, and the cache of results. mpy-cross and Ruff are stubbed out, and time is
+ * a fake clock the tests move on by hand - no board, no tools VM.
+ */
+
+import { assert } from 'chai'
+import { ValidationScheduler } from '../../src/validation.js'
+import { setToolsProfiling, clearToolsProfile, summarizeToolsProfile } from '../../src/tools_profile.js'
+
+const clock = { now: 0, timers: new Map(), nextId: 1 }
+let realSetTimeout, realClearTimeout
+
+/* Moves the fake clock on by `ms`, running the timers that are due by then */
+function tick(ms) {
+    clock.now += ms
+    const due = [...clock.timers].filter(([_, t]) => t.at <= clock.now).sort((a, b) => a[1].at - b[1].at)
+    for (const [id, t] of due) {
+        clock.timers.delete(id)
+        t.fn()
+    }
+}
+
+/* Waits, in real time, until `cond()` holds: digests and stubs settle asynchronously */
+async function until(cond) {
+    while (!cond()) {
+        await new Promise((resolve) => setImmediate(resolve))
+    }
+}
+
+/* A scheduler whose checks wait for release(content), recording what they were given */
+function makeScheduler() {
+    const calls = []
+    const pending = new Map()
+    const scheduler = new ValidationScheduler({
+        delay: 100, maxDelay: 100,
+        validate: (_fn, content) => {
+            calls.push(content)
+            return new Promise((resolve) => pending.set(content, resolve))
+        },
+        lint: async () => [],
+    })
+    const release = (content) => pending.get(content)(`checked ${content}`)
+    return { scheduler, calls, release }
+}
+
+describe('Validation scheduler', function () {
+    before(function () {
+        realSetTimeout = globalThis.setTimeout
+        realClearTimeout = globalThis.clearTimeout
+        globalThis.setTimeout = (fn, ms) => {
+            const id = clock.nextId++
+            clock.timers.set(id, { at: clock.now + ms, fn })
+            return id
+        }
+        globalThis.clearTimeout = (id) => clock.timers.delete(id)
+    })
+
+    after(function () {
+        globalThis.setTimeout = realSetTimeout
+        globalThis.clearTimeout = realClearTimeout
+        setToolsProfiling(false)
+        clearToolsProfile()
+    })
+
+    it('resolves superseded checks to null and checks the latest content', async function () {
+        const { scheduler, calls, release } = makeScheduler()
+        const first = scheduler.check('doc', 'a = 1', null)
+        const second = scheduler.check('doc', 'a = 2', null)
+        assert.isNull(await first)
+        tick(100)
+        await until(() => calls.length === 1)
+        release('a = 2')
+        assert.deepEqual(await second, { backtrace: 'checked a = 2', ruff: [] })
+        assert.deepEqual(calls, ['a = 2'])
+    })
+
+    it('checks only the latest content once a running check is done', async function () {
+        const { scheduler, calls, release } = makeScheduler()
+        const running = scheduler.check('doc', 'b = 1', null)
+        tick(100)
+        await until(() => calls.length === 1)
+
+        const skipped = scheduler.check('doc', 'b = 2', null)
+        const latest = scheduler.check('doc', 'b = 3', null)
+        assert.isNull(await skipped)
+        // Its wait is over, but the first check is still running
+        tick(100)
+        await new Promise((resolve) => setImmediate(resolve))
+        assert.deepEqual(calls, ['b = 1'])
+
+        release('b = 1')
+        assert.strictEqual((await running).backtrace, 'checked b = 1')
+        await until(() => calls.length === 2)
+        release('b = 3')
+        assert.strictEqual((await latest).backtrace, 'checked b = 3')
+        assert.deepEqual(calls, ['b = 1', 'b = 3'])
+    })
+
+    it('answers content it has checked before from the cache', async function () {
+        setToolsProfiling(true)
+        clearToolsProfile()
+        const { scheduler, calls, release } = makeScheduler()
+        const first = scheduler.check('one', 'c = 1', null)
+        tick(100)
+        await until(() => calls.length === 1)
+        release('c = 1')
+        const res = await first
+
+        // Same content, even from another document
+        const again = scheduler.check('two', 'c = 1', null)
+        tick(100)
+        assert.strictEqual(await again, res)
+        assert.deepEqual(calls, ['c = 1'])
+        const [stats] = summarizeToolsProfile().filter(s => s.tool === 'validate')
+        assert.include(stats, { calls: 2, hits: 1, misses: 1 })
+    })
+})
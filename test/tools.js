@@ -0,0 +1,54 @@
+/*
+ * SPDX-FileCopyrightText: 2024 Volodymyr Shymanskyy
+ * SPDX-License-Identifier: MIT
+ *
+ * A MicroPython VM for testing the Python tools (src/tools_vfs) without a board and
+ * without a build: the tools library is copied into its /lib straight from the
+ * source tree. Its heap is the size the IDE gives its tools VM.
+ */
+
+import { readFile, readdir } from 'node:fs/promises'
+import { fileURLToPath } from 'node:url'
+import path from 'node:path'
+import { loadMicroPython } from '@micropython/micropython-webassembly-pyscript/micropython.mjs'
+
+const LIB = path.resolve(path.dirname(fileURLToPath(import.meta.url)), '../src/tools_vfs/lib')
+
+async function copyTree(vm, from, to) {
+    if (!vm.FS.analyzePath(to).exists) {
+        vm.FS.mkdir(to)
+    }
+    for (const e of await readdir(from, { withFileTypes: true })) {
+        if (e.isDirectory()) {
+            await copyTree(vm, path.join(from, e.name), `${to}/${e.name}`)
+        } else {
+            vm.FS.writeFile(`${to}/${e.name}`, await readFile(path.join(from, e.name)))
+        }
+    }
+}
+
+/* A fresh VM that can import the tools library, and whatever `modules` ({ name: source }) add */
+export async function loadToolsVM(modules = {}) {
+    const vm = await loadMicroPython({ pystack: 64 * 1024, heapsize: 32 * 1024 * 1024 })
+    await copyTree(vm, LIB, '/lib')
+    for (const [name, source] of Object.entries(modules)) {
+        vm.FS.writeFile(`/lib/${name}.py`, source)
+    }
+    vm.runPython(`
+import sys
+if '/lib' not in sys.path:
+    sys.path.append('/lib')
+`)
+    return vm
+}
+
+/* Runs `code`, which leaves its result in `_res`, and returns that result through JSON */
+export function pyResult(vm, code) {
+    vm.runPython(`${code}
+import json
+with open('/tmp/res.json', 'w') as f:
+    json.dump(_res, f)
+_res = None
+`)
+    return JSON.parse(vm.FS.readFile('/tmp/res.json', { encoding: 'utf8' }))
+}